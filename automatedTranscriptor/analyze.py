@@ -1,147 +1,261 @@
 import os
 import json
-from openai import OpenAI
-from typing import List
-from openai.types.chat import ChatCompletionMessageParam
+import re
+import asyncio
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, TYPE_CHECKING
+import metrics
+from rate_limiter import get_limiter
+from result_cache import ResultCache, make_key
+from startup_timing import timed
+from transcript import Transcript
+
+if TYPE_CHECKING:
+    from openai.types.chat import ChatCompletionMessageParam
 
 model = "gpt-4o"
+# Bump whenever the analysis prompt or tool schemas change so cached summaries are not reused
+PROMPT_VERSION = "1"
+# (transcript hash, model, prompt version) -> meeting_summary
+analysis_cache = ResultCache('analysis')
+# Transcripts longer than this many (estimated) tokens are analyzed map-reduce style in chunks of this size
+ANALYSIS_CHUNK_TOKENS = int(os.environ.get('ANALYSIS_CHUNK_TOKENS', '30000'))
+ANALYSIS_PARALLELISM = int(os.environ.get('ANALYSIS_PARALLELISM', '4'))
+ANALYSIS_CHUNK_RETRIES = int(os.environ.get('ANALYSIS_CHUNK_RETRIES', '1'))
+OUTPUT_TOKEN_ALLOWANCE = 2000
+# How the transcript is written into the prompt: 'full' (every utterance with start and end time) or 'compact'
+# (speaker turns merged, start minute only, fillers dropped) -- see Transcript.to_compact_text
+TRANSCRIPT_ENCODING = os.environ.get('TRANSCRIPT_ENCODING', 'full').lower()
+# 'combined' asks for all five sections in one request; 'progressive' sends one forced tool call per section
+# concurrently and reports sections as they arrive (see analyzer's on_progress)
+ANALYSIS_MODE = os.environ.get('ANALYSIS_MODE', 'combined').lower()
+# Progress is first reported once these (quick) sections are in, then after every further one
+EARLY_SECTIONS = ('attendees', 'action_items')
+ENCODING_LEGENDS = {
+    'full': "",
+    'compact': "Each line is one speaker turn; [Nm] is the minute it starts at and is only shown when it changes.\n",
+}
 
 openai_api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=openai_api_key)
+_client = None
+_client_lock = threading.Lock()
 
-def read_result(transcription_file):
-    with open(transcription_file, "r", encoding="utf-8") as file:
-        lines = file.readlines()
-    
-    transcript = []
-    for line in lines:
-        parts = line.strip().split("] ", 1)
-        if len(parts) == 2:
-            time_range, text = parts
-            transcript.append(f"{time_range}] {text}")
-    
-    return "\n".join(transcript)
-
-def analyze_transcript(prompt):
-    messages: List[ChatCompletionMessageParam] = [
-        {"role": "system", "content": "You are a helpful assistant that analyzes meeting transcripts."},
-        {"role": "user", "content": prompt}
-    ]
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            temperature=0.0,
-            messages=messages,
-            tools = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_attendees",
-                        "description": "Get the list of attendees from the meeting transcript",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "attendees": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "List of attendees in the meeting"
-                                }
-                            },
-                            "required": ["attendees"]
-                        }
+def get_client():
+    """Import openai and build the client on first use, then reuse it across warm invocations"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                with timed('import openai'):
+                    from openai import OpenAI
+                with timed('init OpenAI client'):
+                    # Retries are scheduled by rate_limiter so they respect the shared budgets
+                    _client = OpenAI(api_key=openai_api_key, max_retries=0)
+    return _client
+
+_async_clients = {}
+
+def get_async_client():
+    """AsyncOpenAI client for the running event loop, reused across warm invocations on the same loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _client_lock:
+            with timed('import openai'):
+                from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=openai_api_key, max_retries=0)
+            _async_clients[loop] = client
+    return client
+
+TOOLS = [
+    {
+        "type": "function",
+        "function": {
+            "name": "get_attendees",
+            "description": "Get the list of attendees from the meeting transcript",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "attendees": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of attendees in the meeting"
                     }
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_meeting_summary",
-                        "description": "Get a detailed recap of the meeting",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "meeting_summary": {
-                                    "type": "string",
-                                    "description": "Detailed recap of the meeting"
-                                }
-                            },
-                            "required": ["meeting_summary"]
-                        }
+                "required": ["attendees"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_meeting_summary",
+            "description": "Get a detailed recap of the meeting",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "meeting_summary": {
+                        "type": "string",
+                        "description": "Detailed recap of the meeting"
                     }
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_action_items",
-                        "description": "Get the list of action items from the meeting",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "action_items": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "List of action items from the meeting"
-                                }
-                            },
-                            "required": ["action_items"]
-                        }
+                "required": ["meeting_summary"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_action_items",
+            "description": "Get the list of action items from the meeting",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "action_items": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "List of action items from the meeting"
                     }
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_quote_updates",
-                        "description": "Get updates to quotes or proposals mentioned in the meeting",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "quote_updates": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "Updates to quotes or proposals mentioned in the meeting"
-                                }
-                            },
-                            "required": ["quote_updates"]
-                        }
+                "required": ["action_items"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_quote_updates",
+            "description": "Get updates to quotes or proposals mentioned in the meeting",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "quote_updates": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Updates to quotes or proposals mentioned in the meeting"
                     }
                 },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "get_pricing_and_dates",
-                        "description": "Get pricing updates or key dates mentioned in the meeting",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "pricing_and_dates": {
-                                    "type": "array",
-                                    "items": {"type": "string"},
-                                    "description": "Pricing updates or key dates mentioned in the meeting"
-                                }
-                            },
-                            "required": ["pricing_and_dates"]
-                        }
+                "required": ["quote_updates"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "get_pricing_and_dates",
+            "description": "Get pricing updates or key dates mentioned in the meeting",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "pricing_and_dates": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "Pricing updates or key dates mentioned in the meeting"
                     }
-                }
-            ],
-            tool_choice="auto"
+                },
+                "required": ["pricing_and_dates"]
+            }
+        }
+    }
+]
+
+# Tool result key -> meeting_summary title, in Slack order
+SECTIONS = {
+    "attendees": "List of attendees",
+    "meeting_summary": "Meeting Summary",
+    "action_items": "Action Items",
+    "quote_updates": "Quote/Proposal Updates",
+    "pricing_and_dates": "Pricing Updates/Key Dates",
+}
+MISSING_SECTION = "Not available"
+
+def read_result(transcription_file):
+    return Transcript.load(transcription_file).to_text()
+
+def _messages(prompt):
+    messages: List["ChatCompletionMessageParam"] = [
+        {"role": "system", "content": "You are a helpful assistant that analyzes meeting transcripts."},
+        {"role": "user", "content": prompt}
+    ]
+    return messages
+
+def _parse_tool_calls(response):
+    usage = getattr(response, 'usage', None)
+    if usage is not None:
+        metrics.add(InputTokens=usage.prompt_tokens, OutputTokens=usage.completion_tokens)
+    result = {}
+    if response.choices and response.choices[0].message.tool_calls:
+        for tool_call in response.choices[0].message.tool_calls:
+            function_args = json.loads(tool_call.function.arguments)
+            result.update(function_args)
+    return result
+
+def analyze_transcript(prompt, tools=TOOLS, tool_choice="auto"):
+    try:
+        # Budget the prompt plus an allowance for the tool-call output against the tokens-per-minute limit
+        response = get_limiter('openai').call(
+            get_client().chat.completions.create,
+            tokens=estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE,
+            model=model,
+            temperature=0.0,
+            messages=_messages(prompt),
+            tools = tools,
+            tool_choice=tool_choice
         )
-        
-        result = {}
-        if response.choices and response.choices[0].message.tool_calls:
-            for tool_call in response.choices[0].message.tool_calls:
-                function_args = json.loads(tool_call.function.arguments)
-                result.update(function_args)
-        
-        return result
+        return _parse_tool_calls(response)
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         return None 
 
-def analyzer(transcription_file):
-    full_text = read_result(transcription_file)
-    prompt = f"""
-Analyze the following meeting transcript and extract the following information:
+async def analyze_transcript_async(prompt, tools=TOOLS, tool_choice="auto"):
+    """Async counterpart of analyze_transcript using AsyncOpenAI"""
+    try:
+        response = await get_limiter('openai').call_async(
+            get_async_client().chat.completions.create,
+            tokens=estimate_tokens(prompt) + OUTPUT_TOKEN_ALLOWANCE,
+            model=model,
+            temperature=0.0,
+            messages=_messages(prompt),
+            tools=tools,
+            tool_choice=tool_choice
+        )
+        return _parse_tool_calls(response)
+    except Exception as e:
+        print(f"An error occurred: {str(e)}")
+        return None
+
+def estimate_tokens(text):
+    """Rough GPT token estimate (~4 characters per token) that needs no tokenizer download"""
+    return len(text) // 4 + 1
 
+def chunk_transcript(full_text, max_tokens):
+    """Split transcript lines into chunks of at most ~max_tokens each, never breaking an utterance"""
+    chunks = []
+    current = []
+    current_tokens = 0
+    for line in full_text.split("\n"):
+        line_tokens = estimate_tokens(line)
+        if current and current_tokens + line_tokens > max_tokens:
+            chunks.append("\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def build_prompt(full_text, part=None, encoding='full'):
+    scope = ""
+    if part is not None:
+        index, total = part
+        scope = f"\nThis is part {index} of {total} of a longer meeting. Only report what appears in this part.\n"
+    legend = ENCODING_LEGENDS.get(encoding, "")
+    return f"""
+Analyze the following meeting transcript and extract the following information:
+{scope}
 1. List of attendees
     - Identify the name of each speakers
         For example:
@@ -156,17 +270,249 @@ Analyze the following meeting transcript and extract the following information:
 
 
 Meeting transcript:
-{full_text}
+{legend}{full_text}
 """
-    
-    result = analyze_transcript(prompt)
-
-    meeting_summary = {
-        "List of attendees": "\n".join(result["attendees"]),
-        "Meeting Summary": result["meeting_summary"],
-        "Action Items": "\n".join(result["action_items"]),
-        "Quote/Proposal Updates": "\n".join(result["quote_updates"]),
-        "Pricing Updates/Key Dates": "\n".join(result["pricing_and_dates"])
+
+def _analyze_chunk(chunk, index, total, encoding='full'):
+    for attempt in range(ANALYSIS_CHUNK_RETRIES + 1):
+        result = analyze_transcript(build_prompt(chunk, (index, total), encoding))
+        if result:
+            return result
+        print(f"Analysis of chunk {index}/{total} failed (attempt {attempt + 1})")
+    return None
+
+async def _analyze_chunk_async(chunk, index, total, encoding='full'):
+    for attempt in range(ANALYSIS_CHUNK_RETRIES + 1):
+        result = await analyze_transcript_async(build_prompt(chunk, (index, total), encoding))
+        if result:
+            return result
+        print(f"Analysis of chunk {index}/{total} failed (attempt {attempt + 1})")
+    return None
+
+def _dedupe(items):
+    seen = set()
+    unique = []
+    for item in items:
+        key = " ".join(item.lower().split())
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+def _merge_attendees(attendees):
+    """One entry per speaker label, preferring a real name over 'Unknown'"""
+    by_speaker = {}
+    others = []
+    for attendee in attendees:
+        match = re.search(r"\(Speaker\s*:?\s*(\d+)\)", attendee)
+        if not match:
+            others.append(attendee)
+            continue
+        speaker = match.group(1)
+        current = by_speaker.get(speaker)
+        if current is None or (current.lower().startswith("unknown") and not attendee.lower().startswith("unknown")):
+            by_speaker[speaker] = attendee
+    return [by_speaker[k] for k in sorted(by_speaker, key=int)] + _dedupe(others)
+
+SUMMARY_TOOL = [tool for tool in TOOLS if tool["function"]["name"] == "get_meeting_summary"]
+SUMMARY_TOOL_CHOICE = {"type": "function", "function": {"name": "get_meeting_summary"}}
+
+def _merge_summaries_prompt(summaries):
+    parts = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+    return f"""
+The following are detailed recaps of consecutive parts of one meeting.
+Combine them into a single detailed recap of the whole meeting, removing repetition.
+
+{parts}
+"""
+
+def _merge_summaries(summaries):
+    """Reduce step for the free-text recap: ask the model to merge the partial recaps into one"""
+    if len(summaries) == 1:
+        return summaries[0]
+    result = analyze_transcript(_merge_summaries_prompt(summaries), tools=SUMMARY_TOOL, tool_choice=SUMMARY_TOOL_CHOICE)
+    if result and result.get("meeting_summary"):
+        return result["meeting_summary"]
+    return "\n\n".join(summaries)
+
+async def _merge_summaries_async(summaries):
+    if len(summaries) == 1:
+        return summaries[0]
+    result = await analyze_transcript_async(_merge_summaries_prompt(summaries), tools=SUMMARY_TOOL,
+                                            tool_choice=SUMMARY_TOOL_CHOICE)
+    if result and result.get("meeting_summary"):
+        return result["meeting_summary"]
+    return "\n\n".join(summaries)
+
+def _reduce_lists(results):
+    return {
+        "attendees": _merge_attendees([a for r in results for a in r.get("attendees", [])]),
+        "action_items": _dedupe([a for r in results for a in r.get("action_items", [])]),
+        "quote_updates": _dedupe([q for r in results for q in r.get("quote_updates", [])]),
+        "pricing_and_dates": _dedupe([p for r in results for p in r.get("pricing_and_dates", [])])
     }
 
+def _partial_summaries(results):
+    return [r["meeting_summary"] for r in results if r.get("meeting_summary")]
+
+def reduce_results(results):
+    """Merge per-chunk tool results into a single result with the same keys as analyze_transcript"""
+    reduced = _reduce_lists(results)
+    reduced["meeting_summary"] = _merge_summaries(_partial_summaries(results))
+    return reduced
+
+def _succeeded(results, total):
+    succeeded = [r for r in results if r]
+    if not succeeded:
+        raise RuntimeError("Analysis failed for every transcript chunk")
+    if len(succeeded) < total:
+        print(f"Analysis failed for {total - len(succeeded)} of {total} chunks; summarizing the rest")
+    return succeeded
+
+def analyze_in_chunks(full_text, chunk_tokens=None, parallelism=None, encoding='full'):
+    """Map-reduce analysis: extract from each transcript chunk in parallel, then merge the partial results"""
+    chunks = chunk_transcript(full_text, chunk_tokens or ANALYSIS_CHUNK_TOKENS)
+    total = len(chunks)
+    print(f"Analyzing transcript in {total} chunks")
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism or ANALYSIS_PARALLELISM, total))) as executor:
+        results = list(executor.map(metrics.propagate(lambda args: _analyze_chunk(*args)),
+                                    [(chunk, i, total, encoding) for i, chunk in enumerate(chunks, 1)]))
+    return reduce_results(_succeeded(results, total))
+
+async def analyze_in_chunks_async(full_text, chunk_tokens=None, parallelism=None, encoding='full'):
+    """Async counterpart of analyze_in_chunks, bounded by a semaphore instead of a thread pool"""
+    chunks = chunk_transcript(full_text, chunk_tokens or ANALYSIS_CHUNK_TOKENS)
+    total = len(chunks)
+    print(f"Analyzing transcript in {total} chunks")
+    semaphore = asyncio.Semaphore(max(1, parallelism or ANALYSIS_PARALLELISM))
+
+    async def bounded(chunk, index):
+        async with semaphore:
+            return await _analyze_chunk_async(chunk, index, total, encoding)
+
+    results = await asyncio.gather(*(bounded(chunk, i) for i, chunk in enumerate(chunks, 1)))
+    succeeded = _succeeded(results, total)
+    reduced = _reduce_lists(succeeded)
+    reduced["meeting_summary"] = await _merge_summaries_async(_partial_summaries(succeeded))
+    return reduced
+
+def _forced(tool):
+    return {"type": "function", "function": {"name": tool["function"]["name"]}}
+
+def _progress_ready(result, remaining):
+    return remaining > 0 and all(key in result for key in EARLY_SECTIONS)
+
+def analyze_progressively(full_text, on_progress=None, encoding='full'):
+    """
+    One request per section, all in flight at once, so the lists are not held back by the long free-text recap.
+    Every request carries the same prompt and tool list (only tool_choice differs) to keep the prompt prefix
+    cacheable. ``on_progress(sections)`` gets the formatted sections gathered so far once EARLY_SECTIONS are in
+    and after each later one, until the last arrives.
+    """
+    prompt = build_prompt(full_text, encoding=encoding)
+    result = {}
+    with ThreadPoolExecutor(max_workers=len(TOOLS)) as executor:
+        futures = [executor.submit(metrics.propagate(analyze_transcript), prompt, TOOLS, _forced(tool))
+                   for tool in TOOLS]
+        for remaining, future in enumerate(as_completed(futures), 1):
+            result.update(future.result() or {})
+            if on_progress and _progress_ready(result, len(futures) - remaining):
+                on_progress(_format_sections(result))
+    return result
+
+async def analyze_progressively_async(full_text, on_progress=None, encoding='full'):
+    """Async counterpart of analyze_progressively; ``on_progress`` is awaited"""
+    prompt = build_prompt(full_text, encoding=encoding)
+    result = {}
+    requests = [analyze_transcript_async(prompt, TOOLS, _forced(tool)) for tool in TOOLS]
+    for remaining, request in enumerate(asyncio.as_completed(requests), 1):
+        result.update(await request or {})
+        if on_progress and _progress_ready(result, len(requests) - remaining):
+            await on_progress(_format_sections(result))
+    return result
+
+def encode_transcript(transcript, encoding='full'):
+    """Render the transcript for the prompt, reporting the estimated prompt tokens saved by compact encoding"""
+    full_text = transcript.to_text()
+    if encoding != 'compact':
+        metrics.add(PromptTokens=estimate_tokens(full_text))
+        return full_text
+    compact_text = transcript.to_compact_text()
+    before, after = estimate_tokens(full_text), estimate_tokens(compact_text)
+    print(json.dumps({'prompt_encoding': encoding, 'utterances': len(transcript), 'tokens_before': before,
+                      'tokens_after': after, 'saved_pct': round(100 * (before - after) / before, 1)}))
+    metrics.add(PromptTokens=after, PromptTokensSaved=before - after)
+    return compact_text
+
+def _prepare(transcript, encoding='full'):
+    """Return (prompt text, cache_key, cached meeting_summary or None)"""
+    if not isinstance(transcript, Transcript):
+        transcript = Transcript.load(transcript)
+    full_text = encode_transcript(transcript, encoding)
+
+    cache_key = make_key(hashlib.sha256(full_text.encode("utf-8")).hexdigest(), model, PROMPT_VERSION,
+                         ANALYSIS_CHUNK_TOKENS)
+    cached_summary = analysis_cache.get(cache_key)
+    if cached_summary is not None:
+        print("Using cached meeting summary")
+    return full_text, cache_key, cached_summary
+
+def _format_sections(result, missing=None):
+    """meeting_summary dict for the sections in ``result``; absent ones are left out, or set to ``missing``"""
+    sections = {}
+    for key, title in SECTIONS.items():
+        value = result.get(key)
+        if value is None:
+            if missing is not None:
+                sections[title] = missing
+            continue
+        sections[title] = value if isinstance(value, str) else "\n".join(value)
+    return sections
+
+def _to_meeting_summary(result, cache_key):
+    if not result:
+        raise RuntimeError("Meeting analysis failed")
+    absent = [key for key in SECTIONS if key not in result]
+    meeting_summary = _format_sections(result, missing=MISSING_SECTION)
+    if absent:
+        # Not cached, so the next run of the same transcript tries these sections again
+        print(f"Analysis returned no {', '.join(absent)}")
+    else:
+        analysis_cache.put(cache_key, meeting_summary)
+
     return meeting_summary
+
+def analyzer(transcript, encoding=None, mode=None, on_progress=None):
+    """
+    Analyze a Transcript (or the path of a saved transcript file) and return the meeting_summary dict.
+    ``encoding`` ('full' or 'compact') overrides TRANSCRIPT_ENCODING and ``mode`` ('combined' or 'progressive')
+    ANALYSIS_MODE. In progressive mode ``on_progress`` receives partial meeting_summary dicts; chunked (long)
+    transcripts and cached summaries are returned without progress.
+    """
+    encoding = encoding or TRANSCRIPT_ENCODING
+    full_text, cache_key, cached_summary = _prepare(transcript, encoding)
+    if cached_summary is not None:
+        return cached_summary
+
+    if estimate_tokens(full_text) > ANALYSIS_CHUNK_TOKENS:
+        result = analyze_in_chunks(full_text, encoding=encoding)
+    elif (mode or ANALYSIS_MODE) == 'progressive':
+        result = analyze_progressively(full_text, on_progress, encoding)
+    else:
+        result = analyze_transcript(build_prompt(full_text, encoding=encoding))
+    return _to_meeting_summary(result, cache_key)
+
+async def analyzer_async(transcript, encoding=None, mode=None, on_progress=None):
+    """Async counterpart of analyzer; ``on_progress`` is awaited"""
+    encoding = encoding or TRANSCRIPT_ENCODING
+    full_text, cache_key, cached_summary = _prepare(transcript, encoding)
+    if cached_summary is not None:
+        return cached_summary
+
+    if estimate_tokens(full_text) > ANALYSIS_CHUNK_TOKENS:
+        result = await analyze_in_chunks_async(full_text, encoding=encoding)
+    elif (mode or ANALYSIS_MODE) == 'progressive':
+        result = await analyze_progressively_async(full_text, on_progress, encoding)
+    else:
+        result = await analyze_transcript_async(build_prompt(full_text, encoding=encoding))
+    return _to_meeting_summary(result, cache_key)
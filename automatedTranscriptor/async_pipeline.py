@@ -0,0 +1,201 @@
+import os
+import asyncio
+import metrics
+from stt_deepgram import speech_to_text_async, speech_to_text_from_url_async, prefers_local_file
+from analyze import analyzer_async
+from slack_notifier import send_slack_notification_async
+from pipeline import (AudioBatch, MAX_CONCURRENT_FILES, plan_batch, settle_batch, _is_success, _remove_audio,
+                      _find_duplicate, _summary_to_reuse, _duplicate_result, _open_job, _needs_metadata,
+                      _metadata_failed, _check_size, _resume, _saved_audio, _downloads, _finish_stage,
+                      _downloaded_bytes, _download_result, _transcript_of, _falls_back, _transcription_failed,
+                      _progressive_message, _digest_queue_for, _finishes, _notified, _queue_for_digest,
+                      _failure_result)
+from audio_compaction import compact_audio
+from slack_digest import flush_notifications
+from workspace import get_workspace_manager, disk_needed
+from scheduler import deferred_result
+from job_state import DISCOVERED
+
+# One loop per container so pooled async clients survive across warm invocations
+_loop = None
+
+def run_coroutine(coro):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+async def _reserve_disk_async(workspace, audio_file, file_size):
+    with metrics.stage('reserve_disk') as record:
+        nbytes = disk_needed(file_size, audio_file)
+        record.add(Bytes=nbytes)
+        reserved = await asyncio.to_thread(workspace.reserve, nbytes)
+        if not reserved:
+            record.status = 'unavailable'
+    return reserved
+
+async def _acquire_audio_async(job, file_handler, audio_file, workspace, file_size=None, buffered=False):
+    download = _downloads(audio_file, buffered)
+    if download and not buffered and not await _reserve_disk_async(workspace, audio_file, file_size):
+        print(f"Not enough disk space to download {audio_file}, streaming it from a temporary link instead")
+        download = False
+    if not download:
+        with metrics.stage('temporary_link') as record:
+            link = _finish_stage(record, await file_handler.get_temporary_link_async(audio_file))
+        if link:
+            await asyncio.to_thread(job.save_audio_url, link)
+            return 'url', link
+    if not workspace.reserved and not await _reserve_disk_async(workspace, audio_file, file_size):
+        print(f"Not enough disk space to download {audio_file}")
+        return None, None
+    with metrics.stage('download') as record:
+        downloaded_file = await file_handler.download_file_to_tmp_async(audio_file, directory=workspace.path)
+        _finish_stage(record, downloaded_file, Bytes=_downloaded_bytes(downloaded_file))
+    return await asyncio.to_thread(_download_result, job, downloaded_file)
+
+async def _transcribe_async(kind, source, content_hash=None):
+    with metrics.stage('transcribe', Transfer=kind) as record:
+        if kind == 'url':
+            result = await speech_to_text_from_url_async(source, audio_hash=content_hash)
+        else:
+            upload_path = await asyncio.to_thread(compact_audio, source, prefers_local_file(source))
+            record.add(Bytes=os.path.getsize(upload_path))
+            try:
+                result = await speech_to_text_async(upload_path, audio_hash=content_hash)
+            finally:
+                if upload_path != source:
+                    _remove_audio(upload_path)
+        _finish_stage(record, _is_success(result))
+    return _transcript_of(result, kind, source)
+
+async def _run_transcription_async(job, file_handler, audio_file, content_hash=None, file_size=None):
+    with get_workspace_manager().workspace(job.job_id) as workspace:
+        kind, source = await asyncio.to_thread(_saved_audio, job)
+        if kind is None:
+            kind, source = await _acquire_audio_async(job, file_handler, audio_file, workspace, file_size)
+        if kind is None:
+            return None
+
+        transcript = await _transcribe_async(kind, source, content_hash)
+        if _falls_back(transcript, kind, audio_file):
+            kind, source = await _acquire_audio_async(job, file_handler, audio_file, workspace, file_size,
+                                                      buffered=True)
+            if kind is not None:
+                transcript = await _transcribe_async(kind, source, content_hash)
+
+    if transcript is not None:
+        await asyncio.to_thread(job.save_transcript, transcript)
+    return transcript
+
+def _partial_publisher_async(message):
+    if message is None:
+        return None
+
+    async def publish(sections):
+        with metrics.stage('notify', Progress='partial'):
+            await message.publish_async(sections)
+    return publish
+
+async def _notify_async(job, meeting_summary, audio_file, content_hash=None, content_index=None, message=None):
+    digest_queue = _digest_queue_for(message)
+    if digest_queue is not None:
+        return _queue_for_digest(digest_queue, job, meeting_summary, audio_file, content_hash, content_index)
+
+    with metrics.stage('notify') as record:
+        if _finishes(message):
+            sent = await message.publish_async(meeting_summary, final=True)
+        else:
+            sent = await send_slack_notification_async(meeting_summary, audio_file, job.slack_attachments_sent(),
+                                                       on_progress=job.save_slack_attachments_sent)
+        _finish_stage(record, sent)
+    return await asyncio.to_thread(_notified, sent, job, meeting_summary, audio_file, content_hash, content_index)
+
+async def _handle_duplicate_async(record, audio_file):
+    meeting_summary = _summary_to_reuse(record)
+    sent = await send_slack_notification_async(meeting_summary, audio_file) if meeting_summary else None
+    return _duplicate_result(record, audio_file, sent)
+
+async def process_audio_file_async(file_handler, audio_file, content_hash=None, content_index=None, file_id=None,
+                                   job_store=None, file_size=None):
+    """Async counterpart of pipeline.process_audio_file; the stage decisions are the shared helpers in pipeline"""
+    print(f"Processing audio file: {audio_file}")
+
+    record = await asyncio.to_thread(_find_duplicate, content_index, content_hash, audio_file)
+    if record:
+        return await _handle_duplicate_async(record, audio_file)
+
+    job, done = await asyncio.to_thread(_open_job, job_store, audio_file, content_hash, file_id)
+    if done:
+        return done
+
+    if _needs_metadata(job, file_size):
+        with metrics.stage('metadata') as stage_record:
+            file_metadata = await file_handler.get_file_metadata_async(audio_file)
+            if file_metadata is None:
+                return _metadata_failed(stage_record, audio_file)
+        file_size = file_metadata['size']
+    skipped = _check_size(file_size, audio_file) if job.stage == DISCOVERED else None
+    if skipped:
+        return skipped
+
+    message = _progressive_message(job, audio_file)
+    meeting_summary, transcript = await asyncio.to_thread(_resume, job)
+    if meeting_summary is None:
+        if transcript is None:
+            transcript = await _run_transcription_async(job, file_handler, audio_file, content_hash, file_size)
+        if transcript is None:
+            return await asyncio.to_thread(_transcription_failed, job, audio_file)
+        print(f"Transcription of {audio_file} has {len(transcript)} utterances")
+        with metrics.stage('analyze', Utterances=len(transcript)):
+            meeting_summary = await analyzer_async(transcript, on_progress=_partial_publisher_async(message))
+        await asyncio.to_thread(job.save_summary, meeting_summary)
+
+    return await _notify_async(job, meeting_summary, audio_file, content_hash, content_index, message)
+
+async def _process_safely_async(file_handler, entry, content_index=None):
+    audio_file = entry['path_display']
+    with metrics.file_scope(audio_file, entry.get('id')), metrics.stage('file') as record:
+        try:
+            result = await process_audio_file_async(file_handler, audio_file, entry.get('content_hash'),
+                                                    content_index, entry.get('id'), file_size=entry.get('size'))
+        except Exception as e:
+            result = _failure_result(audio_file, e)
+        record.status = result['status']
+    return result
+
+async def process_audio_files_async(file_handler, entries, content_index=None, max_concurrency=MAX_CONCURRENT_FILES):
+    """
+    Start a task per entry as soon as the async listing yields it, with at most ``max_concurrency`` files in flight.
+    Results keep the listing order.
+    """
+    await asyncio.to_thread(get_workspace_manager().sweep)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def bounded(entry):
+        async with semaphore:
+            return await _process_safely_async(file_handler, entry, content_index)
+
+    tasks = []
+    async for entry in entries:
+        tasks.append(asyncio.create_task(bounded(entry)))
+    results = list(await asyncio.gather(*tasks))
+    await asyncio.to_thread(flush_notifications)
+    return results
+
+async def run_pipeline_async(pdb, file_handler, content_index, budget_seconds=None):
+    """
+    Async pipeline: drain the listing, then overlap downloads, Deepgram, OpenAI and Slack for the admitted files
+    (shortest first) on one loop. Returns (batch, results).
+    """
+    batch = AudioBatch()
+    listed = [entry async for entry in pdb.iter_new_files_async()]
+    admitted, deferred = await asyncio.to_thread(plan_batch, pdb, batch, listed, budget_seconds)
+
+    async def entries():
+        for entry in admitted:
+            yield entry
+
+    results = await process_audio_files_async(file_handler, entries(), content_index)
+    await asyncio.to_thread(settle_batch, pdb, admitted, results, deferred)
+    results += [deferred_result(entry, budget_seconds) for entry in deferred] + batch.duplicates
+    return batch, results
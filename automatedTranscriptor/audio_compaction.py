@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import shutil
+import warnings
+import subprocess
+from audio_segments import AudioSource
+from startup_timing import timed
+
+AUDIO_COMPACTION = os.environ.get('AUDIO_COMPACTION', 'false').lower() == 'true'
+# Deepgram's speech models work at 16 kHz; higher rates and extra channels only add upload bytes
+COMPACT_SAMPLE_RATE = int(os.environ.get('COMPACT_SAMPLE_RATE', '16000'))
+COMPACT_BLOCK_FRAMES = int(os.environ.get('COMPACT_BLOCK_FRAMES', '262144'))
+# Output codec when ffmpeg is available: 'flac' (lossless) or 'wav'; the stdlib/NumPy path always writes WAV
+COMPACT_CODEC = os.environ.get('COMPACT_CODEC', 'flac').lower()
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or shutil.which('ffmpeg')
+FFMPEG_TIMEOUT = int(os.environ.get('FFMPEG_TIMEOUT', '300'))
+
+COMPACTABLE_FORMATS = ('.wav', '.pcm', '.flac')
+
+def _load_numpy():
+    try:
+        with timed('import numpy'):
+            import numpy
+        return numpy
+    except ImportError:
+        return None
+
+def _load_audioop():
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            import audioop
+        return audioop
+    except ImportError:
+        return None
+
+class _NumpyConverter:
+    """Downmix + linear-interpolation resample to 16-bit mono, carrying state across blocks"""
+
+    def __init__(self, np, channels, sample_width, in_rate, out_rate):
+        self.np = np
+        self.channels = channels
+        self.sample_width = sample_width
+        self.step = in_rate / out_rate
+        self.consumed = 0
+        self.next_position = 0.0
+        self.previous = None
+
+    def _to_float_mono(self, data):
+        np = self.np
+        width = self.sample_width
+        usable = len(data) - len(data) % (width * self.channels)
+        raw = np.frombuffer(data[:usable], dtype=np.uint8)
+        if width == 1:
+            samples = (raw.astype(np.int32) - 128) << 8
+        elif width == 2:
+            samples = raw.view('<i2').astype(np.int32)
+        elif width == 3:
+            triples = raw.reshape(-1, 3).astype(np.int32)
+            samples = (triples[:, 0] | (triples[:, 1] << 8) | (triples[:, 2] << 16))
+            samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples) >> 8
+        else:
+            samples = raw.view('<i4') >> 16
+        return samples.reshape(-1, self.channels).mean(axis=1)
+
+    def convert(self, data):
+        np = self.np
+        mono = self._to_float_mono(data)
+        if self.step != 1.0 and len(mono):
+            if self.previous is not None:
+                mono = np.concatenate(([self.previous], mono))
+                first_index = self.consumed - 1
+            else:
+                first_index = self.consumed
+            last_index = first_index + len(mono) - 1
+            count = int(np.ceil((last_index - self.next_position) / self.step)) if last_index > self.next_position else 0
+            positions = self.next_position + self.step * np.arange(count)
+            self.consumed = last_index + 1
+            self.previous = mono[-1]
+            self.next_position += count * self.step
+            mono = np.interp(positions, np.arange(first_index, last_index + 1), mono)
+        return np.clip(np.rint(mono), -32768, 32767).astype('<i2').tobytes()
+
+class _AudioopConverter:
+    """Same conversion with the stdlib ``audioop`` module (mono or stereo input only)"""
+
+    def __init__(self, audioop, channels, sample_width, in_rate, out_rate):
+        self.audioop = audioop
+        self.channels = channels
+        self.sample_width = sample_width
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.state = None
+
+    def convert(self, data):
+        audioop = self.audioop
+        if self.sample_width == 1:
+            data = audioop.bias(data, 1, -128)
+        if self.sample_width != 2:
+            data = audioop.lin2lin(data, self.sample_width, 2)
+        if self.channels == 2:
+            data = audioop.tomono(data, 2, 0.5, 0.5)
+        if self.in_rate != self.out_rate:
+            data, self.state = audioop.ratecv(data, 2, 1, self.in_rate, self.out_rate, self.state)
+        return data
+
+def _converter(source, out_rate):
+    np = _load_numpy()
+    if np is not None:
+        return _NumpyConverter(np, source.channels, source.sample_width, source.sample_rate, out_rate), 'numpy'
+    audioop = _load_audioop()
+    if audioop is not None and source.channels <= 2:
+        return _AudioopConverter(audioop, source.channels, source.sample_width, source.sample_rate, out_rate), 'audioop'
+    return None, None
+
+def _compact_in_process(audio_path, output_base):
+    """WAV/PCM -> 16-bit mono WAV at COMPACT_SAMPLE_RATE, one block of frames at a time"""
+    import wave
+    source = AudioSource(audio_path)
+    out_rate = min(COMPACT_SAMPLE_RATE, source.sample_rate)
+    if source.channels == 1 and source.sample_width == 2 and out_rate == source.sample_rate:
+        return None, None
+    converter, method = _converter(source, out_rate)
+    if converter is None:
+        return None, None
+    output_path = f"{output_base}.wav"
+    with wave.open(output_path, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(out_rate)
+        for block in source.iter_blocks(COMPACT_BLOCK_FRAMES):
+            out.writeframes(converter.convert(block))
+    return output_path, method
+
+def _compact_with_ffmpeg(audio_path, output_base, codec):
+    from audio_segments import PCM_SAMPLE_RATE, PCM_CHANNELS, PCM_SAMPLE_WIDTH
+    output_path = f"{output_base}.{codec}"
+    command = [FFMPEG_PATH, '-nostdin', '-loglevel', 'error', '-y']
+    if audio_path.lower().endswith('.pcm'):
+        command += ['-f', f"s{PCM_SAMPLE_WIDTH * 8}le", '-ar', str(PCM_SAMPLE_RATE), '-ac', str(PCM_CHANNELS)]
+    command += ['-i', audio_path, '-ac', '1', '-ar', str(COMPACT_SAMPLE_RATE)]
+    command += ['-c:a', 'flac' if codec == 'flac' else 'pcm_s16le', output_path]
+    subprocess.run(command, check=True, capture_output=True, timeout=FFMPEG_TIMEOUT)
+    return output_path, f"ffmpeg-{codec}"
+
+def compact_audio(audio_path, keep_wav=False):
+    """
+    Shrink an uncompressed or FLAC recording before it is uploaded: downmix to mono and resample to
+    COMPACT_SAMPLE_RATE. Uses ffmpeg when installed, otherwise NumPy/audioop for WAV and PCM.
+    ``keep_wav`` forces WAV output (segmented transcription needs it).
+
+    Returns the path to upload: the compacted file, or ``audio_path`` itself when compaction is disabled,
+    unsupported or doesn't make the file smaller. Logs an ``audio_compaction`` JSON line with the outcome.
+    """
+    if not AUDIO_COMPACTION or not audio_path.lower().endswith(COMPACTABLE_FORMATS):
+        return audio_path
+
+    started = time.perf_counter()
+    output_base = f"{os.path.splitext(audio_path)[0]}.compact"
+    output_path, method = None, None
+    try:
+        if FFMPEG_PATH:
+            output_path, method = _compact_with_ffmpeg(audio_path, output_base, 'wav' if keep_wav else COMPACT_CODEC)
+        elif not audio_path.lower().endswith('.flac'):
+            output_path, method = _compact_in_process(audio_path, output_base)
+    except Exception as e:
+        print(f"Audio compaction failed for {audio_path}: {str(e)}")
+        output_path = None
+
+    bytes_in = os.path.getsize(audio_path)
+    bytes_out = os.path.getsize(output_path) if output_path and os.path.exists(output_path) else bytes_in
+    if output_path and bytes_out >= bytes_in:
+        os.remove(output_path)
+        output_path, bytes_out = None, bytes_in
+
+    print(json.dumps({'audio_compaction': {
+        'format': os.path.splitext(audio_path)[1].lower(),
+        'method': method if output_path else 'none',
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+        'bytes_saved': bytes_in - bytes_out,
+        'seconds': round(time.perf_counter() - started, 3)
+    }}))
+    return output_path or audio_path
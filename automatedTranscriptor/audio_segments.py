@@ -0,0 +1,97 @@
+import io
+import os
+import wave
+
+# Raw .pcm has no header; these describe it (and are written into each segment's WAV header)
+PCM_SAMPLE_RATE = int(os.environ.get('PCM_SAMPLE_RATE', '16000'))
+PCM_CHANNELS = int(os.environ.get('PCM_CHANNELS', '1'))
+PCM_SAMPLE_WIDTH = int(os.environ.get('PCM_SAMPLE_WIDTH', '2'))
+
+SEGMENTABLE_FORMATS = ('.wav', '.pcm')
+
+def is_segmentable(path):
+    return path.lower().endswith(SEGMENTABLE_FORMATS)
+
+class AudioSource:
+    """
+    Frame-addressable view of an uncompressed recording (WAV or headerless PCM).
+    Segments are read straight from disk by frame offset, so only the requested window is held in memory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path.lower().endswith('.wav'):
+            with wave.open(path, 'rb') as wav:
+                self.channels = wav.getnchannels()
+                self.sample_width = wav.getsampwidth()
+                self.sample_rate = wav.getframerate()
+                self.frames = wav.getnframes()
+            self._raw = False
+        else:
+            self.channels = PCM_CHANNELS
+            self.sample_width = PCM_SAMPLE_WIDTH
+            self.sample_rate = PCM_SAMPLE_RATE
+            self.frames = os.path.getsize(path) // (self.channels * self.sample_width)
+            self._raw = True
+
+    @property
+    def duration(self):
+        return self.frames / float(self.sample_rate)
+
+    def read_frames(self, start_frame, frame_count):
+        if self._raw:
+            frame_size = self.channels * self.sample_width
+            with open(self.path, 'rb') as f:
+                f.seek(start_frame * frame_size)
+                return f.read(frame_count * frame_size)
+        with wave.open(self.path, 'rb') as wav:
+            wav.setpos(start_frame)
+            return wav.readframes(frame_count)
+
+    def iter_blocks(self, block_frames):
+        """Yield the whole recording as raw frame blocks of at most ``block_frames`` frames"""
+        if self._raw:
+            block_bytes = block_frames * self.channels * self.sample_width
+            with open(self.path, 'rb') as f:
+                while True:
+                    data = f.read(block_bytes)
+                    if not data:
+                        return
+                    yield data
+        with wave.open(self.path, 'rb') as wav:
+            while True:
+                data = wav.readframes(block_frames)
+                if not data:
+                    return
+                yield data
+
+    def segment_wav(self, start, end):
+        """Return the [start, end) seconds window as a self-contained WAV file in memory"""
+        start_frame = int(start * self.sample_rate)
+        end_frame = min(self.frames, int(end * self.sample_rate))
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as out:
+            out.setnchannels(self.channels)
+            out.setsampwidth(self.sample_width)
+            out.setframerate(self.sample_rate)
+            out.writeframes(self.read_frames(start_frame, end_frame - start_frame))
+        return buffer.getvalue()
+
+def plan_segments(duration, segment_seconds, overlap_seconds):
+    """
+    Split ``duration`` into windows of ``segment_seconds`` where each window starts ``overlap_seconds`` before the
+    previous one ends. Returns a list of (start, end) in seconds.
+    """
+    if duration <= segment_seconds:
+        return [(0.0, duration)]
+    step = segment_seconds - overlap_seconds
+    if step <= 0:
+        raise ValueError("segment length must be larger than the overlap")
+    segments = []
+    start = 0.0
+    while True:
+        end = min(duration, start + segment_seconds)
+        segments.append((start, end))
+        if end >= duration:
+            return segments
+        start += step
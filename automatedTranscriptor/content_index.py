@@ -0,0 +1,106 @@
+import os
+import json
+import threading
+from datetime import datetime
+from botocore.exceptions import ClientError
+from dynamodb_tables import get_dynamodb, get_table
+
+CONTENT_INDEX_BACKEND = os.environ.get('CONTENT_INDEX_BACKEND', 'dynamodb').lower()
+CONTENT_INDEX_PATH = os.environ.get('CONTENT_INDEX_PATH', '/tmp/processed_content.json')
+
+class DynamoDBContentIndex:
+    """Processed-content index keyed by Dropbox content_hash, stored in DynamoDB."""
+    TABLE_NAME = 'ProcessedContent'
+
+    def __init__(self):
+        self.dynamodb = get_dynamodb()
+        self.table = self.ensure_table_exists()
+
+    def ensure_table_exists(self):
+        return get_table(self.TABLE_NAME, self.create_table)
+
+    def create_table(self):
+        table = self.dynamodb.create_table(
+            TableName=self.TABLE_NAME,
+            KeySchema=[
+                {
+                    'AttributeName': 'content_hash',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'content_hash',
+                    'AttributeType': 'S'
+                }
+            ],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        )
+        table.wait_until_exists()
+        return table
+
+    def get(self, content_hash):
+        try:
+            response = self.table.get_item(Key={'content_hash': content_hash})
+            item = response.get('Item')
+            if item and 'meeting_summary' in item:
+                item['meeting_summary'] = json.loads(item['meeting_summary'])
+            return item
+        except ClientError as e:
+            print(f"Error reading content index for {content_hash}: {str(e)}")
+            return None
+
+    def put(self, content_hash, file_path, meeting_summary):
+        try:
+            self.table.put_item(Item={
+                'content_hash': content_hash,
+                'file_path': file_path,
+                'meeting_summary': json.dumps(meeting_summary),
+                'processed_at': datetime.now().isoformat()
+            })
+        except ClientError as e:
+            print(f"Error writing content index for {content_hash}: {str(e)}")
+
+class LocalContentIndex:
+    """JSON-file stand-in for DynamoDBContentIndex, for local runs and tests."""
+
+    def __init__(self, path=CONTENT_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, content_hash):
+        with self._lock:
+            return self._load().get(content_hash)
+
+    def put(self, content_hash, file_path, meeting_summary):
+        with self._lock:
+            records = self._load()
+            records[content_hash] = {
+                'content_hash': content_hash,
+                'file_path': file_path,
+                'meeting_summary': meeting_summary,
+                'processed_at': datetime.now().isoformat()
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.path)
+
+_content_index = None
+
+def get_content_index():
+    """One index per container, reused across warm invocations"""
+    global _content_index
+    if _content_index is None:
+        _content_index = LocalContentIndex() if CONTENT_INDEX_BACKEND == 'local' else DynamoDBContentIndex()
+    return _content_index
@@ -1,47 +1,192 @@
 import os
 import json
-import requests
+import aiofiles
+import httpx
+from http_transport import (get_http_client, get_async_http_client, post_with_retry, post_with_retry_async,
+                            DROPBOX_API_URL, DROPBOX_CONTENT_URL)
+from rate_limiter import get_limiter
+
+DOWNLOAD_CHUNK_SIZE = int(os.environ.get('DOWNLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+DOWNLOAD_MAX_RESUMES = int(os.environ.get('DOWNLOAD_MAX_RESUMES', '5'))
+
+class _DownloadProgress:
+    """Resume bookkeeping shared by the sync and async download loops, which only differ in how they do I/O"""
+
+    def __init__(self, file_path, progress_callback=None, max_resumes=DOWNLOAD_MAX_RESUMES):
+        self.file_path = file_path
+        self.progress_callback = progress_callback
+        self.max_resumes = max_resumes
+        self.written = 0
+        self.total = None
+        self.resumes = 0
+
+    def opened(self, response):
+        """Returns True if what was written so far must be discarded because the server ignored the Range header"""
+        restart = bool(self.written) and response.status_code != 206
+        if restart:
+            self.written = 0
+        if self.total is None:
+            self.total = DropboxFileHandler._result_size(response)
+        return restart
+
+    def wrote(self, chunk):
+        self.written += len(chunk)
+        if self.progress_callback:
+            self.progress_callback(self.written, self.total)
+
+    def check_complete(self):
+        if self.total is not None and self.written < self.total:
+            raise httpx.RemoteProtocolError(f"Connection closed after {self.written} of {self.total} bytes")
+
+    def can_resume(self, e):
+        """Count an interruption; False once ``max_resumes`` have been used"""
+        self.resumes += 1
+        if self.resumes > self.max_resumes:
+            return False
+        print(f"Download of {self.file_path} interrupted at {self.written} bytes, "
+              f"resuming ({self.resumes}/{self.max_resumes}): {str(e)}")
+        return True
 
 class DropboxFileHandler:
     def __init__(self, access_token):
         self.access_token = access_token
 
-    def download_file_to_tmp(self, file_path):
+    def download_file_to_tmp(self, file_path, chunk_size=DOWNLOAD_CHUNK_SIZE, progress_callback=None,
+                             max_resumes=DOWNLOAD_MAX_RESUMES, directory='/tmp'):
+        """
+        Stream a Dropbox file into ``directory`` in ``chunk_size`` blocks so memory use stays flat regardless of
+        file size. If the connection drops mid-transfer the download resumes from the last written byte with an
+        HTTP Range request, up to ``max_resumes`` times. ``progress_callback(bytes_written, total_bytes)`` is called
+        after every chunk; ``total_bytes`` is None when Dropbox does not report the size.
+        """
         try:
-            url = "https://content.dropboxapi.com/2/files/download"
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "Dropbox-API-Arg": json.dumps({"path": file_path})
-            }
-            response = requests.post(url, headers=headers)
-            response.raise_for_status()
+            tmp_file_path = os.path.join(directory, os.path.basename(file_path))
+            progress = _DownloadProgress(file_path, progress_callback, max_resumes)
+            with open(tmp_file_path, "wb") as f:
+                while True:
+                    try:
+                        with self._open_download_stream(file_path, progress.written) as response:
+                            if progress.opened(response):
+                                f.seek(0)
+                                f.truncate()
+                            for chunk in response.iter_bytes(chunk_size=chunk_size):
+                                if chunk:
+                                    f.write(chunk)
+                                    progress.wrote(chunk)
+                        progress.check_complete()
+                        break
+                    except httpx.TransportError as e:
+                        if not progress.can_resume(e):
+                            raise
 
-            file_name = os.path.basename(file_path)
+            print(f"File downloaded: {tmp_file_path} ({progress.written} bytes)")
+            return tmp_file_path
+        except Exception as e:
+            print(f"Error downloading file {file_path}: {str(e)}")
+            return None
 
-            tmp_file_path = f"/tmp/{file_name}"
-            with open(tmp_file_path, "wb") as f:
-                f.write(response.content)
-            
-            print(f"File downloaded: {tmp_file_path}")
+    async def download_file_to_tmp_async(self, file_path, chunk_size=DOWNLOAD_CHUNK_SIZE, progress_callback=None,
+                                         max_resumes=DOWNLOAD_MAX_RESUMES, directory='/tmp'):
+        """Async counterpart of download_file_to_tmp, writing chunks with aiofiles"""
+        try:
+            tmp_file_path = os.path.join(directory, os.path.basename(file_path))
+            progress = _DownloadProgress(file_path, progress_callback, max_resumes)
+            async with aiofiles.open(tmp_file_path, "wb") as f:
+                while True:
+                    try:
+                        async with self._open_download_stream_async(file_path, progress.written) as response:
+                            if progress.opened(response):
+                                await f.seek(0)
+                                await f.truncate()
+                            async for chunk in response.aiter_bytes(chunk_size=chunk_size):
+                                if chunk:
+                                    await f.write(chunk)
+                                    progress.wrote(chunk)
+                        progress.check_complete()
+                        break
+                    except httpx.TransportError as e:
+                        if not progress.can_resume(e):
+                            raise
+
+            print(f"File downloaded: {tmp_file_path} ({progress.written} bytes)")
             return tmp_file_path
         except Exception as e:
             print(f"Error downloading file {file_path}: {str(e)}")
             return None
 
+    def _download_request(self, file_path, offset=0):
+        url = f"{DROPBOX_CONTENT_URL}/2/files/download"
+        headers = {
+            "Authorization": f"Bearer {self.access_token}",
+            "Dropbox-API-Arg": json.dumps({"path": file_path})
+        }
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        return url, headers
+
+    def _open_download_stream(self, file_path, offset=0):
+        """The download response, opened within the Dropbox budgets; throttling and 5xx are retried before streaming"""
+        url, headers = self._download_request(file_path, offset)
+        return get_limiter('dropbox').stream(lambda: get_http_client().stream("POST", url, headers=headers))
+
+    def _open_download_stream_async(self, file_path, offset=0):
+        url, headers = self._download_request(file_path, offset)
+        return get_limiter('dropbox').stream_async(lambda: get_async_http_client().stream("POST", url, headers=headers))
+
+    @staticmethod
+    def _result_size(response):
+        try:
+            return json.loads(response.headers.get("Dropbox-API-Result", "{}")).get("size")
+        except ValueError:
+            return None
+
+    def _json_headers(self):
+        return {
+            "Authorization": f"Bearer {self.access_token}",
+            "Content-Type": "application/json"
+        }
+
+    def get_temporary_link(self, file_path):
+        """Return a short-lived (4 hour) direct download URL for the file, or None on failure"""
+        try:
+            url = f"{DROPBOX_API_URL}/2/files/get_temporary_link"
+            response = post_with_retry('dropbox', url, headers=self._json_headers(), json={"path": file_path})
+            return response.json()["link"]
+        except Exception as e:
+            print(f"Error getting temporary link for file {file_path}: {str(e)}")
+            return None
+
+    async def get_temporary_link_async(self, file_path):
+        try:
+            url = f"{DROPBOX_API_URL}/2/files/get_temporary_link"
+            response = await post_with_retry_async('dropbox', url, headers=self._json_headers(), json={"path": file_path})
+            return response.json()["link"]
+        except Exception as e:
+            print(f"Error getting temporary link for file {file_path}: {str(e)}")
+            return None
+
     def get_file_metadata(self, file_path):
         try:
-            url = "https://api.dropboxapi.com/2/files/get_metadata"
-            headers = {
-                "Authorization": f"Bearer {self.access_token}",
-                "Content-Type": "application/json"
+            url = f"{DROPBOX_API_URL}/2/files/get_metadata"
+            data = {
+                "path": file_path,
+                "include_media_info": True
             }
+            response = post_with_retry('dropbox', url, headers=self._json_headers(), json=data)
+            return response.json()
+        except Exception as e:
+            print(f"Error getting metadata for file {file_path}: {str(e)}")
+            return None
+
+    async def get_file_metadata_async(self, file_path):
+        try:
+            url = f"{DROPBOX_API_URL}/2/files/get_metadata"
             data = {
                 "path": file_path,
                 "include_media_info": True
             }
-            response = requests.post(url, headers=headers, json=data)
-            response.raise_for_status()
+            response = await post_with_retry_async('dropbox', url, headers=self._json_headers(), json=data)
             return response.json()
         except Exception as e:
             print(f"Error getting metadata for file {file_path}: {str(e)}")
-            return None
\ No newline at end of file
+            return None
@@ -1,9 +1,23 @@
+import os
 import json
-import requests
-import boto3
+import time
+import queue
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from botocore.exceptions import ClientError
+import metrics
+from dynamodb_tables import get_dynamodb, get_table
+from http_transport import post_with_retry, post_with_retry_async, debug_log, DROPBOX_API_URL
 from token_manager import DropboxTokenManager
 
+MAX_LISTING_WORKERS = int(os.environ.get('MAX_LISTING_WORKERS', '4'))
+# Only the invocation holding a folder's drain lease lists it and advances its cursor
+CURSOR_LEASES = os.environ.get('CURSOR_LEASES', 'true').lower() == 'true'
+DRAIN_LEASE_SECONDS = int(os.environ.get('DRAIN_LEASE_SECONDS', '900'))
+# Marks a folder whose lease was taken over; its cursor is no longer saved by this invocation
+_LOST = object()
+
 class DropboxUpdateNotificationAPI:
     def __init__(self):
         self.error = False
@@ -12,20 +26,16 @@ class DropboxUpdateNotificationAPI:
         self.token_manager = DropboxTokenManager()
         self.access_token = self.token_manager.get_access_token()
         self.folders = ['/automated_transcriptor']
-        self.dynamodb = boto3.resource('dynamodb')
+        # folder -> cursor_version while leased (None when saved unconditionally); None before acquire_leases
+        self.leases = None
+        self.lease_owner = None
+        self._cursors = {}
+        self.dynamodb = get_dynamodb()
         self.table_name = 'DropboxCursors'
         self.table = self.ensure_table_exists()
 
     def ensure_table_exists(self):
-        try:
-            table = self.dynamodb.Table(self.table_name)
-            table.load()
-            return table
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                return self.create_table()
-            else:
-                raise
+        return get_table(self.table_name, self.create_table)
 
     def create_table(self):
         table = self.dynamodb.create_table(
@@ -51,10 +61,18 @@ class DropboxUpdateNotificationAPI:
         return table
 
     def request_dropbox_api_v2(self, url, argv=None, post=None, upload=None):
+        ok, responses, errmsg = self._call_dropbox_api(url, argv=argv, post=post, upload=upload)
+        if ok:
+            self.responses = responses
+        else:
+            self.error = True
+            self.errmsg = errmsg
+        return ok
+
+    def _build_request(self, argv=None, post=None, upload=None):
         headers = {
             'Authorization': f'Bearer {self.access_token}'
         }
-        print(f"Request headers: {headers}")
 
         if argv is not None:
             headers['Dropbox-API-Arg'] = json.dumps(argv)
@@ -67,66 +85,298 @@ class DropboxUpdateNotificationAPI:
             data = json.dumps(post)
         else:
             data = None
+        return headers, data
 
-        print(f"Request data: {data}")
+    def _call_dropbox_api(self, url, argv=None, post=None, upload=None):
+        """Thread-safe variant of request_dropbox_api_v2 that returns (ok, responses, errmsg) instead of storing them on self"""
+        headers, data = self._build_request(argv, post, upload)
+        debug_log(f"Request to {url}", data)
 
         try:
-            response = requests.post(url, headers=headers, data=data, timeout=5)
-            print(f"Response status code: {response.status_code}")
-            print(f"Response content: {response.text}")
-            response.raise_for_status()
-            self.responses = response.json() if post or upload else response.text
-            return True
-        except requests.exceptions.RequestException as e:
+            response = post_with_retry('dropbox', url, headers=headers, content=data, timeout=5)
+            debug_log(f"Response {response.status_code} from {url}", response.text)
+            return True, (response.json() if post or upload else response.text), ''
+        except httpx.HTTPError as e:
+            print(f"Request exception: {str(e)}")
+            return False, None, str(e)
+
+    async def _call_dropbox_api_async(self, url, argv=None, post=None, upload=None):
+        headers, data = self._build_request(argv, post, upload)
+        debug_log(f"Request to {url}", data)
+
+        try:
+            response = await post_with_retry_async('dropbox', url, headers=headers, content=data, timeout=5)
+            debug_log(f"Response {response.status_code} from {url}", response.text)
+            return True, (response.json() if post or upload else response.text), ''
+        except httpx.HTTPError as e:
+            print(f"Request exception: {str(e)}")
+            return False, None, str(e)
+
+    @staticmethod
+    def _list_folder_request(folder, cursor):
+        if cursor:
+            return f'{DROPBOX_API_URL}/2/files/list_folder/continue', {'cursor': cursor}
+        return f'{DROPBOX_API_URL}/2/files/list_folder', {
+            'path': folder,
+            'recursive': True,
+            'include_media_info': True,
+            'include_deleted': False,
+            'include_has_explicit_shared_members': False
+        }
+
+    @staticmethod
+    def _record_page(record, ok, responses):
+        if not ok:
+            record.status = 'failed'
+        elif isinstance(responses, dict):
+            record.add(Entries=len(responses.get('entries', [])))
+
+    def _handle_page(self, folder, ok, responses, errmsg, page_put):
+        """Queue one listing page; returns the cursor to continue from, or None when the folder is drained"""
+        if not ok:
+            print(f"API request failed for {folder}")
+            print(f"Error: {errmsg}")
             self.error = True
-            self.errmsg = str(e)
-            print(f"Request exception: {self.errmsg}")
-            return False
+            self.errmsg = errmsg
+            return None
+        if not isinstance(responses, dict):
+            print(f"No response received for {folder}")
+            return None
 
-    def get_new_files(self):
-        new_files = []
-        for folder in self.folders:
-            print(f"Processing folder: {folder}")
+        entries = [entry for entry in responses.get('entries', []) if entry['.tag'] == 'file']
+        page_put((folder, entries, responses.get('cursor')))
+
+        if not responses.get('has_more'):
+            return None
+        return responses.get('cursor')
+
+    def _list_folder_pages(self, folder, page_queue):
+        """Drain every list_folder page for one folder into page_queue, ending with a None sentinel"""
+        try:
             cursor = self.get_cursor(folder)
             print(f"Cursor for {folder}: {cursor}")
+            while True:
+                url, post = self._list_folder_request(folder, cursor)
+                with metrics.stage('list_folder', Folder=folder) as record:
+                    ok, responses, errmsg = self._call_dropbox_api(url, post=post)
+                    self._record_page(record, ok, responses)
+                cursor = self._handle_page(folder, ok, responses, errmsg, page_queue.put)
+                if not cursor:
+                    break
+        except Exception as e:
+            print(f"Error listing folder {folder}: {str(e)}")
+        finally:
+            page_queue.put(None)
 
-            if cursor:
-                url = 'https://api.dropboxapi.com/2/files/list_folder/continue'
-                post = {'cursor': cursor}
-            else:
-                url = 'https://api.dropboxapi.com/2/files/list_folder'
-                post = {
-                    'path': folder,
-                    'recursive': True,
-                    'include_media_info': False,
-                    'include_deleted': False,
-                    'include_has_explicit_shared_members': False
-                }
+    async def _list_folder_pages_async(self, folder, page_queue):
+        try:
+            cursor = await asyncio.to_thread(self.get_cursor, folder)
+            print(f"Cursor for {folder}: {cursor}")
+            while True:
+                url, post = self._list_folder_request(folder, cursor)
+                with metrics.stage('list_folder', Folder=folder) as record:
+                    ok, responses, errmsg = await self._call_dropbox_api_async(url, post=post)
+                    self._record_page(record, ok, responses)
+                cursor = self._handle_page(folder, ok, responses, errmsg, page_queue.put_nowait)
+                if not cursor:
+                    break
+        except Exception as e:
+            print(f"Error listing folder {folder}: {str(e)}")
+        finally:
+            page_queue.put_nowait(None)
 
-            if not self.request_dropbox_api_v2(url, post=post):
-                print(f"API request failed for {folder}")
-                print(f"Error: {self.errmsg}")
-                continue
+    def iter_new_files(self, before_commit=None):
+        """
+        Yield new file entries (list_folder metadata dicts) as pages arrive, listing all folders concurrently.
+        A page's cursor is saved only once the consumer has taken every entry on that page. Consumers that buffer
+        entries can pass ``before_commit`` to flush them just before each cursor is saved.
+        """
+        folders = self.drain_folders()
+        page_queue = queue.Queue()
+        workers = max(1, min(len(folders), MAX_LISTING_WORKERS))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        for folder in folders:
+            print(f"Processing folder: {folder}")
+            executor.submit(self._list_folder_pages, folder, page_queue)
+
+        total = 0
+        remaining = len(folders)
+        try:
+            while remaining:
+                page = page_queue.get()
+                if page is None:
+                    remaining -= 1
+                    continue
 
-            print(f"API response: {self.responses}")
+                folder, entries, cursor = page
+                for entry in entries:
+                    print(f"New file detected: {entry['path_display']}")
+                    total += 1
+                    yield entry
 
-            if self.responses is not None:
-                if isinstance(self.responses, dict) and 'entries' in self.responses:
-                    for entry in self.responses['entries']:
-                        if entry['.tag'] == 'file':
-                            new_files.append(entry['path_display'])
-                            print(f"New file detected: {entry['path_display']}")
+                if cursor:
+                    if before_commit:
+                        before_commit()
+                    self.save_cursor(folder, cursor)
+                    print(f"New cursor saved for {folder}: {cursor}")
+        finally:
+            executor.shutdown(wait=False)
 
-                if isinstance(self.responses, dict) and self.responses.get('cursor'):
-                    self.save_cursor(folder, self.responses['cursor'])
-                    print(f"New cursor saved for {folder}: {self.responses['cursor']}")
+        print(f"Total new files detected: {total}")
+
+    async def iter_new_files_async(self):
+        """Async counterpart of iter_new_files: folders are listed as concurrent tasks on the running loop"""
+        folders = self.drain_folders()
+        page_queue = asyncio.Queue()
+        tasks = []
+        for folder in folders:
+            print(f"Processing folder: {folder}")
+            tasks.append(asyncio.create_task(self._list_folder_pages_async(folder, page_queue)))
+
+        total = 0
+        remaining = len(folders)
+        try:
+            while remaining:
+                page = await page_queue.get()
+                if page is None:
+                    remaining -= 1
+                    continue
+
+                folder, entries, cursor = page
+                for entry in entries:
+                    print(f"New file detected: {entry['path_display']}")
+                    total += 1
+                    yield entry
+
+                if cursor:
+                    await asyncio.to_thread(self.save_cursor, folder, cursor)
+                    print(f"New cursor saved for {folder}: {cursor}")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        print(f"Total new files detected: {total}")
+
+    def get_new_files(self):
+        return [entry['path_display'] for entry in self.iter_new_files()]
+
+    def drain_folders(self):
+        """Folders this invocation lists: every folder until acquire_leases is called, then the leased ones"""
+        if self.leases is None:
+            return list(self.folders)
+        return [folder for folder, version in self.leases.items() if version is not _LOST]
+
+    def acquire_leases(self, owner, seconds=DRAIN_LEASE_SECONDS):
+        """
+        Take the drain lease on every folder nobody else is draining and return the folders leased. A webhook for a
+        folder that is already being drained is coalesced: the folder is flagged so the holder lists it again before
+        letting go, and this invocation leaves it alone.
+        """
+        self.lease_owner = owner
+        self.leases = {}
+        self._cursors = {}
+        for folder in self.folders:
+            if not CURSOR_LEASES:
+                self.leases[folder] = None
+                continue
+            leased, version = self._acquire_lease(folder, seconds)
+            if leased:
+                self.leases[folder] = version
             else:
-                print(f"No response received for {folder}")
+                print(f"{folder} is being drained by another invocation; coalesced into it")
+        return list(self.leases)
+
+    def _acquire_lease(self, folder, seconds):
+        """Returns (True, cursor_version) when leased and (False, None) when another invocation holds the folder"""
+        for _ in range(3):
+            now = time.time()
+            try:
+                item = self.table.update_item(
+                    Key={'folder_path': folder},
+                    UpdateExpression='SET drain_owner = :owner, drain_lease_until = :until, drain_pending = :false, '
+                                     'cursor_version = if_not_exists(cursor_version, :zero)',
+                    ConditionExpression='attribute_not_exists(drain_lease_until) OR drain_lease_until < :now',
+                    ExpressionAttributeValues={':owner': self.lease_owner, ':until': int(now + seconds),
+                                               ':now': int(now), ':false': False, ':zero': 0},
+                    ReturnValues='ALL_NEW'
+                )['Attributes']
+                self._cursors[folder] = item.get('cursor')
+                return True, int(item['cursor_version'])
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    # Fail open: a duplicate drain costs money, a skipped one loses changes
+                    print(f"Error acquiring drain lease for {folder}: {str(e)}")
+                    return True, None
+            if self._flag_pending(folder):
+                return False, None
+            # The holder let go between the two writes; try to take the lease again
+        print(f"Could not acquire or flag the drain lease for {folder}")
+        return False, None
+
+    def _flag_pending(self, folder):
+        """Ask the current holder for another pass; False if nobody holds the lease any more"""
+        try:
+            self.table.update_item(
+                Key={'folder_path': folder},
+                UpdateExpression='SET drain_pending = :true',
+                ConditionExpression='drain_lease_until >= :now',
+                ExpressionAttributeValues={':true': True, ':now': int(time.time())}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            print(f"Error flagging pending webhook for {folder}: {str(e)}")
+            return True
+
+    def release_leases(self, force=False):
+        """
+        Release the drain leases and return the folders that were flagged by webhooks during the drain; those stay
+        leased (with the flag cleared) so the caller can drain them again. ``force`` releases regardless of flags.
+        """
+        again = []
+        for folder, version in list((self.leases or {}).items()):
+            if version is None or version is _LOST:
+                del self.leases[folder]
+                continue
+            condition = 'drain_owner = :owner' if force else 'drain_owner = :owner AND drain_pending = :false'
+            values = {':owner': self.lease_owner} if force else {':owner': self.lease_owner, ':false': False}
+            try:
+                self.table.update_item(
+                    Key={'folder_path': folder},
+                    UpdateExpression='REMOVE drain_owner, drain_lease_until',
+                    ConditionExpression=condition,
+                    ExpressionAttributeValues=values
+                )
+                del self.leases[folder]
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    print(f"Error releasing drain lease for {folder}: {str(e)}")
+                    del self.leases[folder]
+                elif not force and self._clear_pending(folder):
+                    again.append(folder)
+                else:
+                    print(f"Drain lease for {folder} was taken over by another invocation")
+                    del self.leases[folder]
+        return again
 
-        print(f"Total new files detected: {len(new_files)}")
-        return new_files
+    def _clear_pending(self, folder):
+        try:
+            self.table.update_item(
+                Key={'folder_path': folder},
+                UpdateExpression='SET drain_pending = :false',
+                ConditionExpression='drain_owner = :owner',
+                ExpressionAttributeValues={':false': False, ':owner': self.lease_owner}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                print(f"Error clearing pending webhook flag for {folder}: {str(e)}")
+            return False
 
     def get_cursor(self, folder):
+        if folder in self._cursors:
+            return self._cursors[folder]
         try:
             response = self.table.get_item(Key={'folder_path': folder})
             return response.get('Item', {}).get('cursor')
@@ -135,7 +385,91 @@ class DropboxUpdateNotificationAPI:
             return None
 
     def save_cursor(self, folder, cursor):
+        """
+        Advance a folder's cursor. While leased the write only succeeds if this invocation still owns the lease and
+        the cursor has not moved since it was read; otherwise the lease is treated as lost.
+        """
+        version = (self.leases or {}).get(folder)
+        if version is _LOST:
+            print(f"Not saving cursor for {folder}: drain lease lost")
+            return
         try:
-            self.table.put_item(Item={'folder_path': folder, 'cursor': cursor})
+            if version is None:
+                self.table.update_item(
+                    Key={'folder_path': folder},
+                    UpdateExpression='SET #cursor = :cursor',
+                    ExpressionAttributeNames={'#cursor': 'cursor'},
+                    ExpressionAttributeValues={':cursor': cursor}
+                )
+            else:
+                self.table.update_item(
+                    Key={'folder_path': folder},
+                    UpdateExpression='SET #cursor = :cursor, cursor_version = :next',
+                    ConditionExpression='drain_owner = :owner AND cursor_version = :version',
+                    ExpressionAttributeNames={'#cursor': 'cursor'},
+                    ExpressionAttributeValues={':cursor': cursor, ':next': version + 1, ':owner': self.lease_owner,
+                                               ':version': version}
+                )
+                self.leases[folder] = version + 1
+            self._cursors[folder] = cursor
         except ClientError as e:
-            print(f"Error saving cursor for {folder}: {str(e)}")
\ No newline at end of file
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                print(f"Drain lease for {folder} was lost; cursor not saved")
+                self.leases[folder] = _LOST
+            else:
+                print(f"Error saving cursor for {folder}: {str(e)}")
+
+    @staticmethod
+    def _folder_of(entry, folders):
+        path = entry['path_display'].lower()
+        for folder in folders:
+            if path.startswith(folder.lower().rstrip('/') + '/'):
+                return folder
+        return folders[0] if folders else None
+
+    def drains(self, entry):
+        """
+        Whether ``entry`` belongs to a folder this invocation still drains. Entries of a folder whose lease was lost
+        are left alone: its cursor was not saved, so the new lease holder lists them again.
+        """
+        return self._folder_of(entry, self.folders) in self.drain_folders()
+
+    def load_deferred(self):
+        """Entries deferred by an earlier invocation for the folders being drained (their cursors are committed)"""
+        entries = []
+        for folder in self.drain_folders():
+            try:
+                response = self.table.get_item(Key={'folder_path': folder}, ConsistentRead=True)
+                entries.extend(json.loads(response.get('Item', {}).get('deferred', '[]')))
+            except ClientError as e:
+                print(f"Error loading deferred files for {folder}: {str(e)}")
+        return entries
+
+    def save_deferred(self, entries):
+        """
+        Replace each drained folder's deferred list (an empty list clears it). Folders whose lease was lost are
+        skipped, and so are their entries.
+        """
+        by_folder = {folder: [] for folder in self.drain_folders()}
+        for entry in entries:
+            folder = self._folder_of(entry, self.folders)
+            if folder in by_folder:
+                by_folder[folder].append(entry)
+        for folder, folder_entries in by_folder.items():
+            # 'deferred' (like 'cursor') is a DynamoDB reserved word
+            kwargs = {'ExpressionAttributeNames': {'#deferred': 'deferred'}}
+            values = {}
+            if folder_entries:
+                update = 'SET #deferred = :deferred'
+                values[':deferred'] = json.dumps(folder_entries)
+            else:
+                update = 'REMOVE #deferred'
+            if (self.leases or {}).get(folder) is not None:
+                kwargs['ConditionExpression'] = 'drain_owner = :owner'
+                values[':owner'] = self.lease_owner
+            if values:
+                kwargs['ExpressionAttributeValues'] = values
+            try:
+                self.table.update_item(Key={'folder_path': folder}, UpdateExpression=update, **kwargs)
+            except ClientError as e:
+                print(f"Error saving deferred files for {folder}: {str(e)}")
@@ -0,0 +1,46 @@
+import os
+import threading
+import boto3
+from botocore.exceptions import ClientError
+
+# Set when tables are provisioned at deploy time to skip DescribeTable entirely
+SKIP_TABLE_CHECK = os.environ.get('SKIP_TABLE_CHECK', 'false').lower() == 'true'
+
+_dynamodb = None
+_tables = {}
+_lock = threading.RLock()
+
+def get_dynamodb():
+    """One boto3 DynamoDB resource per container"""
+    global _dynamodb
+    if _dynamodb is None:
+        with _lock:
+            if _dynamodb is None:
+                _dynamodb = boto3.resource('dynamodb')
+    return _dynamodb
+
+def get_table(table_name, create_table):
+    """
+    Return the Table, checking it exists (DescribeTable) only on first use in this container.
+    ``create_table`` is called to create it when it is missing.
+    """
+    table = _tables.get(table_name)
+    if table is not None:
+        return table
+
+    with _lock:
+        table = _tables.get(table_name)
+        if table is not None:
+            return table
+
+        table = get_dynamodb().Table(table_name)
+        if not SKIP_TABLE_CHECK:
+            try:
+                table.load()
+            except ClientError as e:
+                if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                    table = create_table()
+                else:
+                    raise
+        _tables[table_name] = table
+        return table
@@ -0,0 +1,96 @@
+import os
+import asyncio
+import threading
+import httpx
+from rate_limiter import get_limiter
+
+try:
+    import h2  # noqa: F401  (optional; enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+HTTP_CONNECT_TIMEOUT = float(os.environ.get('HTTP_CONNECT_TIMEOUT', '10'))
+HTTP_READ_TIMEOUT = float(os.environ.get('HTTP_READ_TIMEOUT', '60'))
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY', '60'))
+HTTP_DEBUG = os.environ.get('HTTP_DEBUG', 'false').lower() == 'true'
+HTTP_DEBUG_BODY_LIMIT = int(os.environ.get('HTTP_DEBUG_BODY_LIMIT', '500'))
+# Overridable so the benchmark harness (or a proxy) can stand in for Dropbox
+DROPBOX_API_URL = os.environ.get('DROPBOX_API_URL', 'https://api.dropboxapi.com').rstrip('/')
+DROPBOX_CONTENT_URL = os.environ.get('DROPBOX_CONTENT_URL', 'https://content.dropboxapi.com').rstrip('/')
+
+_client = None
+_async_clients = {}
+_lock = threading.Lock()
+
+def get_http_client():
+    """
+    One keep-alive connection pool (per host) shared by every Dropbox, Slack and OAuth call in the container,
+    so warm invocations skip the TCP+TLS handshake. Uses HTTP/2 when the h2 package is installed.
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = httpx.Client(
+                    http2=HTTP2_AVAILABLE,
+                    timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                    limits=httpx.Limits(
+                        max_connections=HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                    )
+                )
+    return _client
+
+def get_async_http_client():
+    """Pooled AsyncClient for the running event loop (async clients can't be shared across loops)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _lock:
+            for other_loop in [l for l in _async_clients if l.is_closed()]:
+                del _async_clients[other_loop]
+            client = httpx.AsyncClient(
+                http2=HTTP2_AVAILABLE,
+                timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+            _async_clients[loop] = client
+    return client
+
+def post_with_retry(upstream, url, **kwargs):
+    """
+    POST through the shared client within ``upstream``'s rate limits, retrying throttling and transient errors.
+    Raises httpx.HTTPStatusError for a non-2xx response once retries are exhausted.
+    """
+    def send():
+        response = get_http_client().post(url, **kwargs)
+        response.raise_for_status()
+        return response
+    return get_limiter(upstream).call(send)
+
+async def post_with_retry_async(upstream, url, **kwargs):
+    """Async counterpart of post_with_retry"""
+    async def send():
+        response = await get_async_http_client().post(url, **kwargs)
+        response.raise_for_status()
+        return response
+    return await get_limiter(upstream).call_async(send)
+
+def debug_log(message, body=None):
+    """Print only when HTTP_DEBUG is on, truncating bodies so large payloads aren't serialized on the hot path"""
+    if not HTTP_DEBUG:
+        return
+    if body is None:
+        print(message)
+        return
+    text = body if isinstance(body, str) else repr(body)
+    if len(text) > HTTP_DEBUG_BODY_LIMIT:
+        text = f"{text[:HTTP_DEBUG_BODY_LIMIT]}... ({len(text)} chars)"
+    print(f"{message}: {text}")
@@ -0,0 +1,275 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from botocore.exceptions import ClientError
+from dynamodb_tables import get_dynamodb, get_table
+
+JOB_STATE_BACKEND = os.environ.get('JOB_STATE_BACKEND', 'dynamodb').lower()
+JOB_STATE_PATH = os.environ.get('JOB_STATE_PATH', '/tmp/job_state.json')
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', '/tmp/job_artifacts')
+
+DISCOVERED = 'DISCOVERED'
+DOWNLOADED = 'DOWNLOADED'
+TRANSCRIBED = 'TRANSCRIBED'
+ANALYZED = 'ANALYZED'
+NOTIFIED = 'NOTIFIED'
+STAGES = (DISCOVERED, DOWNLOADED, TRANSCRIBED, ANALYZED, NOTIFIED)
+
+# Dropbox temporary links live for 4 hours; treat them as stale a little earlier
+TEMPORARY_LINK_TTL = 4 * 3600 - 600
+
+def job_id_for(audio_file, content_hash=None, file_id=None):
+    """A new revision of a file (new content_hash) is a new job"""
+    return f"{file_id or audio_file}:{content_hash or 'unknown'}"
+
+class ArtifactStore:
+    """Stage outputs saved as JSON files and referenced from the job record by path"""
+
+    def __init__(self, directory=ARTIFACT_DIR):
+        self.directory = directory
+
+    def save(self, job_id, name, value):
+        os.makedirs(self.directory, exist_ok=True)
+        safe_id = "".join(c if c.isalnum() else "_" for c in job_id)
+        path = os.path.join(self.directory, f"{safe_id}.{name}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        os.replace(tmp_path, path)
+        return path
+
+    def load(self, ref):
+        try:
+            with open(ref, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def delete_all(self, refs):
+        for ref in refs:
+            try:
+                os.remove(ref)
+            except (OSError, TypeError):
+                pass
+
+class DynamoDBJobStore:
+    """Per-file job records in DynamoDB, keyed by job_id"""
+    TABLE_NAME = 'TranscriptionJobs'
+
+    def __init__(self):
+        self.dynamodb = get_dynamodb()
+        self.table = self.ensure_table_exists()
+
+    def ensure_table_exists(self):
+        return get_table(self.TABLE_NAME, self.create_table)
+
+    def create_table(self):
+        table = self.dynamodb.create_table(
+            TableName=self.TABLE_NAME,
+            KeySchema=[
+                {
+                    'AttributeName': 'job_id',
+                    'KeyType': 'HASH'
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'job_id',
+                    'AttributeType': 'S'
+                }
+            ],
+            ProvisionedThroughput={
+                'ReadCapacityUnits': 5,
+                'WriteCapacityUnits': 5
+            }
+        )
+        table.wait_until_exists()
+        return table
+
+    def get(self, job_id):
+        try:
+            item = self.table.get_item(Key={'job_id': job_id}, ConsistentRead=True).get('Item')
+            if item and 'artifacts' in item:
+                item['artifacts'] = json.loads(item['artifacts'])
+            return item
+        except ClientError as e:
+            print(f"Error reading job {job_id}: {str(e)}")
+            return None
+
+    def put(self, record):
+        item = dict(record)
+        item['artifacts'] = json.dumps(record.get('artifacts', {}))
+        try:
+            self.table.put_item(Item=item)
+        except ClientError as e:
+            print(f"Error writing job {record['job_id']}: {str(e)}")
+
+class LocalJobStore:
+    """JSON-file stand-in for DynamoDBJobStore"""
+
+    def __init__(self, path=JOB_STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def get(self, job_id):
+        with self._lock:
+            return self._load().get(job_id)
+
+    def put(self, record):
+        with self._lock:
+            records = self._load()
+            records[record['job_id']] = record
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(records, f)
+            os.replace(tmp_path, self.path)
+
+class MemoryJobStore:
+    """Non-persistent store used when JOB_STATE_BACKEND=none; stages still run in order but can't resume"""
+
+    def __init__(self):
+        self.records = {}
+
+    def get(self, job_id):
+        return self.records.get(job_id)
+
+    def put(self, record):
+        self.records[record['job_id']] = record
+
+class PipelineJob:
+    """
+    Checkpointed state for one file. Each stage records its output by reference; a rerun skips every completed
+    stage whose output is still usable and resumes from the first one that isn't.
+    """
+
+    def __init__(self, store, audio_file, content_hash=None, file_id=None, artifacts=None):
+        self.store = store
+        self.artifact_store = artifacts or ArtifactStore()
+        self.job_id = job_id_for(audio_file, content_hash, file_id)
+        record = store.get(self.job_id)
+        if record is None:
+            record = {
+                'job_id': self.job_id,
+                'file_path': audio_file,
+                'content_hash': content_hash,
+                'stage': DISCOVERED,
+                'artifacts': {},
+                'attempts': 0,
+                'updated_at': datetime.now().isoformat()
+            }
+        else:
+            print(f"Resuming job {self.job_id} after stage {record['stage']}")
+        record['attempts'] = int(record.get('attempts', 0)) + 1
+        self.record = record
+        self._save()
+
+    def _save(self):
+        self.record['updated_at'] = datetime.now().isoformat()
+        self.store.put(self.record)
+
+    @property
+    def stage(self):
+        return self.record['stage']
+
+    def completed(self, stage):
+        return STAGES.index(self.stage) >= STAGES.index(stage)
+
+    def artifact(self, name):
+        return self.record['artifacts'].get(name)
+
+    def checkpoint(self, stage, **artifacts):
+        self.record['stage'] = stage
+        self.record['artifacts'].update(artifacts)
+        self.record.pop('error', None)
+        self._save()
+
+    def rewind(self, stage):
+        """
+        Mark ``stage`` as the last completed one when a later stage's output can no longer be used: the pipeline
+        rewinds a job whose saved summary or transcript is unreadable, or whose download or link is gone.
+        """
+        if self.completed(stage):
+            self.record['stage'] = stage
+            self._save()
+
+    def fail(self, message):
+        self.record['error'] = message
+        self._save()
+
+    # Stage outputs
+
+    def audio_source(self):
+        """Return ('path', local path) or ('url', link) from the DOWNLOADED stage if it is still usable"""
+        path = self.artifact('audio_path')
+        if path and os.path.exists(path):
+            return 'path', path
+        url = self.artifact('audio_url')
+        if url and time.time() < float(self.artifact('audio_url_expires_at') or 0):
+            return 'url', url
+        return None, None
+
+    def save_audio_url(self, url):
+        self.checkpoint(DOWNLOADED, audio_url=url, audio_url_expires_at=int(time.time()) + TEMPORARY_LINK_TTL,
+                        audio_path=None)
+
+    def save_audio_path(self, path):
+        self.checkpoint(DOWNLOADED, audio_path=path, audio_url=None)
+
+    def save_transcript(self, transcript):
+        ref = self.artifact_store.save(self.job_id, 'transcript', transcript.to_list())
+        self.checkpoint(TRANSCRIBED, transcript=ref)
+
+    def load_transcript(self):
+        from transcript import Transcript
+        utterances = self.artifact_store.load(self.artifact('transcript'))
+        return Transcript.from_list(utterances) if utterances is not None else None
+
+    def save_summary(self, meeting_summary):
+        ref = self.artifact_store.save(self.job_id, 'summary', meeting_summary)
+        self.checkpoint(ANALYZED, meeting_summary=ref, slack_attachments_sent=0)
+
+    def load_summary(self):
+        return self.artifact_store.load(self.artifact('meeting_summary'))
+
+    def save_slack_message(self, channel, ts):
+        """Remember the Slack message a progressive summary went to, so a retry edits it instead of reposting"""
+        self.record['artifacts'].update(slack_channel=channel, slack_ts=ts)
+        self._save()
+
+    def slack_message(self):
+        return self.artifact('slack_channel'), self.artifact('slack_ts')
+
+    def save_slack_attachments_sent(self, count):
+        """Remember how many attachments of a summary split across messages were posted, so a retry sends the rest"""
+        self.record['artifacts'].update(slack_attachments_sent=count)
+        self._save()
+
+    def slack_attachments_sent(self):
+        return int(self.artifact('slack_attachments_sent') or 0)
+
+    def finish(self):
+        """Record the notification and drop the intermediate artifacts"""
+        self.artifact_store.delete_all([self.artifact('transcript'), self.artifact('meeting_summary')])
+        self.checkpoint(NOTIFIED, transcript=None, meeting_summary=None, notified_at=datetime.now().isoformat())
+
+_job_store = None
+
+def get_job_store():
+    global _job_store
+    if _job_store is None:
+        if JOB_STATE_BACKEND == 'local':
+            _job_store = LocalJobStore()
+        elif JOB_STATE_BACKEND == 'none':
+            _job_store = MemoryJobStore()
+        else:
+            _job_store = DynamoDBJobStore()
+    return _job_store
@@ -1,14 +1,80 @@
 import os
 import json
-from dropbox_update import DropboxUpdateNotificationAPI
-from dropbox_file_handler import DropboxFileHandler
-from stt_deepgram import speech_to_text
-from analyze import analyzer
-from slack_notifier import send_slack_notification
+import time
+import uuid
+from startup_timing import timed, report_startup
+from rate_limiter import limiter_metrics
+from sampling_profiler import start_profiling, report_profile
+from scheduler import remaining_seconds
+import metrics
 
-MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
-SUPPORTED_AUDIO_FORMATS = ('.mp3', '.mp4', '.mp2', '.aac', '.wav', '.flac', '.pcm', '.m4a', '.ogg', '.opus', '.webm',
-                           '.MP3', '.MP4', '.MP2', '.AAC', '.WAV', '.FLAC', '.PCM', '.M4A', '.OGG', '.OPUS', '.WEBM')
+with timed('import dropbox_update'):
+    from dropbox_update import DropboxUpdateNotificationAPI, DRAIN_LEASE_SECONDS
+with timed('import dropbox_file_handler'):
+    from dropbox_file_handler import DropboxFileHandler
+with timed('import stt_deepgram'):
+    import stt_deepgram  # noqa: F401
+with timed('import analyze'):
+    import analyze  # noqa: F401
+with timed('import slack_notifier'):
+    import slack_notifier  # noqa: F401
+with timed('import content_index'):
+    from content_index import get_content_index
+with timed('import pipeline'):
+    from pipeline import run_pipeline, enqueue_new_files
+    from async_pipeline import run_pipeline_async, run_coroutine
+with timed('import work_queue'):
+    from work_queue import get_work_queue
+
+# 'sync' runs files on a thread pool; 'async' overlaps all I/O on one event loop
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'sync').lower()
+
+_dropbox_api = None
+
+def get_dropbox_api():
+    """Build the Dropbox client once per container; later invocations only re-check the (cached) token"""
+    global _dropbox_api
+    if _dropbox_api is None:
+        with timed('init DropboxUpdateNotificationAPI'):
+            _dropbox_api = DropboxUpdateNotificationAPI()
+    else:
+        _dropbox_api.access_token = _dropbox_api.token_manager.get_access_token()
+        _dropbox_api.error = False
+        _dropbox_api.errmsg = ''
+    return _dropbox_api
+
+def lease_seconds(context):
+    """Hold drain leases until the invocation's deadline, so a timed-out drain frees its folders by itself"""
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    return get_remaining() / 1000 if get_remaining else DRAIN_LEASE_SECONDS
+
+def drain(pdb, run_pass, context=None):
+    """
+    Call ``run_pass`` for the leased folders, then again for any folder whose drain was flagged by a webhook that
+    arrived meanwhile, until nothing new came in or no time is left. Returns the result of every pass.
+    """
+    passes = [run_pass()]
+    while pdb.release_leases():
+        budget_seconds = remaining_seconds(context)
+        if budget_seconds is not None and budget_seconds <= 0:
+            print("No time left for another pass; remaining changes wait for the next webhook")
+            break
+        print(f"Webhooks arrived during the drain; listing {', '.join(pdb.drain_folders())} again")
+        passes.append(run_pass())
+    return passes
+
+def acknowledge_webhook(pdb, work_queue, context=None):
+    """Only drain the change feed and enqueue per-file jobs; the worker function does the processing"""
+    started = time.perf_counter()
+    passes = drain(pdb, lambda: enqueue_new_files(pdb, work_queue), context)
+    enqueued = sum(count for _, count in passes)
+    duplicates = [duplicate for batch, _ in passes for duplicate in batch.duplicates]
+    print(json.dumps({'enqueued': enqueued, 'update_files': sum(len(batch.update_files) for batch, _ in passes),
+                      'passes': len(passes), 'ingest_seconds': round(time.perf_counter() - started, 3)}))
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': 'Update queued', 'enqueued': enqueued, 'duplicates': duplicates})
+    }
 
 def lambda_handler(event, context):
     if 'queryStringParameters' in event and 'challenge' in event['queryStringParameters']:
@@ -17,11 +83,55 @@ def lambda_handler(event, context):
             'body': event['queryStringParameters']['challenge']
         }
 
-    pdb = DropboxUpdateNotificationAPI()
+    invocation_id = metrics.start_invocation(context, PIPELINE_MODE)
+    profiler = start_profiling()
+    try:
+        with metrics.stage('invocation', Handler='webhook'):
+            return handle_webhook(context, invocation_id)
+    finally:
+        report_profile(profiler, invocation_id)
+
+def handle_webhook(context=None, invocation_id=None):
+    pdb = get_dropbox_api()
+    if not pdb.acquire_leases(invocation_id or uuid.uuid4().hex, lease_seconds(context)):
+        print("Every folder is already being drained by another invocation")
+        report_startup()
+        return {
+            'statusCode': 200,
+            'body': json.dumps('Update coalesced into a running drain')
+        }
+    try:
+        return drain_and_process(pdb, context)
+    finally:
+        pdb.release_leases(force=True)
+
+def drain_and_process(pdb, context=None):
     file_handler = DropboxFileHandler(pdb.access_token)
 
+    work_queue = get_work_queue()
+    if work_queue is not None:
+        try:
+            return acknowledge_webhook(pdb, work_queue, context)
+        finally:
+            report_startup()
+
     try:
-        update_files = pdb.get_new_files()
+        with timed('init content index'):
+            content_index = get_content_index()
+
+        def run_pass():
+            budget_seconds = remaining_seconds(context)
+            if PIPELINE_MODE == 'async':
+                return run_coroutine(run_pipeline_async(pdb, file_handler, content_index, budget_seconds))
+            return run_pipeline(pdb, file_handler, content_index, budget_seconds)
+
+        started = time.perf_counter()
+        passes = drain(pdb, run_pass, context)
+        print(json.dumps({'pipeline_mode': PIPELINE_MODE, 'passes': len(passes),
+                          'pipeline_seconds': round(time.perf_counter() - started, 3)}))
+
+        update_files = [path for batch, _ in passes for path in batch.update_files]
+        results = [result for _, pass_results in passes for result in pass_results]
         print(f"Update files: {update_files}")
         print(f"Number of updated files: {len(update_files)}")
 
@@ -32,62 +142,26 @@ def lambda_handler(event, context):
                 'body': json.dumps('No updates')
             }
 
-        audio_files = [f for f in update_files if f.lower().endswith(SUPPORTED_AUDIO_FORMATS)]
-        if not audio_files:
+        if not results:
             print('No audio files to process')
             return {
                 'statusCode': 200,
                 'body': json.dumps('No audio files to process')
             }
 
-        first_audio_file = audio_files[0]
-        print(f"Audio files to process: {first_audio_file}")
-
-        file_metadata = file_handler.get_file_metadata(first_audio_file)
-        if file_metadata['size'] > MAX_FILE_SIZE:
-            print(f"File {first_audio_file} exceeds the maximum size limit of 2GB. Skipping.")
-            return {
-                'statusCode': 204,
-                'body': json.dumps('File size exceeds limit')
-            }
-
-        downloaded_file = file_handler.download_file_to_tmp(first_audio_file)
-        print(f"Downloaded file: {downloaded_file}")
-
-        if downloaded_file:
-            result = speech_to_text(downloaded_file)
-            if result and isinstance(result, tuple) and len(result) == 2:
-                transcription_file, status_code = result
-                if status_code == 200:
-                    print(f"Transcription saved to: {transcription_file}")
-                    meeting_summary = analyzer(transcription_file)
-                    send_slack_notification(meeting_summary, first_audio_file)
-                    
-                    try:
-                        os.remove(transcription_file)
-                        print(f"Deleted temporary transcription file: {transcription_file}")
-                    except Exception as e:
-                        print(f"Error deleting transcription file {transcription_file}: {str(e)}")
-                else:
-                    print(f"Speech-to-text conversion failed with status code: {status_code}")
-            else:
-                print("Speech-to-text conversion failed")
-
-            try:
-                os.remove(downloaded_file)
-                print(f"Deleted temporary audio file: {downloaded_file}")
-            except Exception as e:
-                print(f"Error deleting audio file {downloaded_file}: {str(e)}")
-        else:
-            print("No file was downloaded")
+        for result in results:
+            print(f"{result['status']}: {result['file']} ({result['message']})")
+        print(json.dumps({'upstream_metrics': limiter_metrics()}))
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
         raise
+    finally:
+        report_startup()
 
     print("Lambda function completed successfully")
 
     return {
         'statusCode': 200,
-        'body': json.dumps('Update processed successfully')
-    }
\ No newline at end of file
+        'body': json.dumps({'message': 'Update processed successfully', 'results': results})
+    }
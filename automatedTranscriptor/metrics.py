@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Structured per-stage metrics as CloudWatch Embedded Metric Format (EMF) lines on stdout
+METRICS_EMF = os.environ.get('METRICS_EMF', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'AutomatedTranscriptor')
+
+UNITS = {
+    'Duration': 'Milliseconds',
+    'Bytes': 'Bytes',
+    'AudioSeconds': 'Seconds',
+    'InputTokens': 'Count',
+    'OutputTokens': 'Count',
+    'PromptTokens': 'Count',
+    'PromptTokensSaved': 'Count',
+    'Retries': 'Count',
+    'Throttles': 'Count',
+    'Entries': 'Count',
+}
+
+# One invocation runs at a time per container, so a global is enough (and is visible from pool threads)
+_invocation = {'id': None, 'mode': None}
+_current_file = contextvars.ContextVar('current_file', default=None)
+_current_stage = contextvars.ContextVar('current_stage', default=None)
+_emit_lock = threading.Lock()
+_add_lock = threading.Lock()
+
+class StageRecord:
+    """Measurements for one stage of one file; ``add`` accumulates numeric metrics"""
+    __slots__ = ('name', 'started', 'values', 'properties', 'status')
+
+    def __init__(self, name, properties):
+        self.name = name
+        self.started = time.perf_counter()
+        self.values = {}
+        self.properties = properties
+        self.status = 'ok'
+
+    def add(self, **values):
+        with _add_lock:
+            for key, value in values.items():
+                if value is not None:
+                    self.values[key] = self.values.get(key, 0) + value
+
+def start_invocation(context=None, mode=None):
+    """Correlate everything emitted until the next call with this invocation (the Lambda request ID if known)"""
+    _invocation['id'] = getattr(context, 'aws_request_id', None) or uuid.uuid4().hex
+    _invocation['mode'] = mode
+    return _invocation['id']
+
+def emit(stage, values, properties=None, status='ok'):
+    """Print one EMF document: ``values`` become metrics (dimension Stage), ``properties`` searchable fields"""
+    if not METRICS_EMF:
+        return
+    file_scope = _current_file.get()
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Stage']],
+                'Metrics': [{'Name': name, 'Unit': UNITS.get(name, 'None')} for name in values]
+            }]
+        },
+        'Stage': stage,
+        'Status': status,
+        'InvocationId': _invocation['id'],
+        'PipelineMode': _invocation['mode'],
+    }
+    if file_scope:
+        document['FileId'], document['FilePath'] = file_scope
+    document.update(properties or {})
+    document.update({name: round(value, 3) if isinstance(value, float) else value for name, value in values.items()})
+    line = json.dumps(document, default=str)
+    with _emit_lock:
+        print(line)
+
+@contextmanager
+def stage(name, **properties):
+    """
+    Time a pipeline stage and emit it on exit. Code running inside (in the same thread or task, or via
+    ``propagate``) can attach bytes, audio duration, token counts or retries with ``add``; set ``record.status``
+    to report a handled failure.
+    """
+    record = StageRecord(name, properties)
+    token = _current_stage.set(record)
+    try:
+        yield record
+    except BaseException:
+        record.status = 'error'
+        raise
+    finally:
+        _current_stage.reset(token)
+        record.values['Duration'] = (time.perf_counter() - record.started) * 1000
+        emit(record.name, record.values, record.properties, record.status)
+
+def add(**values):
+    """Add to the stage currently being measured, if any"""
+    record = _current_stage.get()
+    if record is not None:
+        record.add(**values)
+
+@contextmanager
+def file_scope(file_path, file_id=None):
+    """Tag every stage emitted inside with the file it belongs to"""
+    token = _current_file.set((file_id or file_path, file_path))
+    try:
+        yield
+    finally:
+        _current_file.reset(token)
+
+def propagate(function):
+    """
+    Wrap ``function`` so pool threads run it in (a copy of) the caller's context, keeping the current file and
+    stage; worker threads otherwise start with an empty context.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(function, *args, **kwargs)
+    return run
@@ -0,0 +1,472 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from stt_deepgram import speech_to_text, speech_to_text_from_url, prefers_local_file
+from analyze import analyzer, ANALYSIS_MODE
+from slack_notifier import send_slack_notification, ProgressiveSlackMessage
+from slack_digest import get_digest_queue, flush_notifications
+from work_queue import make_job
+from audio_compaction import compact_audio
+from scheduler import schedule, deferred_result
+from workspace import get_workspace_manager, disk_needed
+from job_state import PipelineJob, get_job_store, DISCOVERED, DOWNLOADED, TRANSCRIBED, ANALYZED, NOTIFIED
+
+MAX_FILE_SIZE = 2 * 1024 * 1024 * 1024
+SUPPORTED_AUDIO_FORMATS = ('.mp3', '.mp4', '.mp2', '.aac', '.wav', '.flac', '.pcm', '.m4a', '.ogg', '.opus', '.webm',
+                           '.MP3', '.MP4', '.MP2', '.AAC', '.WAV', '.FLAC', '.PCM', '.M4A', '.OGG', '.OPUS', '.WEBM')
+MAX_CONCURRENT_FILES = int(os.environ.get('MAX_CONCURRENT_FILES', '4'))
+# 'url' lets Deepgram fetch the file from a Dropbox temporary link; 'buffer' downloads it to a workspace and uploads it
+TRANSFER_MODE = os.environ.get('TRANSFER_MODE', 'url').lower()
+# Inline (webhook) mode: how often a failed file is tried before it is dropped from the carried-over list
+MAX_FILE_ATTEMPTS = int(os.environ.get('MAX_FILE_ATTEMPTS', '3'))
+# What to do with a file whose content was already processed: 'skip' it, or 'reuse' the stored summary
+DEDUP_ACTION = os.environ.get('DEDUP_ACTION', 'skip').lower()
+
+def _is_success(result):
+    return bool(result) and isinstance(result, tuple) and len(result) == 2 and result[1] == 200
+
+def _remove_audio(downloaded_file):
+    try:
+        os.remove(downloaded_file)
+        print(f"Deleted temporary audio file: {downloaded_file}")
+    except Exception as e:
+        print(f"Error deleting audio file {downloaded_file}: {str(e)}")
+
+# Stage decisions and bookkeeping shared by this pipeline and async_pipeline; the two only differ in how they
+# call Dropbox, Deepgram, OpenAI and Slack. Helpers that touch the job or content stores are plain blocking calls
+# (the async pipeline runs them with asyncio.to_thread).
+
+def _find_duplicate(content_index, content_hash, audio_file):
+    """The content index record of an already processed copy of this content, or None"""
+    if not content_hash or content_index is None:
+        return None
+    record = content_index.get(content_hash)
+    if record:
+        print(f"{audio_file} has the same content as already processed {record.get('file_path')}")
+    return record
+
+def _summary_to_reuse(record):
+    """The stored summary to post again for a duplicate, or None to just report it"""
+    return record.get('meeting_summary') if DEDUP_ACTION == 'reuse' else None
+
+def _duplicate_result(record, audio_file, sent=None):
+    """Result for a duplicate; ``sent`` tells whether the reused summary was posted (None if it wasn't reused)"""
+    if sent is None:
+        return {'file': audio_file, 'status': 'duplicate', 'message': f"Same content as {record.get('file_path')}"}
+    if not sent:
+        return {'file': audio_file, 'status': 'failed', 'message': 'Slack notification failed'}
+    return {'file': audio_file, 'status': 'reused', 'message': f"Reused summary of {record.get('file_path')}"}
+
+def _open_job(job_store, audio_file, content_hash=None, file_id=None):
+    """Load or create the file's job; returns (job, result) where result ends the file early if it is not None"""
+    job = PipelineJob(job_store or get_job_store(), audio_file, content_hash, file_id)
+    if job.completed(NOTIFIED):
+        return job, {'file': audio_file, 'status': 'processed', 'message': 'Summary was already sent to Slack'}
+    return job, None
+
+def _needs_metadata(job, file_size):
+    """The size check runs once, before the first download; the listing's size saves the metadata call"""
+    return job.stage == DISCOVERED and file_size is None
+
+def _metadata_failed(record, audio_file):
+    record.status = 'failed'
+    return {'file': audio_file, 'status': 'failed', 'message': 'Could not get file metadata'}
+
+def _check_size(file_size, audio_file):
+    if file_size is not None and file_size > MAX_FILE_SIZE:
+        print(f"File {audio_file} exceeds the maximum size limit of 2GB. Skipping.")
+        return {'file': audio_file, 'status': 'skipped', 'message': 'File size exceeds limit'}
+    return None
+
+def _resume(job):
+    """
+    (meeting_summary, transcript) saved by an earlier attempt, either possibly None. A stage whose output can no
+    longer be read (e.g. ARTIFACT_DIR was another container's /tmp) is rewound so the job redoes it.
+    """
+    if job.completed(ANALYZED):
+        meeting_summary = job.load_summary()
+        if meeting_summary is not None:
+            return meeting_summary, None
+        job.rewind(TRANSCRIBED)
+    if job.completed(TRANSCRIBED):
+        transcript = job.load_transcript()
+        if transcript is not None:
+            return None, transcript
+        job.rewind(DOWNLOADED)
+    return None, None
+
+def _saved_audio(job):
+    """
+    (kind, source) of a link or download from an earlier attempt that is still usable, else (None, None); a
+    DOWNLOADED job whose link expired or whose file is gone is rewound to DISCOVERED
+    """
+    if not job.completed(DOWNLOADED):
+        return None, None
+    kind, source = job.audio_source()
+    if kind is None:
+        job.rewind(DISCOVERED)
+    return kind, source
+
+def _downloads(audio_file, buffered=False):
+    """Whether the audio is downloaded rather than handed to Deepgram as a Dropbox temporary link"""
+    return buffered or TRANSFER_MODE != 'url' or prefers_local_file(audio_file)
+
+def _finish_stage(record, ok, **values):
+    record.add(**values)
+    if not ok:
+        record.status = 'failed'
+    return ok
+
+def _downloaded_bytes(downloaded_file):
+    return os.path.getsize(downloaded_file) if downloaded_file else None
+
+def _download_result(job, downloaded_file):
+    """Checkpoint a finished download; returns (kind, source) or (None, None)"""
+    print(f"Downloaded file: {downloaded_file}")
+    if not downloaded_file:
+        print("No file was downloaded")
+        return None, None
+    job.save_audio_path(downloaded_file)
+    return 'path', downloaded_file
+
+def _transcript_of(result, kind, source):
+    if _is_success(result):
+        return result[0]
+    print(f"Speech-to-text conversion failed for {source if kind == 'path' else 'temporary link'}")
+    return None
+
+def _falls_back(transcript, kind, audio_file):
+    """A failed URL transfer is retried once with a buffered download"""
+    if transcript is None and kind == 'url':
+        print(f"URL transfer failed for {audio_file}, falling back to buffered download")
+        return True
+    return False
+
+def _transcription_failed(job, audio_file):
+    job.fail('Speech-to-text conversion failed')
+    return {'file': audio_file, 'status': 'failed', 'message': 'Speech-to-text conversion failed'}
+
+def _progressive_message(job, audio_file):
+    """The Slack message progressive analysis fills in, resuming one posted by an earlier attempt"""
+    if ANALYSIS_MODE != 'progressive':
+        return None
+    channel, ts = job.slack_message()
+    return ProgressiveSlackMessage(audio_file, channel, ts, on_posted=job.save_slack_message)
+
+def _digest_queue_for(message):
+    """The digest queue to hand the summary to, or None to post it directly (a progressive message is finished)"""
+    if message is not None and message.posted:
+        return None
+    return get_digest_queue()
+
+def _finishes(message):
+    """Whether the final summary completes an already posted progressive message rather than a new post"""
+    return message is not None and message.posted
+
+def _record_notified(job, meeting_summary, audio_file, content_hash=None, content_index=None):
+    job.finish()
+    if content_hash and content_index is not None:
+        content_index.put(content_hash, audio_file, meeting_summary)
+
+def _notified(sent, job, meeting_summary, audio_file, content_hash=None, content_index=None):
+    """Result of a direct post; a job whose summary could not be posted stays ANALYZED so a retry posts it"""
+    if not sent:
+        job.fail('Slack notification failed')
+        return {'file': audio_file, 'status': 'failed', 'message': 'Slack notification failed'}
+    _record_notified(job, meeting_summary, audio_file, content_hash, content_index)
+    return {'file': audio_file, 'status': 'processed', 'message': 'Summary sent to Slack'}
+
+def _queue_for_digest(digest_queue, job, meeting_summary, audio_file, content_hash=None, content_index=None):
+    """
+    Hand the summary to the digest queue. The returned result is updated by the queue's sender thread, which runs
+    before the batch is flushed: the job is marked NOTIFIED once its digest was posted, and is left ANALYZED and
+    reported as failed if the post failed.
+    """
+    result = {'file': audio_file, 'status': 'processed', 'message': 'Summary queued for the Slack digest'}
+    sent_attachments = job.slack_attachments_sent()
+
+    def failed(delivered):
+        if delivered > sent_attachments:
+            job.save_slack_attachments_sent(delivered)
+        job.fail('Slack digest could not be posted')
+        result.update(status='failed', message='Slack digest could not be posted')
+
+    digest_queue.submit(meeting_summary, audio_file, on_failed=failed, on_sent=lambda: _record_notified(
+        job, meeting_summary, audio_file, content_hash, content_index), sent_attachments=sent_attachments)
+    return result
+
+def _failure_result(audio_file, e):
+    print(f"An error occurred while processing {audio_file}: {str(e)}")
+    return {'file': audio_file, 'status': 'failed', 'message': str(e)}
+
+# Blocking I/O for the synchronous pipeline
+
+def _reserve_disk(workspace, audio_file, file_size):
+    with metrics.stage('reserve_disk') as record:
+        nbytes = disk_needed(file_size, audio_file)
+        record.add(Bytes=nbytes)
+        reserved = workspace.reserve(nbytes)
+        if not reserved:
+            record.status = 'unavailable'
+    return reserved
+
+def _acquire_audio(job, file_handler, audio_file, workspace, file_size=None, buffered=False):
+    """
+    DOWNLOADED stage. In url mode this is a Dropbox temporary link that Deepgram pulls from (zero-copy);
+    otherwise, or as a fallback, the file is downloaded into the job's workspace once disk space for it is
+    reserved. A file that would be downloaded is streamed from a link instead when the space is not available.
+    Returns (kind, source) or (None, None).
+    """
+    download = _downloads(audio_file, buffered)
+    if download and not buffered and not _reserve_disk(workspace, audio_file, file_size):
+        print(f"Not enough disk space to download {audio_file}, streaming it from a temporary link instead")
+        download = False
+    if not download:
+        with metrics.stage('temporary_link') as record:
+            link = _finish_stage(record, file_handler.get_temporary_link(audio_file))
+        if link:
+            job.save_audio_url(link)
+            return 'url', link
+    if not workspace.reserved and not _reserve_disk(workspace, audio_file, file_size):
+        print(f"Not enough disk space to download {audio_file}")
+        return None, None
+    with metrics.stage('download') as record:
+        downloaded_file = file_handler.download_file_to_tmp(audio_file, directory=workspace.path)
+        _finish_stage(record, downloaded_file, Bytes=_downloaded_bytes(downloaded_file))
+    return _download_result(job, downloaded_file)
+
+def _transcribe(kind, source, content_hash=None):
+    with metrics.stage('transcribe', Transfer=kind) as record:
+        if kind == 'url':
+            result = speech_to_text_from_url(source, audio_hash=content_hash)
+        else:
+            upload_path = compact_audio(source, keep_wav=prefers_local_file(source))
+            record.add(Bytes=os.path.getsize(upload_path))
+            try:
+                result = speech_to_text(upload_path, audio_hash=content_hash)
+            finally:
+                if upload_path != source:
+                    _remove_audio(upload_path)
+        _finish_stage(record, _is_success(result))
+    return _transcript_of(result, kind, source)
+
+def _run_transcription(job, file_handler, audio_file, content_hash=None, file_size=None):
+    """
+    DOWNLOADED -> TRANSCRIBED, reusing a still-valid link from an earlier attempt. Local files live in a
+    workspace of their own that is removed however the transcription ends.
+    """
+    with get_workspace_manager().workspace(job.job_id) as workspace:
+        kind, source = _saved_audio(job)
+        if kind is None:
+            kind, source = _acquire_audio(job, file_handler, audio_file, workspace, file_size)
+        if kind is None:
+            return None
+
+        transcript = _transcribe(kind, source, content_hash)
+        if _falls_back(transcript, kind, audio_file):
+            kind, source = _acquire_audio(job, file_handler, audio_file, workspace, file_size, buffered=True)
+            if kind is not None:
+                transcript = _transcribe(kind, source, content_hash)
+
+    if transcript is not None:
+        job.save_transcript(transcript)
+    return transcript
+
+def _partial_publisher(message):
+    if message is None:
+        return None
+
+    def publish(sections):
+        with metrics.stage('notify', Progress='partial'):
+            message.publish(sections)
+    return publish
+
+def _notify(job, meeting_summary, audio_file, content_hash=None, content_index=None, message=None):
+    """
+    NOTIFIED stage; a job that already reached it is never posted again. With a digest queue the summary is only
+    queued here and the job is marked NOTIFIED once the digest carrying it was sent.
+    """
+    digest_queue = _digest_queue_for(message)
+    if digest_queue is not None:
+        return _queue_for_digest(digest_queue, job, meeting_summary, audio_file, content_hash, content_index)
+
+    with metrics.stage('notify') as record:
+        if _finishes(message):
+            sent = message.publish(meeting_summary, final=True)
+        else:
+            sent = send_slack_notification(meeting_summary, audio_file, job.slack_attachments_sent(),
+                                           on_progress=job.save_slack_attachments_sent)
+        _finish_stage(record, sent)
+    return _notified(sent, job, meeting_summary, audio_file, content_hash, content_index)
+
+def _handle_duplicate(record, audio_file):
+    meeting_summary = _summary_to_reuse(record)
+    sent = send_slack_notification(meeting_summary, audio_file) if meeting_summary else None
+    return _duplicate_result(record, audio_file, sent)
+
+def process_audio_file(file_handler, audio_file, content_hash=None, content_index=None, file_id=None, job_store=None,
+                       file_size=None):
+    """
+    Run download -> transcription -> analysis -> Slack for a single file and report the outcome.
+    Every stage is checkpointed in the job store, so a retry resumes after the last completed stage.
+    ``file_size`` from the listing entry saves the metadata round trip.
+    """
+    print(f"Processing audio file: {audio_file}")
+
+    record = _find_duplicate(content_index, content_hash, audio_file)
+    if record:
+        return _handle_duplicate(record, audio_file)
+
+    job, done = _open_job(job_store, audio_file, content_hash, file_id)
+    if done:
+        return done
+
+    if _needs_metadata(job, file_size):
+        with metrics.stage('metadata') as stage_record:
+            file_metadata = file_handler.get_file_metadata(audio_file)
+            if file_metadata is None:
+                return _metadata_failed(stage_record, audio_file)
+        file_size = file_metadata['size']
+    skipped = _check_size(file_size, audio_file) if job.stage == DISCOVERED else None
+    if skipped:
+        return skipped
+
+    message = _progressive_message(job, audio_file)
+    meeting_summary, transcript = _resume(job)
+    if meeting_summary is None:
+        if transcript is None:
+            transcript = _run_transcription(job, file_handler, audio_file, content_hash, file_size)
+        if transcript is None:
+            return _transcription_failed(job, audio_file)
+        print(f"Transcription of {audio_file} has {len(transcript)} utterances")
+        with metrics.stage('analyze', Utterances=len(transcript)):
+            meeting_summary = analyzer(transcript, on_progress=_partial_publisher(message))
+        job.save_summary(meeting_summary)
+
+    return _notify(job, meeting_summary, audio_file, content_hash, content_index, message)
+
+def _process_safely(file_handler, entry, content_index=None):
+    audio_file = entry['path_display']
+    with metrics.file_scope(audio_file, entry.get('id')), metrics.stage('file') as record:
+        try:
+            result = process_audio_file(file_handler, audio_file, entry.get('content_hash'), content_index,
+                                        entry.get('id'), file_size=entry.get('size'))
+        except Exception as e:
+            result = _failure_result(audio_file, e)
+        record.status = result['status']
+    return result
+
+class AudioBatch:
+    """Tracks every changed file seen in one invocation and selects the audio files to process"""
+
+    def __init__(self):
+        self.update_files = []
+        self.duplicates = []
+        self._seen_hashes = {}
+
+    def select(self, entry):
+        """Return True if the list_folder entry should be processed"""
+        path = entry['path_display']
+        self.update_files.append(path)
+        if not path.lower().endswith(SUPPORTED_AUDIO_FORMATS):
+            return False
+        content_hash = entry.get('content_hash')
+        if content_hash in self._seen_hashes:
+            # Identical copy within this batch; the index has no record of it yet.
+            self.duplicates.append({'file': path, 'status': 'duplicate',
+                                    'message': f"Same content as {self._seen_hashes[content_hash]}"})
+            return False
+        if content_hash:
+            self._seen_hashes[content_hash] = path
+        print(f"Audio file to process: {path}")
+        return True
+
+def process_audio_files(file_handler, entries, content_index=None, max_workers=MAX_CONCURRENT_FILES):
+    """
+    Process audio file entries with at most ``max_workers`` running at once, preserving input order in the report.
+    ``entries`` may be a generator of list_folder entries; each one is submitted as soon as it is produced.
+    """
+    get_workspace_manager().sweep()
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        results = list(executor.map(lambda entry: _process_safely(file_handler, entry, content_index), entries))
+    flush_notifications()
+    return results
+
+def _carry_over(entries):
+    """Entries that may be tried again by a later invocation"""
+    return [entry for entry in entries if entry.get('attempts', 0) < MAX_FILE_ATTEMPTS]
+
+def plan_batch(pdb, batch, listed, budget_seconds=None, slots=MAX_CONCURRENT_FILES):
+    """
+    Merge the entries carried over by an earlier invocation with the newly listed ones (the listing wins per path),
+    select the audio files and split them shortest-job-first into (admitted, deferred) entries. Before any work
+    starts the carried-over list is replaced by the deferred entries plus the admitted ones, so files an invocation
+    does not get to finish (it times out or dies) are picked up by the next one; settle_batch drops them again.
+    Entries of a folder whose drain lease was lost during the listing are dropped; the new holder lists them again.
+    """
+    carried = pdb.load_deferred()
+    merged = {entry['path_display']: entry for entry in carried}
+    merged.update((entry['path_display'], entry) for entry in listed)
+    drained = [entry for entry in merged.values() if pdb.drains(entry)]
+    if len(drained) < len(merged):
+        print(f"Skipping {len(merged) - len(drained)} files of folders whose drain lease was lost")
+    selected = [entry for entry in drained if batch.select(entry)]
+    admitted, deferred = schedule(selected, budget_seconds, slots)
+    admitted = [dict(entry, attempts=entry.get('attempts', 0) + 1) for entry in admitted]
+    if admitted or deferred or carried:
+        pdb.save_deferred(deferred + _carry_over(admitted))
+    if deferred:
+        print(f"Deferred {len(deferred)} files that do not fit in the remaining {budget_seconds:.0f}s")
+    return admitted, deferred
+
+def settle_batch(pdb, admitted, results, deferred):
+    """
+    Replace the carried-over list with the deferred entries plus the admitted ones that failed, which are tried
+    again by a later invocation until they have had MAX_FILE_ATTEMPTS attempts.
+    """
+    failed = [entry for entry, result in zip(admitted, results) if result['status'] == 'failed']
+    retried = _carry_over(failed)
+    if admitted:
+        pdb.save_deferred(deferred + retried)
+    if retried:
+        print(f"{len(retried)} failed files will be retried by the next invocation")
+    for entry in failed:
+        if entry not in retried:
+            print(f"Giving up on {entry['path_display']} after {entry['attempts']} attempts")
+
+def run_pipeline(pdb, file_handler, content_index, budget_seconds=None):
+    """
+    Synchronous pipeline: drain the listing, then run the admitted files shortest-first on a thread pool.
+    Returns (batch, results).
+    """
+    batch = AudioBatch()
+    admitted, deferred = plan_batch(pdb, batch, pdb.iter_new_files(), budget_seconds)
+    results = process_audio_files(file_handler, admitted, content_index)
+    settle_batch(pdb, admitted, results, deferred)
+    results += [deferred_result(entry, budget_seconds) for entry in deferred] + batch.duplicates
+    return batch, results
+
+def enqueue_new_files(pdb, work_queue, flush_size=10):
+    """
+    Webhook fast path: drain the change feed and enqueue one job per audio file without processing anything.
+    Buffered jobs are flushed before every cursor commit, so a saved cursor never covers an unqueued file.
+    Returns (batch, number of jobs enqueued).
+    """
+    batch = AudioBatch()
+    pending = []
+    enqueued = 0
+
+    def flush():
+        nonlocal enqueued
+        if pending:
+            work_queue.enqueue(pending)
+            enqueued += len(pending)
+            pending.clear()
+
+    for entry in pdb.iter_new_files(before_commit=flush):
+        if batch.select(entry):
+            pending.append(make_job(entry))
+            if len(pending) >= flush_size:
+                flush()
+    flush()
+    return batch, enqueued
@@ -0,0 +1,336 @@
+import os
+import time
+import asyncio
+import random
+import threading
+from contextlib import contextmanager, asynccontextmanager, ExitStack, AsyncExitStack
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import metrics
+
+RETRY_MAX_ATTEMPTS = int(os.environ.get('RETRY_MAX_ATTEMPTS', '5'))
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '1'))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '60'))
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Limiter counters also attributed to the pipeline stage being measured
+STAGE_COUNTERS = {'retries': 'Retries', 'throttled': 'Throttles'}
+
+# Per-upstream budgets: requests per minute, model tokens per minute (OpenAI only) and max concurrent requests
+UPSTREAM_LIMITS = {
+    'dropbox': {
+        'rpm': int(os.environ.get('DROPBOX_RPM', '600')),
+        'concurrency': int(os.environ.get('DROPBOX_CONCURRENCY', '16'))
+    },
+    'deepgram': {
+        'rpm': int(os.environ.get('DEEPGRAM_RPM', '100')),
+        'concurrency': int(os.environ.get('DEEPGRAM_CONCURRENCY', '8'))
+    },
+    'openai': {
+        'rpm': int(os.environ.get('OPENAI_RPM', '500')),
+        'tpm': int(os.environ.get('OPENAI_TPM', '450000')),
+        'concurrency': int(os.environ.get('OPENAI_CONCURRENCY', '8'))
+    },
+    'slack': {
+        'rpm': int(os.environ.get('SLACK_RPM', '60')),
+        'concurrency': int(os.environ.get('SLACK_CONCURRENCY', '1'))
+    }
+}
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at ``per_minute`` tokens per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, amount=1):
+        """Take ``amount`` tokens if available and return 0, otherwise return the seconds until they will be"""
+        amount = min(float(amount), self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0.0
+            return (amount - self.tokens) / self.rate
+
+    def acquire(self, amount=1):
+        """Block until ``amount`` tokens are available and take them; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if not delay:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self, amount=1):
+        waited = 0.0
+        while True:
+            delay = self.try_acquire(amount)
+            if not delay:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+class AdaptiveConcurrency:
+    """AIMD concurrency limit: halve on throttling, grow back by one slot per window of successes"""
+
+    def __init__(self, max_limit):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def try_acquire(self):
+        with self._cond:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    async def acquire_async(self, poll_interval=0.05):
+        while not self.try_acquire():
+            await asyncio.sleep(poll_interval)
+
+    def release(self, throttled=False):
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+def _status_code(exc):
+    for value in (getattr(exc, 'status_code', None), getattr(exc, 'status', None),
+                  getattr(getattr(exc, 'response', None), 'status_code', None)):
+        try:
+            if value is not None:
+                return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _retry_after(exc):
+    headers = getattr(getattr(exc, 'response', None), 'headers', None)
+    value = headers.get('Retry-After') if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+def classify_error(exc):
+    """Return (retryable, throttled, retry_after_seconds) for an exception raised by an upstream call"""
+    status = _status_code(exc)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES, status in (429, 503), _retry_after(exc)
+    name = type(exc).__name__
+    # Network-level failures from httpx, openai (APIConnectionError/APITimeoutError) and the Deepgram SDK
+    transient = any(word in name for word in ('Timeout', 'Connect', 'Network', 'Protocol', 'ReadError'))
+    return transient, False, None
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after + random.uniform(0, RETRY_BASE_DELAY))
+    return delay
+
+class UpstreamLimiter:
+    """Rate, token and concurrency budget plus retry scheduling for one upstream API"""
+
+    def __init__(self, name, rpm, tpm=None, concurrency=8, max_attempts=RETRY_MAX_ATTEMPTS):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(concurrency)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'throttle_waits': 0,
+            'throttle_wait_seconds': 0.0,
+            'retries': 0,
+            'throttled': 0,
+            'failures': 0
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+        if key in STAGE_COUNTERS:
+            metrics.add(**{STAGE_COUNTERS[key]: amount})
+
+    def throttle(self, tokens=0):
+        """Wait for request (and token) budget without taking a concurrency slot"""
+        waited = self.requests.acquire()
+        if self.tokens is not None and tokens:
+            waited += self.tokens.acquire(tokens)
+        if waited:
+            self._count('throttle_waits')
+            self._count('throttle_wait_seconds', waited)
+
+    def _failed(self, e, attempt):
+        """
+        Record a failed attempt (``attempt`` counts from 1) and return (throttled, seconds to wait before the next
+        one); the delay is None when ``e`` is not retryable or the attempts are used up.
+        """
+        retryable, throttled, retry_after = classify_error(e)
+        if throttled:
+            self._count('throttled')
+        if not retryable or attempt >= self.max_attempts:
+            self._count('failures')
+            return throttled, None
+        delay = backoff_delay(attempt, retry_after)
+        self._count('retries')
+        print(f"{self.name} request failed ({str(e)}), retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+        return throttled, delay
+
+    def call(self, fn, *args, tokens=0, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` within this upstream's budgets, retrying transient failures with jittered
+        exponential backoff that honors Retry-After. Re-raises the last error once attempts run out.
+        """
+        attempt = 0
+        while True:
+            self.throttle(tokens)
+            self.concurrency.acquire()
+            self._count('requests')
+            throttled = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                throttled, delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.concurrency.release(throttled)
+            time.sleep(delay)
+
+    @contextmanager
+    def stream(self, open_stream):
+        """
+        Open a streaming response like call() runs a request (budgets, retries on throttling, 5xx and connection
+        errors) and hold the concurrency slot until the body has been read. ``open_stream()`` returns an httpx
+        stream context manager; a non-2xx status is raised before any of the body is read.
+        """
+        attempt = 0
+        while True:
+            self.throttle()
+            self.concurrency.acquire()
+            self._count('requests')
+            stack = ExitStack()
+            try:
+                response = stack.enter_context(open_stream())
+                response.raise_for_status()
+            except Exception as e:
+                stack.close()
+                attempt += 1
+                throttled, delay = self._failed(e, attempt)
+                self.concurrency.release(throttled)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+            try:
+                yield response
+            finally:
+                stack.close()
+                self.concurrency.release()
+            return
+
+    async def throttle_async(self, tokens=0):
+        waited = await self.requests.acquire_async()
+        if self.tokens is not None and tokens:
+            waited += await self.tokens.acquire_async(tokens)
+        if waited:
+            self._count('throttle_waits')
+            self._count('throttle_wait_seconds', waited)
+
+    async def call_async(self, fn, *args, tokens=0, **kwargs):
+        """Async counterpart of call(): ``fn`` returns an awaitable and waits never block the event loop"""
+        attempt = 0
+        while True:
+            await self.throttle_async(tokens)
+            await self.concurrency.acquire_async()
+            self._count('requests')
+            throttled = False
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                attempt += 1
+                throttled, delay = self._failed(e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                self.concurrency.release(throttled)
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream_async(self, open_stream):
+        """Async counterpart of stream(); ``open_stream()`` returns an async httpx stream context manager"""
+        attempt = 0
+        while True:
+            await self.throttle_async()
+            await self.concurrency.acquire_async()
+            self._count('requests')
+            stack = AsyncExitStack()
+            try:
+                response = await stack.enter_async_context(open_stream())
+                response.raise_for_status()
+            except Exception as e:
+                await stack.aclose()
+                attempt += 1
+                throttled, delay = self._failed(e, attempt)
+                self.concurrency.release(throttled)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            try:
+                yield response
+            finally:
+                await stack.aclose()
+                self.concurrency.release()
+            return
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters['throttle_wait_seconds'] = round(counters['throttle_wait_seconds'], 3)
+        counters['concurrency_limit'] = int(self.concurrency.limit)
+        return counters
+
+_limiters = {}
+_registry_lock = threading.Lock()
+
+def get_limiter(name):
+    """Process-wide limiter for an upstream ('dropbox', 'deepgram', 'openai' or 'slack')"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                limiter = UpstreamLimiter(name, **UPSTREAM_LIMITS[name])
+                _limiters[name] = limiter
+    return limiter
+
+def limiter_metrics():
+    return {name: limiter.snapshot() for name, limiter in _limiters.items()}
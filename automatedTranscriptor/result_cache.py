@@ -0,0 +1,92 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', '/tmp/result_cache')
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+def make_key(*parts):
+    """Stable cache key for any JSON-serializable combination of inputs"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """
+    JSON-file cache with TTL expiry and least-recently-used eviction once the namespace exceeds ``max_bytes``.
+    Point RESULT_CACHE_DIR at shared storage (e.g. EFS) to keep entries across containers; the /tmp default
+    only survives for the life of a warm container.
+    """
+
+    def __init__(self, namespace, directory=RESULT_CACHE_DIR, ttl_seconds=RESULT_CACHE_TTL,
+                 max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.directory = os.path.join(directory, namespace)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        if time.time() - entry.get('stored_at', 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path)  # mark as recently used for eviction
+        except OSError:
+            pass
+        return entry.get('value')
+
+    def put(self, key, value):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({'stored_at': time.time(), 'value': value}, f)
+            os.replace(tmp_path, path)
+            self.evict()
+        except OSError as e:
+            print(f"Error writing cache entry {key}: {str(e)}")
+
+    def evict(self):
+        """Drop expired entries, then least-recently-used ones until the namespace fits in max_bytes"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.directory):
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
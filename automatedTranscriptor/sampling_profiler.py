@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import threading
+
+# Periodically sample every thread's stack during an invocation and log the hottest ones
+PROFILE_SAMPLING = os.environ.get('PROFILE_SAMPLING', 'false').lower() == 'true'
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', '10'))
+PROFILE_TOP_STACKS = int(os.environ.get('PROFILE_TOP_STACKS', '25'))
+PROFILE_MAX_DEPTH = int(os.environ.get('PROFILE_MAX_DEPTH', '40'))
+
+class SamplingProfiler:
+    """
+    Low-overhead wall-clock profiler: a daemon thread reads ``sys._current_frames()`` every ``interval`` seconds
+    and counts collapsed stacks (``file:function:line;...``, outermost first), so time blocked on I/O shows up
+    as well as CPU time. ``report()`` returns the most frequent stacks in flame-graph "collapsed" form.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL_MS / 1000.0, max_depth=PROFILE_MAX_DEPTH):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = None
+
+    def _collapse(self, frame):
+        parts = []
+        while frame is not None and len(parts) < self.max_depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ";".join(reversed(parts))
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = self._collapse(frame)
+                self.counts[stack] = self.counts.get(stack, 0) + 1
+            self.samples += 1
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def report(self, top=PROFILE_TOP_STACKS):
+        hottest = sorted(self.counts.items(), key=lambda item: -item[1])[:top]
+        return {
+            'samples': self.samples,
+            'interval_ms': round(self.interval * 1000, 2),
+            'seconds': round(time.perf_counter() - self._started, 3) if self._started else 0.0,
+            'stacks': [{'count': count, 'stack': stack} for stack, count in hottest]
+        }
+
+def start_profiling():
+    """Start a profiler if PROFILE_SAMPLING is on; returns it (or None) for ``report_profile``"""
+    return SamplingProfiler().start() if PROFILE_SAMPLING else None
+
+def report_profile(profiler, invocation_id=None):
+    if profiler is None:
+        return
+    profiler.stop()
+    print(json.dumps({'profile': profiler.report(), 'InvocationId': invocation_id}))
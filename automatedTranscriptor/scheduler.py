@@ -0,0 +1,75 @@
+import os
+import heapq
+
+# Shortest-job-first admission: files are ordered by estimated processing time and only those expected to finish
+# inside the invocation's remaining time are started; the rest are deferred to a later invocation.
+SCHEDULING = os.environ.get('SCHEDULING', 'sjf').lower()
+# Fixed per-file cost (link/download, analysis, Slack) and processing seconds per second of audio
+JOB_OVERHEAD_SECONDS = float(os.environ.get('JOB_OVERHEAD_SECONDS', '20'))
+PROCESSING_SECONDS_PER_AUDIO_SECOND = float(os.environ.get('PROCESSING_SECONDS_PER_AUDIO_SECOND', '0.05'))
+# Time kept back at the end of an invocation for cursor commits, reporting and slow stragglers
+DEADLINE_MARGIN_SECONDS = float(os.environ.get('DEADLINE_MARGIN_SECONDS', '60'))
+
+# Typical encoded bytes per second of audio, used when the listing carries no duration
+BYTES_PER_AUDIO_SECOND = {
+    '.wav': 176400, '.pcm': 32000, '.flac': 90000,
+    '.mp3': 16000, '.mp2': 24000, '.aac': 16000, '.m4a': 16000,
+    '.ogg': 12000, '.opus': 8000, '.webm': 16000, '.mp4': 100000,
+}
+DEFAULT_BYTES_PER_AUDIO_SECOND = 16000
+
+def estimate_audio_seconds(entry):
+    """Audio duration of a list_folder entry: its media_info duration if present, else guessed from size and type"""
+    media_info = entry.get('media_info') or {}
+    duration_ms = (media_info.get('metadata') or {}).get('duration')
+    if duration_ms:
+        return duration_ms / 1000
+    size = entry.get('size')
+    if size is None:
+        return None
+    extension = os.path.splitext(entry.get('path_display', ''))[1].lower()
+    return size / BYTES_PER_AUDIO_SECOND.get(extension, DEFAULT_BYTES_PER_AUDIO_SECOND)
+
+def estimate_cost(entry):
+    """Estimated wall-clock seconds to process one entry; unknown sizes count as the default one-hour meeting"""
+    audio_seconds = estimate_audio_seconds(entry)
+    if audio_seconds is None:
+        audio_seconds = 3600
+    return JOB_OVERHEAD_SECONDS + audio_seconds * PROCESSING_SECONDS_PER_AUDIO_SECOND
+
+def remaining_seconds(context):
+    """Time budget for new work from the Lambda context, or None when running without one"""
+    get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+    if get_remaining is None:
+        return None
+    return get_remaining() / 1000 - DEADLINE_MARGIN_SECONDS
+
+def schedule(entries, budget_seconds=None, slots=1):
+    """
+    Order entries shortest-job-first and split them into (admitted, deferred).
+
+    Admission simulates ``slots`` concurrent workers each taking the next job as it frees up; a job is admitted
+    if it is expected to finish within ``budget_seconds``. The shortest job is always admitted so a backlog of
+    long files still makes progress. Without a budget everything is admitted.
+    """
+    if SCHEDULING != 'sjf':
+        return list(entries), []
+    ordered = sorted(entries, key=estimate_cost)
+    if budget_seconds is None:
+        return ordered, []
+
+    admitted, deferred = [], []
+    finish_times = [0.0] * max(1, slots)
+    for entry in ordered:
+        finish = finish_times[0] + estimate_cost(entry)
+        if finish <= budget_seconds or not admitted:
+            heapq.heapreplace(finish_times, finish)
+            admitted.append(entry)
+        else:
+            deferred.append(entry)
+    return admitted, deferred
+
+def deferred_result(entry, budget_seconds):
+    return {'file': entry['path_display'], 'status': 'deferred',
+            'message': f"Estimated {estimate_cost(entry):.0f}s does not fit in the remaining "
+                       f"{max(0, budget_seconds or 0):.0f}s; deferred to the next invocation"}
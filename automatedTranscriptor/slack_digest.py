@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+import metrics
+from slack_notifier import deliver, build_slack_messages, build_digest_messages, summary_attachments
+
+# 'direct' posts each summary as soon as it is ready; 'digest' hands it to a background queue that combines
+# meetings finishing close together into one message
+SLACK_DELIVERY = os.environ.get('SLACK_DELIVERY', 'direct').lower()
+SLACK_DIGEST_WINDOW_SECONDS = float(os.environ.get('SLACK_DIGEST_WINDOW_SECONDS', '30'))
+SLACK_DIGEST_MAX_MEETINGS = int(os.environ.get('SLACK_DIGEST_MAX_MEETINGS', '10'))
+
+class SlackDigestQueue:
+    """
+    Summaries waiting to be posted by a background thread. A digest goes out once ``max_meetings`` are waiting or
+    the oldest has waited ``window`` seconds; posts go through the 'slack' rate limiter, so a burst of meetings is
+    paced to Slack's limits without holding up the pipeline. ``flush`` sends everything still waiting and returns
+    once it has been delivered (or has failed). Only a delivered summary counts as sent. When a digest split across
+    several messages fails part way, the meetings in the parts already posted count as sent; the rest report how
+    many of their attachments went out, so their retry posts only what is missing.
+    """
+
+    def __init__(self, window=SLACK_DIGEST_WINDOW_SECONDS, max_meetings=SLACK_DIGEST_MAX_MEETINGS):
+        self.window = window
+        self.max_meetings = max(1, max_meetings)
+        self._pending = []
+        self._in_flight = 0
+        self._flushing = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, meeting_summary, audio_file, on_sent=None, on_failed=None, sent_attachments=0):
+        """
+        Queue a summary, leaving out the first ``sent_attachments`` an earlier attempt delivered. Once its digest has
+        gone out, ``on_sent()`` runs on the sender thread; if posting it failed, ``on_failed(sent_attachments)``
+        runs instead with the number of its attachments delivered so far.
+        """
+        with self._condition:
+            self._pending.append((time.monotonic(), meeting_summary, audio_file, on_sent, on_failed,
+                                  sent_attachments))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='slack-digest', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                return self._condition.wait_for(lambda: not self._pending and not self._in_flight, timeout)
+            finally:
+                self._flushing -= 1
+
+    def _wait_time(self):
+        """Seconds until the next digest is due, 0 if it is due now, None while nothing is waiting"""
+        if not self._pending:
+            return None
+        if self._flushing or len(self._pending) >= self.max_meetings:
+            return 0
+        return max(0.0, self._pending[0][0] + self.window - time.monotonic())
+
+    def _run(self):
+        while True:
+            with self._condition:
+                wait = self._wait_time()
+                while wait != 0:
+                    self._condition.wait(wait)
+                    wait = self._wait_time()
+                batch = self._pending[:self.max_meetings]
+                del self._pending[:self.max_meetings]
+                self._in_flight += 1
+            try:
+                self._send(batch)
+            finally:
+                with self._condition:
+                    self._in_flight -= 1
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _messages(batch):
+        """The digest's messages and, per meeting, how many of its attachments they carry"""
+        if len(batch) == 1:
+            _, meeting_summary, audio_file, _, _, sent_attachments = batch[0]
+            slack_messages = build_slack_messages(meeting_summary, audio_file, sent_attachments)
+        else:
+            slack_messages = build_digest_messages([(meeting_summary, audio_file, sent_attachments)
+                                                    for _, meeting_summary, audio_file, _, _, sent_attachments
+                                                    in batch])
+        counts = [max(0, len(summary_attachments(meeting_summary)) - sent_attachments)
+                  for _, meeting_summary, _, _, _, sent_attachments in batch]
+        return slack_messages, counts
+
+    def _send(self, batch):
+        slack_messages, counts = self._messages(batch)
+        posted = 0
+
+        def delivered(slack_message):
+            nonlocal posted
+            posted += len(slack_message["attachments"])
+
+        with metrics.stage('slack_digest', Meetings=len(batch)) as record:
+            if deliver(slack_messages, delivered):
+                print(f"Slack digest of {len(batch)} meetings sent in {len(slack_messages)} messages")
+            else:
+                record.status = 'failed'
+        # Attachments went out in order, so the first ``posted`` of them are delivered
+        for (_, _, audio_file, on_sent, on_failed, sent_attachments), count in zip(batch, counts):
+            delivered_now = min(posted, count)
+            posted -= delivered_now
+            try:
+                if delivered_now == count:
+                    if on_sent is not None:
+                        on_sent()
+                elif on_failed is not None:
+                    on_failed(sent_attachments + delivered_now)
+            except Exception as e:
+                print(f"Error recording Slack delivery for {audio_file}: {str(e)}")
+
+_digest_queue = None
+_digest_lock = threading.Lock()
+
+def get_digest_queue():
+    """The container's digest queue, or None when SLACK_DELIVERY is not 'digest'"""
+    global _digest_queue
+    if SLACK_DELIVERY != 'digest':
+        return None
+    with _digest_lock:
+        if _digest_queue is None:
+            _digest_queue = SlackDigestQueue()
+    return _digest_queue
+
+def flush_notifications():
+    """Deliver every queued summary; call before the invocation returns, as a frozen container sends nothing"""
+    if _digest_queue is not None:
+        _digest_queue.flush()
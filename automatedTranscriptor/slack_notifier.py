@@ -1,36 +1,275 @@
 import os
-import requests
+import httpx
 import json
+import asyncio
+from http_transport import post_with_retry, post_with_retry_async
 
 SLACK_WEBHOOK_URL: str = os.environ.get('SLACK_WEBHOOK_URL', '')
+# With a bot token (chat:write) and channel, messages go through the Web API and can be edited in place
+SLACK_BOT_TOKEN: str = os.environ.get('SLACK_BOT_TOKEN', '')
+SLACK_CHANNEL: str = os.environ.get('SLACK_CHANNEL', '')
+SLACK_API_URL: str = os.environ.get('SLACK_API_URL', 'https://slack.com/api').rstrip('/')
+USE_WEB_API = bool(SLACK_BOT_TOKEN and SLACK_CHANNEL)
 
-if not SLACK_WEBHOOK_URL:
+if not SLACK_WEBHOOK_URL and not USE_WEB_API:
     raise ValueError("SLACK_WEBHOOK_URL environment variable is not set")
 
-def send_slack_notification(meeting_summary, first_audio_file):
-    slack_message = {
+# Slack truncates or rejects very long messages, so longer summaries are split across several
+SLACK_MAX_MESSAGE_CHARS = int(os.environ.get('SLACK_MAX_MESSAGE_CHARS', '12000'))
+SLACK_MAX_FIELD_CHARS = int(os.environ.get('SLACK_MAX_FIELD_CHARS', '3000'))
+SLACK_MAX_ATTACHMENTS = 20
+
+SECTION_TITLES = ("List of attendees", "Meeting Summary", "Action Items", "Quote/Proposal Updates",
+                  "Pricing Updates/Key Dates")
+PENDING = "_Still being extracted..._"
+
+class SlackAPIError(Exception):
+    """The Web API answered HTTP 200 with ok=false"""
+
+def build_slack_message(meeting_summary, first_audio_file):
+    return {
         "text": f"Meeting Summary has been generated from: {first_audio_file}",
         "attachments": [
             {
-                "fields": [
-                    {"title": "List of attendees", "value": meeting_summary["List of attendees"]},
-                    {"title": "Meeting Summary", "value": meeting_summary["Meeting Summary"]},
-                    {"title": "Action Items", "value": meeting_summary["Action Items"]},
-                    {"title": "Quote/Proposal Updates", "value": meeting_summary["Quote/Proposal Updates"]},
-                    {"title": "Pricing Updates/Key Dates", "value": meeting_summary["Pricing Updates/Key Dates"]},
-                ]
+                "fields": [{"title": title, "value": meeting_summary.get(title, PENDING)} for title in SECTION_TITLES]
             }
         ]
     }
 
-    try:
-        response = requests.post(SLACK_WEBHOOK_URL, data=json.dumps(slack_message), headers={'Content-Type': 'application/json'})
-        response.raise_for_status()
-        print("Slack notification sent successfully")
-    except requests.exceptions.RequestException as e:
+def split_text(value, limit):
+    """Split ``value`` into pieces of at most ``limit`` characters, preferring line and then word boundaries"""
+    pieces = []
+    while len(value) > limit:
+        cut = value.rfind("\n", 0, limit + 1)
+        if cut <= 0:
+            cut = value.rfind(" ", 0, limit + 1)
+        if cut <= 0:
+            cut = limit
+        pieces.append(value[:cut].rstrip())
+        value = value[cut:].lstrip()
+    if value or not pieces:
+        pieces.append(value)
+    return pieces
+
+def _summary_fields(meeting_summary):
+    """Attachment fields for a summary; a section longer than SLACK_MAX_FIELD_CHARS continues in further fields"""
+    fields = []
+    for title in SECTION_TITLES:
+        for i, piece in enumerate(split_text(meeting_summary.get(title, PENDING), SLACK_MAX_FIELD_CHARS)):
+            fields.append({"title": title if i == 0 else f"{title} (cont.)", "value": piece})
+    return fields
+
+def _size(attachment):
+    return len(attachment.get("title", "")) + sum(len(f["title"]) + len(f["value"]) for f in attachment["fields"])
+
+def summary_attachments(meeting_summary, title=None):
+    """
+    One attachment per summary, or several when it alone would exceed SLACK_MAX_MESSAGE_CHARS. The split does not
+    depend on ``title``, so a count of delivered attachments holds for both direct posts and digests.
+    """
+    attachments = []
+    current = {"fields": []}
+    for field in _summary_fields(meeting_summary):
+        if current["fields"] and _size(current) + len(field["title"]) + len(field["value"]) > SLACK_MAX_MESSAGE_CHARS:
+            attachments.append(current)
+            current = {"fields": []}
+        current["fields"].append(field)
+    attachments.append(current)
+    if title:
+        for i, attachment in enumerate(attachments):
+            attachment["title"] = title if i == 0 else f"{title} (cont.)"
+    return attachments
+
+def pack_messages(text, attachments):
+    """Group attachments into as few messages as Slack's size and attachment-count limits allow"""
+    groups = [[]]
+    size = 0
+    for attachment in attachments:
+        if groups[-1] and (size + _size(attachment) > SLACK_MAX_MESSAGE_CHARS
+                           or len(groups[-1]) >= SLACK_MAX_ATTACHMENTS):
+            groups.append([])
+            size = 0
+        groups[-1].append(attachment)
+        size += _size(attachment)
+    if len(groups) == 1:
+        return [{"text": text, "attachments": groups[0]}]
+    return [{"text": f"{text} (part {i} of {len(groups)})", "attachments": group}
+            for i, group in enumerate(groups, 1)]
+
+def build_slack_messages(meeting_summary, first_audio_file, sent_attachments=0):
+    """
+    build_slack_message, split into several messages when the summary is too long for one. The first
+    ``sent_attachments`` were delivered by an earlier attempt and are left out; nothing is left once all were.
+    """
+    attachments = summary_attachments(meeting_summary)[sent_attachments:]
+    if not attachments:
+        return []
+    text = f"Meeting Summary has been generated from: {first_audio_file}"
+    return pack_messages(f"{text} (continued)" if sent_attachments else text, attachments)
+
+def build_digest_messages(summaries):
+    """
+    Digest of several ``(meeting_summary, audio_file, sent_attachments)`` triples, one titled attachment per meeting
+    less the attachments an earlier attempt delivered
+    """
+    attachments = [a for meeting_summary, audio_file, sent_attachments in summaries
+                   for a in summary_attachments(meeting_summary, audio_file)[sent_attachments:]]
+    if not attachments:
+        return []
+    return pack_messages(f"Meeting Summaries have been generated for {len(summaries)} recordings", attachments)
+
+def _report_failure(e):
+    if isinstance(e, httpx.HTTPError):
         print(f"Failed to send Slack notification: {e}")
-        if hasattr(e, 'response') and e.response:
+        if isinstance(e, httpx.HTTPStatusError):
             print(f"Response status code: {e.response.status_code}")
             print(f"Response text: {e.response.text}")
+    else:
+        print(f"An unexpected error occurred while sending Slack notification: {e}")
+
+def _web_api_request(method, payload):
+    headers = {'Content-Type': 'application/json; charset=utf-8', 'Authorization': f'Bearer {SLACK_BOT_TOKEN}'}
+    return f"{SLACK_API_URL}/{method}", {'content': json.dumps(payload), 'headers': headers}
+
+def _web_api_result(response):
+    body = response.json()
+    if not body.get('ok'):
+        raise SlackAPIError(body.get('error', 'unknown error'))
+    return body
+
+def _post_request(slack_message):
+    if USE_WEB_API:
+        return _web_api_request('chat.postMessage', {'channel': SLACK_CHANNEL, **slack_message})
+    return SLACK_WEBHOOK_URL, {'content': json.dumps(slack_message), 'headers': {'Content-Type': 'application/json'}}
+
+def deliver(slack_messages, on_delivered=None):
+    """
+    Post messages in order through the 'slack' rate limiter; returns False (after logging) on the first failure.
+    ``on_delivered(slack_message)`` runs after each message that was posted.
+    """
+    try:
+        for slack_message in slack_messages:
+            url, kwargs = _post_request(slack_message)
+            response = post_with_retry('slack', url, **kwargs)
+            if USE_WEB_API:
+                _web_api_result(response)
+            if on_delivered:
+                on_delivered(slack_message)
+        return True
+    except Exception as e:
+        _report_failure(e)
+        return False
+
+async def deliver_async(slack_messages, on_delivered=None):
+    try:
+        for slack_message in slack_messages:
+            url, kwargs = _post_request(slack_message)
+            response = await post_with_retry_async('slack', url, **kwargs)
+            if USE_WEB_API:
+                _web_api_result(response)
+            if on_delivered:
+                await asyncio.to_thread(on_delivered, slack_message)
+        return True
     except Exception as e:
-        print(f"An unexpected error occurred while sending Slack notification: {e}")
\ No newline at end of file
+        _report_failure(e)
+        return False
+
+def _progress_recorder(slack_messages, sent_attachments, on_progress):
+    """
+    on_delivered callback passing ``on_progress`` the number of the summary's attachments posted so far, so a
+    retry after a failed part posts only the rest. A summary that fits one message has no progress to record.
+    """
+    if on_progress is None or len(slack_messages) < 2:
+        return None
+    sent = sent_attachments
+
+    def delivered(slack_message):
+        nonlocal sent
+        sent += len(slack_message["attachments"])
+        on_progress(sent)
+    return delivered
+
+def send_slack_notification(meeting_summary, first_audio_file, sent_attachments=0, on_progress=None):
+    """
+    Post a summary, resuming after the ``sent_attachments`` an earlier attempt delivered; returns True once every
+    part was delivered, False (after logging) otherwise. ``on_progress(sent_attachments)`` records a split
+    summary's progress.
+    """
+    slack_messages = build_slack_messages(meeting_summary, first_audio_file, sent_attachments)
+    if deliver(slack_messages, _progress_recorder(slack_messages, sent_attachments, on_progress)):
+        print("Slack notification sent successfully")
+        return True
+    return False
+
+async def send_slack_notification_async(meeting_summary, first_audio_file, sent_attachments=0, on_progress=None):
+    slack_messages = build_slack_messages(meeting_summary, first_audio_file, sent_attachments)
+    if await deliver_async(slack_messages, _progress_recorder(slack_messages, sent_attachments, on_progress)):
+        print("Slack notification sent successfully")
+        return True
+    return False
+
+class ProgressiveSlackMessage:
+    """
+    One Slack message for a summary whose sections arrive one at a time. The first ``publish`` posts it with the
+    missing sections marked as pending; later ones edit it in place (chat.update). A webhook cannot edit, so
+    without a bot token only the first partial post and the final summary are sent, as two messages.
+    ``channel``/``ts`` resume a message posted by an earlier attempt; ``on_posted(channel, ts)`` records a new one.
+    """
+
+    def __init__(self, first_audio_file, channel=None, ts=None, on_posted=None):
+        self.first_audio_file = first_audio_file
+        self.channel = channel
+        self.ts = ts
+        self.on_posted = on_posted
+        self.posted = ts is not None
+
+    def _request(self, meeting_summary, final):
+        """(url, kwargs) for the next delivery, or None when this update cannot be shown"""
+        slack_message = build_slack_message(meeting_summary, self.first_audio_file)
+        if USE_WEB_API and self.ts is not None:
+            return _web_api_request('chat.update', {'channel': self.channel, 'ts': self.ts, **slack_message})
+        if USE_WEB_API or not self.posted or final:
+            return _post_request(slack_message)
+        return None
+
+    def _delivered(self, response):
+        """Returns (channel, ts) when this delivery created the editable message"""
+        self.posted = True
+        if USE_WEB_API and self.ts is None:
+            body = _web_api_result(response)
+            self.channel, self.ts = body['channel'], body['ts']
+            return self.channel, self.ts
+        if USE_WEB_API:
+            _web_api_result(response)
+        return None
+
+    def publish(self, meeting_summary, final=False):
+        """Returns False if the update could not be delivered (a skipped intermediate update counts as done)"""
+        request = self._request(meeting_summary, final)
+        if request is None:
+            return True
+        try:
+            url, kwargs = request
+            created = self._delivered(post_with_retry('slack', url, **kwargs))
+            if created and self.on_posted:
+                self.on_posted(*created)
+            print(f"Slack notification {'completed' if final else 'updated'} for {self.first_audio_file}")
+            return True
+        except Exception as e:
+            _report_failure(e)
+            return False
+
+    async def publish_async(self, meeting_summary, final=False):
+        request = self._request(meeting_summary, final)
+        if request is None:
+            return True
+        try:
+            url, kwargs = request
+            created = self._delivered(await post_with_retry_async('slack', url, **kwargs))
+            if created and self.on_posted:
+                await asyncio.to_thread(self.on_posted, *created)
+            print(f"Slack notification {'completed' if final else 'updated'} for {self.first_audio_file}")
+            return True
+        except Exception as e:
+            _report_failure(e)
+            return False
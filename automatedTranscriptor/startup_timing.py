@@ -0,0 +1,29 @@
+import json
+import time
+from contextlib import contextmanager
+
+_steps = []
+_reported = False
+
+@contextmanager
+def timed(step):
+    """Record how long an import or init step takes, for the cold-start report"""
+    if _reported:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _steps.append((step, round((time.perf_counter() - start) * 1000, 2)))
+
+def report_startup():
+    """Print the cold-start breakdown once per container (on its first invocation)"""
+    global _reported
+    if _reported:
+        return
+    _reported = True
+    print(json.dumps({
+        'startup_timing_ms': dict(_steps),
+        'startup_total_ms': round(sum(ms for _, ms in _steps), 2)
+    }))
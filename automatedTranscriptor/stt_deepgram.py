@@ -1,45 +1,219 @@
 import os
-from deepgram import DeepgramClient, PrerecordedOptions, FileSource
+import asyncio
+import threading
+import aiofiles
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+import metrics
+from rate_limiter import get_limiter
+from result_cache import ResultCache, make_key
+from startup_timing import timed
+from transcript import Transcript, stitch_segments
+from audio_segments import AudioSource, is_segmentable, plan_segments
+
+if TYPE_CHECKING:
+    from deepgram import FileSource, UrlSource
 
-output_path = "/tmp/transcription.txt"
 deepgram_api_key = os.getenv('DEEPGRAM_API_KEY')
+# Optional API host override (e.g. the benchmark harness's local stand-in)
+DEEPGRAM_API_URL = os.getenv('DEEPGRAM_API_URL')
+_deepgram_client = None
+_client_lock = threading.Lock()
+# (audio hash, PrerecordedOptions) -> utterance list
+transcript_cache = ResultCache('transcripts')
 
-def format_time(seconds):
-    """Convert seconds to HH:MM:SS format"""
-    hours, remainder = divmod(seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
+# Long WAV/PCM recordings are split into overlapping windows that are transcribed concurrently and stitched
+SEGMENTED_TRANSCRIPTION = os.environ.get('SEGMENTED_TRANSCRIPTION', 'false').lower() == 'true'
+SEGMENT_SECONDS = float(os.environ.get('SEGMENT_SECONDS', '600'))
+SEGMENT_OVERLAP_SECONDS = float(os.environ.get('SEGMENT_OVERLAP_SECONDS', '30'))
+SEGMENT_MIN_SECONDS = float(os.environ.get('SEGMENT_MIN_SECONDS', '1200'))
+SEGMENT_PARALLELISM = int(os.environ.get('SEGMENT_PARALLELISM', '4'))
 
-def speech_to_text(audio_input_path):
-    try:
-        deepgram_client = DeepgramClient(deepgram_api_key)
+def get_deepgram_client():
+    """Import the Deepgram SDK and build the client on first use, then reuse it across warm invocations"""
+    global _deepgram_client
+    if _deepgram_client is None:
+        with _client_lock:
+            if _deepgram_client is None:
+                with timed('import deepgram'):
+                    from deepgram import DeepgramClient, DeepgramClientOptions
+                with timed('init Deepgram client'):
+                    config = DeepgramClientOptions(url=DEEPGRAM_API_URL) if DEEPGRAM_API_URL else None
+                    _deepgram_client = DeepgramClient(deepgram_api_key, config)
+    return _deepgram_client
 
-        with open(audio_input_path, "rb") as file:
-            buffer_data = file.read()
-
-        source: FileSource = {"buffer": buffer_data}
-
-        options = PrerecordedOptions(
-            model="nova-2-meeting",
-            detect_language=True,
-            diarize=True,
-            utterances=True,
-            smart_format=True,
-            paragraphs=True,
-            utt_split=3
-        )
-        
-        response = deepgram_client.listen.rest.v("1").transcribe_file(source, options)
-
-        with open(output_path, "w", encoding="utf-8") as txtfile:
-            for utterance in response.results.utterances:
-                start_time = format_time(utterance.start)
-                end_time = format_time(utterance.end)
-                txtfile.write(f"[{start_time} - {end_time}] [Speaker:{utterance.speaker}] {utterance.transcript}\n")
-
-        print(f"Results have been saved to the text file: {output_path}")
-        return output_path, 200
+def _options():
+    from deepgram import PrerecordedOptions
+    return PrerecordedOptions(
+        model="nova-2-meeting",
+        detect_language=True,
+        diarize=True,
+        utterances=True,
+        smart_format=True,
+        paragraphs=True,
+        utt_split=3
+    )
+
+def _transcript_from(response):
+    metrics.add(AudioSeconds=getattr(getattr(response, 'metadata', None), 'duration', None))
+    return Transcript.from_deepgram(response)
+
+def _cache_key(audio_hash, options):
+    return make_key(audio_hash, options.to_dict())
+
+def _from_cache(audio_hash, options):
+    if not audio_hash:
+        return None
+    utterances = transcript_cache.get(_cache_key(audio_hash, options))
+    if utterances is None:
+        return None
+    print(f"Using cached transcription for audio hash {audio_hash}")
+    return Transcript.from_list(utterances)
+
+def _finish(transcript, audio_hash, options, output_path, cached):
+    if audio_hash and not cached:
+        transcript_cache.put(_cache_key(audio_hash, options), transcript.to_list())
+    if output_path:
+        transcript.save(output_path)
+    return transcript, 200
+
+def prefers_local_file(audio_path):
+    """Segmented transcription reads frames from disk, so such files are downloaded rather than sent by URL"""
+    return SEGMENTED_TRANSCRIPTION and is_segmentable(audio_path)
+
+def _segment_plan(audio_input_path):
+    """Return (AudioSource, [(start, end), ...]) if the file should be transcribed in segments, else (None, None)"""
+    if not prefers_local_file(audio_input_path):
+        return None, None
+    source = AudioSource(audio_input_path)
+    if source.duration <= SEGMENT_MIN_SECONDS:
+        return None, None
+    return source, plan_segments(source.duration, SEGMENT_SECONDS, SEGMENT_OVERLAP_SECONDS)
+
+def _segment_key(audio_hash, options, start, end):
+    return make_key(audio_hash, options.to_dict(), 'segment', start, end)
+
+def _cached_segment(audio_hash, options, start, end):
+    """Segments are cached individually so a retry only re-sends the ones that failed"""
+    if not audio_hash:
+        return None
+    utterances = transcript_cache.get(_segment_key(audio_hash, options, start, end))
+    return Transcript.from_list(utterances) if utterances is not None else None
+
+def _store_segment(part, audio_hash, options, start, end):
+    if audio_hash:
+        transcript_cache.put(_segment_key(audio_hash, options, start, end), part.to_list())
+    return part
+
+def _transcribe_segment(source, start, end, audio_hash, options):
+    part = _cached_segment(audio_hash, options, start, end)
+    if part is not None:
+        return part
+    segment: "FileSource" = {"buffer": source.segment_wav(start, end)}
+    response = get_limiter('deepgram').call(
+        get_deepgram_client().listen.rest.v("1").transcribe_file, segment, options)
+    return _store_segment(Transcript.from_deepgram(response), audio_hash, options, start, end)
 
+def _transcribe_segments(source, segments, audio_hash, options):
+    print(f"Transcribing {source.duration:.0f}s of audio as {len(segments)} overlapping segments")
+    with ThreadPoolExecutor(max_workers=max(1, min(SEGMENT_PARALLELISM, len(segments)))) as executor:
+        parts = list(executor.map(metrics.propagate(
+            lambda segment: _transcribe_segment(source, segment[0], segment[1], audio_hash, options)), segments))
+    return stitch_segments([(start, end, part) for (start, end), part in zip(segments, parts)])
+
+async def _transcribe_segment_async(source, start, end, audio_hash, options):
+    part = _cached_segment(audio_hash, options, start, end)
+    if part is not None:
+        return part
+    segment: "FileSource" = {"buffer": await asyncio.to_thread(source.segment_wav, start, end)}
+    response = await get_limiter('deepgram').call_async(
+        get_deepgram_client().listen.asyncrest.v("1").transcribe_file, segment, options)
+    return _store_segment(Transcript.from_deepgram(response), audio_hash, options, start, end)
+
+async def _transcribe_segments_async(source, segments, audio_hash, options):
+    print(f"Transcribing {source.duration:.0f}s of audio as {len(segments)} overlapping segments")
+    semaphore = asyncio.Semaphore(max(1, SEGMENT_PARALLELISM))
+
+    async def bounded(start, end):
+        async with semaphore:
+            return await _transcribe_segment_async(source, start, end, audio_hash, options)
+
+    parts = await asyncio.gather(*(bounded(start, end) for start, end in segments))
+    return stitch_segments([(start, end, part) for (start, end), part in zip(segments, parts)])
+
+def _transcribe_with(transcribe, audio_hash, output_path):
+    """
+    Shared by the entry points below: return a cached transcript or ``transcribe(options)``, cache it and write it
+    to ``output_path`` if one is given. Returns (Transcript, 200), or None on failure.
+    """
+    try:
+        options = _options()
+        transcript = _from_cache(audio_hash, options)
+        cached = transcript is not None
+        if not cached:
+            transcript = transcribe(options)
+        return _finish(transcript, audio_hash, options, output_path, cached)
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+
+async def _transcribe_with_async(transcribe, audio_hash, output_path):
+    """Async counterpart of _transcribe_with; ``transcribe(options)`` returns an awaitable"""
+    try:
+        options = _options()
+        transcript = _from_cache(audio_hash, options)
+        cached = transcript is not None
+        if not cached:
+            transcript = await transcribe(options)
+        return _finish(transcript, audio_hash, options, output_path, cached)
     except Exception as e:
         print(f"An error occurred: {e}")
         return None
+
+def speech_to_text(audio_input_path, output_path=None, audio_hash=None):
+    """
+    Transcribe a local audio file and return (Transcript, 200), or None on failure.
+    The transcript is only written to ``output_path`` when one is given.
+    """
+    def transcribe(options):
+        source, segments = _segment_plan(audio_input_path)
+        if segments:
+            metrics.add(AudioSeconds=source.duration)
+            return _transcribe_segments(source, segments, audio_hash, options)
+        with open(audio_input_path, "rb") as file:
+            buffer_source: "FileSource" = {"buffer": file.read()}
+        return _transcript_from(get_limiter('deepgram').call(
+            get_deepgram_client().listen.rest.v("1").transcribe_file, buffer_source, options))
+    return _transcribe_with(transcribe, audio_hash, output_path)
+
+def speech_to_text_from_url(audio_url, output_path=None, audio_hash=None):
+    """
+    Let Deepgram fetch the audio itself (e.g. from a Dropbox temporary link),
+    so the recording is never staged in /tmp or held in memory here.
+    """
+    def transcribe(options):
+        url_source: "UrlSource" = {"url": audio_url}
+        return _transcript_from(get_limiter('deepgram').call(
+            get_deepgram_client().listen.rest.v("1").transcribe_url, url_source, options))
+    return _transcribe_with(transcribe, audio_hash, output_path)
+
+async def speech_to_text_async(audio_input_path, output_path=None, audio_hash=None):
+    """Async counterpart of speech_to_text using Deepgram's asyncrest client"""
+    async def transcribe(options):
+        source, segments = await asyncio.to_thread(_segment_plan, audio_input_path)
+        if segments:
+            metrics.add(AudioSeconds=source.duration)
+            return await _transcribe_segments_async(source, segments, audio_hash, options)
+        async with aiofiles.open(audio_input_path, "rb") as file:
+            buffer_source: "FileSource" = {"buffer": await file.read()}
+        return _transcript_from(await get_limiter('deepgram').call_async(
+            get_deepgram_client().listen.asyncrest.v("1").transcribe_file, buffer_source, options))
+    return await _transcribe_with_async(transcribe, audio_hash, output_path)
+
+async def speech_to_text_from_url_async(audio_url, output_path=None, audio_hash=None):
+    """Async counterpart of speech_to_text_from_url"""
+    async def transcribe(options):
+        url_source: "UrlSource" = {"url": audio_url}
+        return _transcript_from(await get_limiter('deepgram').call_async(
+            get_deepgram_client().listen.asyncrest.v("1").transcribe_url, url_source, options))
+    return await _transcribe_with_async(transcribe, audio_hash, output_path)
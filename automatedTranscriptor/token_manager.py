@@ -1,9 +1,20 @@
 import os
 import json
+import time
+import threading
 from datetime import datetime, timedelta
-import requests
-import boto3
+import httpx
 from botocore.exceptions import ClientError
+from dynamodb_tables import get_dynamodb, get_table
+from http_transport import post_with_retry, DROPBOX_API_URL
+
+# Start refreshing in the background once the token is this close to expiry (must exceed the 10 minute validity margin)
+PROACTIVE_REFRESH_SECONDS = int(os.environ.get('TOKEN_PROACTIVE_REFRESH_SECONDS', '1200'))
+REFRESH_LEASE_SECONDS = 10
+
+# Process-level state, kept across warm Lambda invocations
+_token_cache = {}
+_refresh_lock = threading.Lock()
 
 class DropboxTokenManager:
     TABLE_NAME = 'DropboxTokens'
@@ -12,19 +23,11 @@ class DropboxTokenManager:
         self.app_key = os.environ.get('DROPBOX_APP_KEY')
         self.app_secret = os.environ.get('DROPBOX_APP_SECRET')
         self.refresh_token = os.environ.get('DROPBOX_REFRESH_TOKEN')
-        self.dynamodb = boto3.resource('dynamodb')
+        self.dynamodb = get_dynamodb()
         self.table = self.ensure_table_exists()
 
     def ensure_table_exists(self):
-        try:
-            table = self.dynamodb.Table(self.TABLE_NAME)
-            table.load()
-            return table
-        except ClientError as e:
-            if e.response['Error']['Code'] == 'ResourceNotFoundException':
-                return self.create_table()
-            else:
-                raise
+        return get_table(self.TABLE_NAME, self.create_table)
 
     def create_table(self):
         table = self.dynamodb.create_table(
@@ -50,19 +53,89 @@ class DropboxTokenManager:
         return table
 
     def get_access_token(self):
-        token_data = self._read_token_from_dynamodb()
-        if token_data:
-            print(f"Token data read from DynamoDB: {token_data}")
-        if token_data and self._is_token_valid(token_data):
-            print("Using existing valid access token.")
-            return token_data['access_token']
-        else:
+        cached = _token_cache.get('token_data')
+        if cached and self._is_token_valid(cached, log=False):
+            if self._needs_proactive_refresh(cached):
+                self._start_background_refresh()
+            return cached['access_token']
+
+        with _refresh_lock:
+            # Another thread may have refreshed while we waited for the lock.
+            cached = _token_cache.get('token_data')
+            if cached and self._is_token_valid(cached, log=False):
+                return cached['access_token']
+
+            token_data = self._read_token_from_dynamodb()
+            if token_data and self._is_token_valid(token_data):
+                print("Using existing valid access token.")
+                _token_cache['token_data'] = token_data
+                return token_data['access_token']
+
             print("Token is invalid or not found, refreshing access token.")
-            return self._refresh_access_token()
+            return self._refresh_with_lease()
+
+    def _needs_proactive_refresh(self, token_data):
+        expiry = datetime.fromisoformat(token_data['expiry'])
+        return datetime.now() >= expiry - timedelta(seconds=PROACTIVE_REFRESH_SECONDS)
+
+    def _start_background_refresh(self):
+        """Refresh ahead of the 10 minute margin without blocking the caller; at most one refresh runs at a time"""
+        if not _refresh_lock.acquire(blocking=False):
+            return
+
+        def refresh():
+            try:
+                token_data = self._read_token_from_dynamodb()
+                if token_data and self._is_token_valid(token_data, log=False) \
+                        and not self._needs_proactive_refresh(token_data):
+                    # Another container already refreshed it.
+                    _token_cache['token_data'] = token_data
+                else:
+                    self._refresh_with_lease()
+            except Exception as e:
+                print(f"Background token refresh failed: {str(e)}")
+            finally:
+                _refresh_lock.release()
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def _refresh_with_lease(self):
+        """
+        Take a short DynamoDB lease before calling the token endpoint so concurrent containers don't all refresh.
+        Containers that lose the race wait for the winner's token instead.
+        """
+        if not self._acquire_refresh_lease():
+            deadline = time.time() + REFRESH_LEASE_SECONDS
+            while time.time() < deadline:
+                time.sleep(0.5)
+                token_data = self._read_token_from_dynamodb()
+                if token_data and self._is_token_valid(token_data, log=False) \
+                        and not self._needs_proactive_refresh(token_data):
+                    print("Using access token refreshed by another container.")
+                    _token_cache['token_data'] = token_data
+                    return token_data['access_token']
+            print("Timed out waiting for another container's refresh, refreshing directly.")
+        return self._refresh_access_token()
+
+    def _acquire_refresh_lease(self):
+        now = time.time()
+        try:
+            self.table.update_item(
+                Key={'token_type': 'access_token'},
+                UpdateExpression='SET refresh_lease_until = :until',
+                ConditionExpression='attribute_not_exists(refresh_lease_until) OR refresh_lease_until < :now',
+                ExpressionAttributeValues={':until': int(now + REFRESH_LEASE_SECONDS), ':now': int(now)}
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            print(f"Error acquiring token refresh lease: {str(e)}")
+            return True
 
     def _read_token_from_dynamodb(self):
         try:
-            response = self.table.get_item(Key={'token_type': 'access_token'})
+            response = self.table.get_item(Key={'token_type': 'access_token'}, ConsistentRead=True)
             return response.get('Item')
         except ClientError as e:
             print(f"Error reading token from DynamoDB: {str(e)}")
@@ -70,18 +143,29 @@ class DropboxTokenManager:
 
     def _write_token_to_dynamodb(self, token_data):
         try:
-            self.table.put_item(Item=token_data)
+            # Never overwrite a token that expires later than ours; replacing the item also releases the lease.
+            self.table.put_item(
+                Item=token_data,
+                ConditionExpression='attribute_not_exists(expiry) OR expiry < :expiry',
+                ExpressionAttributeValues={':expiry': token_data['expiry']}
+            )
         except ClientError as e:
-            print(f"Error writing token to DynamoDB: {str(e)}")
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                print("A newer access token is already stored in DynamoDB.")
+            else:
+                print(f"Error writing token to DynamoDB: {str(e)}")
 
-    def _is_token_valid(self, token_data):
+    def _is_token_valid(self, token_data, log=True):
+        if 'access_token' not in token_data or 'expiry' not in token_data:
+            return False
         expiry = datetime.fromisoformat(token_data['expiry'])
         is_valid = datetime.now() < expiry - timedelta(minutes=10)
-        print(f"Token valid: {is_valid}, expiry: {expiry}")
+        if log:
+            print(f"Token valid: {is_valid}, expiry: {expiry}")
         return is_valid
 
     def _refresh_access_token(self):
-        url = 'https://api.dropboxapi.com/oauth2/token'
+        url = f'{DROPBOX_API_URL}/oauth2/token'
         data = {
             'grant_type': 'refresh_token',
             'refresh_token': self.refresh_token,
@@ -90,8 +174,7 @@ class DropboxTokenManager:
         }
 
         try:
-            response = requests.post(url, data=data)
-            response.raise_for_status()
+            response = post_with_retry('dropbox', url, data=data)
             token_info = response.json()
             
             token_data = {
@@ -100,9 +183,10 @@ class DropboxTokenManager:
                 'expiry': (datetime.now() + timedelta(seconds=token_info['expires_in'])).isoformat()
             }
             self._write_token_to_dynamodb(token_data)
+            _token_cache['token_data'] = token_data
             
             print("Access token updated.")
             return token_data['access_token']
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"Failed to refresh access token: {str(e)}")
             return None
\ No newline at end of file
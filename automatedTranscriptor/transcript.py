@@ -0,0 +1,221 @@
+import re
+from array import array
+
+# Hesitations that carry no content; deliberately leaves 'uh-huh', 'mm' (millimetres) and 'like' alone
+FILLER_WORDS = re.compile(r"(?<![\w'-])(?:u+m+|u+h+|e+r+m+|h+m+)(?![\w'-])[,.]?\s*", re.IGNORECASE)
+
+def format_time(seconds):
+    """Convert seconds to HH:MM:SS format"""
+    hours, remainder = divmod(seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{int(hours):02d}:{int(minutes):02d}:{int(seconds):02d}"
+
+def parse_time(value):
+    """Convert HH:MM:SS back to seconds"""
+    hours, minutes, seconds = value.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+class Utterance:
+    __slots__ = ('start', 'end', 'speaker', 'text')
+
+    def __init__(self, start, end, speaker, text):
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.text = text
+
+    def format(self):
+        return f"[{format_time(self.start)} - {format_time(self.end)}] [Speaker:{self.speaker}] {self.text}"
+
+class Transcript:
+    """
+    Diarized utterances kept in parallel typed arrays (start/end as doubles, speaker as int) plus a list of texts,
+    so long meetings don't pay for one Python object per field per utterance.
+    """
+    __slots__ = ('starts', 'ends', 'speakers', 'texts')
+
+    def __init__(self):
+        self.starts = array('d')
+        self.ends = array('d')
+        self.speakers = array('i')
+        self.texts = []
+
+    def append(self, start, end, speaker, text):
+        self.starts.append(start)
+        self.ends.append(end)
+        self.speakers.append(int(speaker or 0))
+        self.texts.append(text)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        return Utterance(self.starts[index], self.ends[index], self.speakers[index], self.texts[index])
+
+    def __iter__(self):
+        for i in range(len(self.texts)):
+            yield self[i]
+
+    @classmethod
+    def from_deepgram(cls, response):
+        transcript = cls()
+        for utterance in response.results.utterances:
+            transcript.append(utterance.start, utterance.end, utterance.speaker, utterance.transcript)
+        return transcript
+
+    @classmethod
+    def from_list(cls, utterances):
+        """Build from a list of {'start', 'end', 'speaker', 'transcript'} dicts (the cached form)"""
+        transcript = cls()
+        for u in utterances:
+            transcript.append(u['start'], u['end'], u['speaker'], u['transcript'])
+        return transcript
+
+    def to_list(self):
+        return [
+            {'start': u.start, 'end': u.end, 'speaker': u.speaker, 'transcript': u.text}
+            for u in self
+        ]
+
+    def lines(self):
+        return [u.format() for u in self]
+
+    def to_text(self):
+        return "\n".join(self.lines())
+
+    def to_compact_text(self, merge_gap=5.0, max_line_chars=1500):
+        """
+        Token-lean rendering for prompts: one line per speaker turn (consecutive utterances merged while the pause
+        is under ``merge_gap`` seconds), as ``[12m] Speaker0: text`` with the start minute only shown when it
+        changes, no end times, and whitespace and filler words normalized.
+        """
+        lines = []
+        last_minute = None
+        speaker = None
+        parts = []
+        turn_start = turn_end = 0.0
+
+        def flush():
+            nonlocal last_minute
+            if not parts:
+                return
+            minute = int(turn_start // 60)
+            stamp = f"[{minute}m] " if minute != last_minute else ""
+            last_minute = minute
+            lines.append(f"{stamp}Speaker{speaker}: {' '.join(parts)}")
+            parts.clear()
+
+        length = 0
+        for start, end, utterance_speaker, text in zip(self.starts, self.ends, self.speakers, self.texts):
+            text = normalize_text(text)
+            if not text:
+                continue
+            if utterance_speaker != speaker or start - turn_end > merge_gap or length + len(text) > max_line_chars:
+                flush()
+                speaker, turn_start, length = utterance_speaker, start, 0
+            parts.append(text)
+            length += len(text) + 1
+            turn_end = end
+        flush()
+        return "\n".join(lines)
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as txtfile:
+            for u in self:
+                txtfile.write(u.format() + "\n")
+        print(f"Results have been saved to the text file: {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Read a file written by save()"""
+        transcript = cls()
+        with open(path, "r", encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+                if not line.startswith("["):
+                    continue
+                try:
+                    time_range, rest = line[1:].split("] ", 1)
+                    start, end = time_range.split(" - ")
+                    speaker, text = rest.split("] ", 1)
+                    transcript.append(parse_time(start), parse_time(end), speaker.split(":", 1)[1], text)
+                except ValueError:
+                    continue
+        return transcript
+
+def normalize_text(text):
+    """Drop filler words, collapse whitespace and tidy the punctuation they leave behind"""
+    text = " ".join(FILLER_WORDS.sub("", text).split())
+    text = re.sub(r" ([,.;:?!])", r"\1", text)
+    text = re.sub(r"[,;:]+(?=[,.;:?!]|$)", "", text)
+    return text.lstrip(",;: ")
+
+def _overlap(a_start, a_end, b_start, b_end):
+    return max(0.0, min(a_end, b_end) - max(a_start, b_start))
+
+def _match_speakers(previous, current, window_start, window_end):
+    """
+    Map the current segment's speaker labels onto the previous segment's (already global) labels by how long they
+    speak over the same stretch of the shared overlap window. Greedy, one-to-one, heaviest match first.
+    """
+    weights = {}
+    for p_start, p_end, p_speaker, _ in previous:
+        if p_end <= window_start:
+            continue
+        for c_start, c_end, c_speaker, _ in current:
+            if c_start >= window_end:
+                break
+            shared = _overlap(p_start, p_end, c_start, c_end)
+            if shared > 0:
+                weights[(c_speaker, p_speaker)] = weights.get((c_speaker, p_speaker), 0.0) + shared
+    mapping = {}
+    used = set()
+    for (c_speaker, p_speaker), _ in sorted(weights.items(), key=lambda item: -item[1]):
+        if c_speaker not in mapping and p_speaker not in used:
+            mapping[c_speaker] = p_speaker
+            used.add(p_speaker)
+    return mapping
+
+def stitch_segments(parts):
+    """
+    Join per-segment transcripts into one.
+
+    ``parts`` is a list of (segment_start, segment_end, Transcript) in time order, each transcript timed relative to
+    its own segment and each segment overlapping the previous one. Timestamps are shifted by the segment start; in
+    each overlap, utterances centred before its midpoint come from the earlier segment and the rest from the later
+    one, with any remaining copy of the boundary utterance dropped; speaker labels are carried across segments by
+    matching who speaks when inside the overlap. A speaker who is silent for a whole overlap gets a new label.
+    """
+    kept = []
+    previous = None
+    next_speaker = 0
+    for segment_start, segment_end, part in parts:
+        current = [(u.start + segment_start, u.end + segment_start, u.speaker, u.text) for u in part]
+
+        if previous is None:
+            mapping, cut = {}, segment_start
+        else:
+            previous_end, previous_utterances = previous
+            mapping = _match_speakers(previous_utterances, current, segment_start, previous_end)
+            cut = (segment_start + previous_end) / 2
+        for speaker in sorted({u[2] for u in current}):
+            if speaker not in mapping:
+                mapping[speaker] = next_speaker
+                next_speaker += 1
+        current = [(start, end, mapping[speaker], text) for start, end, speaker, text in current]
+
+        while kept and (kept[-1][0] + kept[-1][1]) / 2 >= cut:
+            kept.pop()
+        for utterance in current:
+            start, end = utterance[0], utterance[1]
+            if (start + end) / 2 < cut:
+                continue
+            if kept and _overlap(kept[-1][0], kept[-1][1], start, end) > (end - start) / 2:
+                continue
+            kept.append(utterance)
+        previous = (segment_end, current)
+
+    stitched = Transcript()
+    for start, end, speaker, text in kept:
+        stitched.append(start, end, speaker, text)
+    return stitched
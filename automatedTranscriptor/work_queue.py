@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import boto3
+
+# 'sqs', 'sqlite', or empty to process files inline in the webhook invocation
+WORK_QUEUE_BACKEND = os.environ.get('WORK_QUEUE_BACKEND', '').lower()
+WORK_QUEUE_URL = os.environ.get('WORK_QUEUE_URL', '')
+WORK_QUEUE_PATH = os.environ.get('WORK_QUEUE_PATH', '/tmp/work_queue.sqlite3')
+VISIBILITY_TIMEOUT = int(os.environ.get('WORK_QUEUE_VISIBILITY_TIMEOUT', '900'))
+
+# Only the listing fields the worker needs travel in the job
+JOB_FIELDS = ('path_display', 'id', 'content_hash', 'size', 'server_modified', 'media_info')
+
+def make_job(entry):
+    job = {field: entry[field] for field in JOB_FIELDS if field in entry}
+    job['enqueued_at'] = time.time()
+    return job
+
+class SQSWorkQueue:
+    """Per-file jobs on an SQS queue; the worker Lambda normally receives them through an SQS trigger."""
+    MAX_BATCH = 10
+
+    def __init__(self, queue_url=WORK_QUEUE_URL):
+        self.queue_url = queue_url
+        self.sqs = boto3.client('sqs')
+
+    def enqueue(self, jobs):
+        for start in range(0, len(jobs), self.MAX_BATCH):
+            batch = jobs[start:start + self.MAX_BATCH]
+            response = self.sqs.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[{'Id': str(i), 'MessageBody': json.dumps(job)} for i, job in enumerate(batch)]
+            )
+            failed = response.get('Failed', [])
+            if failed:
+                raise RuntimeError(f"Failed to enqueue {len(failed)} jobs: {failed}")
+
+    def receive(self, max_jobs=MAX_BATCH):
+        """Return [(receipt, job)] for up to ``max_jobs`` jobs, for polling workers"""
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_jobs, self.MAX_BATCH),
+            VisibilityTimeout=VISIBILITY_TIMEOUT,
+            WaitTimeSeconds=1
+        )
+        return [(m['ReceiptHandle'], json.loads(m['Body'])) for m in response.get('Messages', [])]
+
+    def delete(self, receipt):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+class SQLiteWorkQueue:
+    """Local stand-in for SQSWorkQueue with the same enqueue/receive/delete interface and visibility timeout."""
+
+    def __init__(self, path=WORK_QUEUE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, body TEXT NOT NULL, visible_at REAL NOT NULL, receive_count INTEGER DEFAULT 0)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def enqueue(self, jobs):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO jobs (id, body, visible_at) VALUES (?, ?, ?)",
+                [(str(uuid.uuid4()), json.dumps(job), now) for job in jobs]
+            )
+
+    def receive(self, max_jobs=10):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, body FROM jobs WHERE visible_at <= ? ORDER BY visible_at LIMIT ?", (now, max_jobs)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE jobs SET visible_at = ?, receive_count = receive_count + 1 WHERE id = ?",
+                [(now + VISIBILITY_TIMEOUT, job_id) for job_id, _ in rows]
+            )
+        return [(job_id, json.loads(body)) for job_id, body in rows]
+
+    def delete(self, receipt):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (receipt,))
+
+    def __len__(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+_work_queue = None
+
+def get_work_queue():
+    """The configured queue (one per container), or None when files are processed inline"""
+    global _work_queue
+    if _work_queue is None and WORK_QUEUE_BACKEND:
+        _work_queue = SQSWorkQueue() if WORK_QUEUE_BACKEND == 'sqs' else SQLiteWorkQueue()
+    return _work_queue
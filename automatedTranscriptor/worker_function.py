@@ -0,0 +1,89 @@
+import os
+import json
+from dropbox_file_handler import DropboxFileHandler
+from token_manager import DropboxTokenManager
+from content_index import get_content_index
+from pipeline import process_audio_files, MAX_CONCURRENT_FILES
+from async_pipeline import process_audio_files_async, run_coroutine
+from rate_limiter import limiter_metrics
+from work_queue import get_work_queue
+from sampling_profiler import start_profiling, report_profile
+from scheduler import schedule, deferred_result, remaining_seconds
+import metrics
+
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'sync').lower()
+WORKER_BATCH_SIZE = int(os.environ.get('WORKER_BATCH_SIZE', '10'))
+# Results that should not be retried; anything else (including 'deferred') is handed back to the queue
+DONE_STATUSES = ('processed', 'reused', 'duplicate', 'skipped')
+
+_token_manager = None
+
+def _file_handler():
+    global _token_manager
+    if _token_manager is None:
+        _token_manager = DropboxTokenManager()
+    return DropboxFileHandler(_token_manager.get_access_token())
+
+def process_jobs(jobs, budget_seconds=None):
+    """
+    Run the pipeline over a batch of queued jobs, shortest first and only as many as fit in ``budget_seconds``,
+    and return one result per job in the original order. Jobs that do not fit come back as 'deferred'.
+    """
+    file_handler = _file_handler()
+    content_index = get_content_index()
+    admitted, deferred = schedule(jobs, budget_seconds, MAX_CONCURRENT_FILES)
+    if PIPELINE_MODE == 'async':
+        async def entries():
+            for job in admitted:
+                yield job
+        results = run_coroutine(process_audio_files_async(file_handler, entries(), content_index))
+    else:
+        results = process_audio_files(file_handler, admitted, content_index)
+
+    by_job = {id(job): result for job, result in zip(admitted, results)}
+    by_job.update((id(job), deferred_result(job, budget_seconds)) for job in deferred)
+    return [by_job[id(job)] for job in jobs]
+
+def worker_handler(event, context):
+    """
+    Worker entry point. With an SQS trigger the batch arrives in event['Records'] and failed jobs are reported
+    back as batchItemFailures so only they are redelivered. Otherwise (local SQLite queue, scheduled polling)
+    up to WORKER_BATCH_SIZE jobs are pulled from the configured queue.
+    """
+    invocation_id = metrics.start_invocation(context, PIPELINE_MODE)
+    profiler = start_profiling()
+    try:
+        with metrics.stage('invocation', Handler='worker'):
+            return handle_jobs(event, remaining_seconds(context))
+    finally:
+        report_profile(profiler, invocation_id)
+
+def handle_jobs(event, budget_seconds=None):
+    if 'Records' in event:
+        records = event['Records']
+        results = process_jobs([json.loads(record['body']) for record in records], budget_seconds)
+        failures = [
+            {'itemIdentifier': record['messageId']}
+            for record, result in zip(records, results) if result['status'] not in DONE_STATUSES
+        ]
+        _log(results)
+        return {'batchItemFailures': failures}
+
+    work_queue = get_work_queue()
+    if work_queue is None:
+        raise ValueError("WORK_QUEUE_BACKEND is not set")
+    received = work_queue.receive(WORKER_BATCH_SIZE)
+    if not received:
+        return {'statusCode': 200, 'body': json.dumps({'processed': 0})}
+
+    results = process_jobs([job for _, job in received], budget_seconds)
+    for (receipt, _), result in zip(received, results):
+        if result['status'] in DONE_STATUSES:
+            work_queue.delete(receipt)
+    _log(results)
+    return {'statusCode': 200, 'body': json.dumps({'processed': len(results), 'results': results})}
+
+def _log(results):
+    for result in results:
+        print(f"{result['status']}: {result['file']} ({result['message']})")
+    print(json.dumps({'upstream_metrics': limiter_metrics()}))
@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+import audio_compaction
+
+# Every job that needs local files gets its own directory under WORKSPACE_ROOT, removed when the job ends
+WORKSPACE_ROOT = os.environ.get('WORKSPACE_ROOT', '/tmp/workspaces')
+# Upper bound on the bytes all workspaces together may reserve; 0 uses whatever is free on the filesystem
+WORKSPACE_CAPACITY_BYTES = int(os.environ.get('WORKSPACE_CAPACITY_BYTES', '0'))
+# Kept free for the job store, caches and work queue that share /tmp
+WORKSPACE_HEADROOM_BYTES = int(os.environ.get('WORKSPACE_HEADROOM_BYTES', str(64 * 1024 * 1024)))
+# Disk a download AUDIO_COMPACTION rewrites needs per byte: the file plus the compacted copy written next to it
+WORKSPACE_BYTES_PER_INPUT_BYTE = float(os.environ.get('WORKSPACE_BYTES_PER_INPUT_BYTE', '3'))
+# Reserved for a recording whose size is unknown
+WORKSPACE_DEFAULT_BYTES = int(os.environ.get('WORKSPACE_DEFAULT_BYTES', str(256 * 1024 * 1024)))
+# How long a job waits for other jobs to free space before giving up on a local copy
+WORKSPACE_WAIT_SECONDS = float(os.environ.get('WORKSPACE_WAIT_SECONDS', '30'))
+
+def disk_needed(file_size, audio_file=''):
+    """
+    Bytes to reserve before downloading ``audio_file`` of ``file_size`` bytes. Only a recording compact_audio
+    rewrites needs room for a second copy; any other download needs just its own size.
+    """
+    if not file_size:
+        return WORKSPACE_DEFAULT_BYTES
+    if audio_compaction.AUDIO_COMPACTION and audio_file.lower().endswith(audio_compaction.COMPACTABLE_FORMATS):
+        return int(file_size * WORKSPACE_BYTES_PER_INPUT_BYTE)
+    return int(file_size)
+
+def _directory_size(path):
+    total = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return total
+
+class Workspace:
+    """A job's private directory; ``reserve`` claims disk space before anything large is written to it"""
+
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+        self.reserved = 0
+
+    def reserve(self, nbytes, timeout=WORKSPACE_WAIT_SECONDS):
+        """Grow this workspace's reservation to ``nbytes``; returns False if the space did not become available"""
+        return self.manager.reserve(self, nbytes, timeout)
+
+class WorkspaceManager:
+    """
+    Hands out unique job directories and budgets the disk they may use. A reservation is granted when the free
+    space, less the headroom and what live workspaces have reserved but not yet written, covers it; otherwise
+    the job waits for others to finish, or gives up straight away if waiting cannot help.
+    """
+
+    def __init__(self, root=WORKSPACE_ROOT, capacity=WORKSPACE_CAPACITY_BYTES, headroom=WORKSPACE_HEADROOM_BYTES):
+        self.root = root
+        self.capacity = capacity
+        self.headroom = headroom
+        self._live = {}
+        self._condition = threading.Condition()
+
+    def _usage(self):
+        """{path: bytes on disk} for the live workspaces that hold a reservation"""
+        return {path: _directory_size(path) for path, workspace in self._live.items() if workspace.reserved}
+
+    def _available(self, workspace, usage):
+        """Bytes ``workspace`` could hold now, counting what it already reserved"""
+        others = [w for w in self._live.values() if w is not workspace]
+        outstanding = sum(max(0, w.reserved - usage.get(w.path, 0)) for w in others)
+        available = shutil.disk_usage(self.root).free + usage.get(workspace.path, 0) - self.headroom - outstanding
+        if self.capacity:
+            available = min(available, self.capacity - sum(w.reserved for w in others))
+        return available
+
+    def reserve(self, workspace, nbytes, timeout=WORKSPACE_WAIT_SECONDS):
+        deadline = time.monotonic() + max(0, timeout)
+        with self._condition:
+            while True:
+                if nbytes <= workspace.reserved:
+                    return True
+                usage = self._usage()
+                if nbytes <= self._available(workspace, usage):
+                    workspace.reserved = nbytes
+                    return True
+                # Only another job finishing frees space, and not enough of it if even all theirs is too little
+                others = [w for w in self._live.values() if w is not workspace and w.reserved]
+                ceiling = self._available(workspace, usage) + sum(max(w.reserved, usage.get(w.path, 0))
+                                                                  for w in others)
+                remaining = deadline - time.monotonic()
+                if not others or nbytes > ceiling or remaining <= 0:
+                    print(f"Could not reserve {nbytes} bytes of disk for {workspace.path}")
+                    return False
+                self._condition.wait(remaining)
+
+    @contextmanager
+    def workspace(self, name):
+        """A fresh directory for one job, removed with everything in it (and its reservation) on exit"""
+        os.makedirs(self.root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)[:60]}-", dir=self.root)
+        workspace = Workspace(self, path)
+        with self._condition:
+            self._live[path] = workspace
+        try:
+            yield workspace
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+            with self._condition:
+                del self._live[path]
+                self._condition.notify_all()
+
+    def sweep(self):
+        """Remove directories left behind by an invocation that was killed before it could clean up"""
+        if not os.path.isdir(self.root):
+            return
+        with self._condition:
+            for name in os.listdir(self.root):
+                path = os.path.join(self.root, name)
+                if path not in self._live:
+                    print(f"Removing stale workspace {path}")
+                    shutil.rmtree(path, ignore_errors=True)
+
+_workspace_manager = None
+_manager_lock = threading.Lock()
+
+def get_workspace_manager():
+    global _workspace_manager
+    with _manager_lock:
+        if _workspace_manager is None:
+            _workspace_manager = WorkspaceManager()
+    return _workspace_manager
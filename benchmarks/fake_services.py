@@ -0,0 +1,478 @@
+"""
+Local stand-ins for the upstream APIs the Lambda talks to, for offline benchmarking.
+
+Each fake is a threaded HTTP server on 127.0.0.1 with configurable latency, jitter and error rate, and keeps
+per-endpoint request counts. FakeDynamoDB is an in-process replacement for the boto3 DynamoDB resource.
+"""
+import io
+import re
+import json
+import time
+import wave
+import random
+import hashlib
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+class ServiceConfig:
+    """Behaviour shared by every fake: added latency (ms), random jitter (ms) and the share of failed requests"""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503, retry_after=0.1):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+
+    def delay(self):
+        seconds = (self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000.0
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self):
+        service = self.server.service
+        path = urlparse(self.path).path
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        service.count(path)
+        service.config.delay()
+        if service.config.should_fail():
+            service.count('errors')
+            self._send(service.config.error_status, {'error': 'injected failure'},
+                       {'Retry-After': str(service.config.retry_after)})
+            return
+        try:
+            status, payload, headers = service.handle(self.command, path, self.headers, body, self.path)
+        except Exception as e:
+            status, payload, headers = 500, {'error': str(e)}, {}
+        self._send(status, payload, headers)
+
+    do_GET = _dispatch
+    do_POST = _dispatch
+
+    def _send(self, status, payload, headers=None):
+        if isinstance(payload, (bytes, bytearray)):
+            data = bytes(payload)
+            content_type = 'application/octet-stream'
+        elif isinstance(payload, str):
+            data = payload.encode('utf-8')
+            content_type = 'text/plain'
+        else:
+            data = json.dumps(payload).encode('utf-8')
+            content_type = 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+class FakeService:
+    """Base class: subclasses implement handle(method, path, headers, body, raw_path) -> (status, payload, headers)"""
+
+    def __init__(self, config=None):
+        self.config = config or ServiceConfig()
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.requests[key] = self.requests.get(key, 0) + amount
+
+    def start(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle(self, method, path, headers, body, raw_path):
+        return 404, {'error': f'unknown endpoint {path}'}, {}
+
+def make_audio(extension, size):
+    """Payload for a fake recording: a valid 16 kHz mono WAV for .wav/.pcm, zero bytes otherwise"""
+    if extension not in ('.wav', '.pcm'):
+        return bytes(size)
+    frames = max(1, (size - 44) // 2)
+    if extension == '.pcm':
+        return bytes(frames * 2)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(16000)
+        out.writeframes(bytes(frames * 2))
+    return buffer.getvalue()
+
+class FakeDropbox(FakeService):
+    """
+    OAuth token, list_folder(/continue), get_metadata, get_temporary_link and download.
+    Files are added with add_files(); a cursor is the offset into the file list, so each webhook batch lists
+    only what was added since the last saved cursor, ``page_size`` entries per page.
+    """
+
+    def __init__(self, config=None, page_size=100, audio_bytes=1024 * 1024, extension='.mp3',
+                 folder='/automated_transcriptor'):
+        super().__init__(config)
+        self.page_size = page_size
+        self.audio_bytes = audio_bytes
+        self.extension = extension
+        self.folder = folder
+        self.files = []
+        self._by_path = {}
+        self.audio = make_audio(extension, audio_bytes)
+        self.content_url = None
+
+    def add_files(self, count, namespace):
+        for _ in range(count):
+            index = len(self.files)
+            name = f"{namespace}-{index:05d}{self.extension}"
+            self.files.append({
+                '.tag': 'file',
+                'name': name,
+                'path_display': f"{self.folder}/{name}",
+                'path_lower': f"{self.folder}/{name}".lower(),
+                'id': f"id:{namespace}{index:05d}",
+                'rev': f"{index:09x}",
+                'size': len(self.audio),
+                'content_hash': hashlib.sha256(f"{namespace}/{index}".encode('utf-8')).hexdigest(),
+                'server_modified': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'client_modified': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'is_downloadable': True
+            })
+            self._by_path[self.files[-1]['path_lower']] = self.files[-1]
+
+    def reset(self):
+        self.files = []
+        self._by_path = {}
+
+    def _page(self, offset):
+        entries = self.files[offset:offset + self.page_size]
+        next_offset = offset + len(entries)
+        return 200, {'entries': entries, 'cursor': f"cursor-{next_offset}",
+                     'has_more': next_offset < len(self.files)}, {}
+
+    def _find(self, path):
+        return self._by_path.get(path.lower())
+
+    def handle(self, method, path, headers, body, raw_path):
+        if path == '/oauth2/token':
+            return 200, {'access_token': 'fake-access-token', 'token_type': 'bearer', 'expires_in': 14400}, {}
+        if path == '/2/files/list_folder':
+            return self._page(0)
+        if path == '/2/files/list_folder/continue':
+            return self._page(int(json.loads(body)['cursor'].split('-', 1)[1]))
+        if path == '/2/files/get_metadata':
+            entry = self._find(json.loads(body)['path'])
+            if entry is None:
+                return 409, {'error_summary': 'path/not_found/'}, {}
+            return 200, entry, {}
+        if path == '/2/files/get_temporary_link':
+            entry = self._find(json.loads(body)['path'])
+            if entry is None:
+                return 409, {'error_summary': 'path/not_found/'}, {}
+            return 200, {'metadata': entry, 'link': f"{self.content_url}/link/{entry['name']}"}, {}
+        if path == '/2/files/download':
+            entry = self._find(json.loads(headers['Dropbox-API-Arg'])['path'])
+            if entry is None:
+                return 409, {'error_summary': 'path/not_found/'}, {}
+            result = {'Dropbox-API-Result': json.dumps(entry)}
+            range_header = headers.get('Range')
+            if range_header and range_header.startswith('bytes='):
+                offset = int(range_header[len('bytes='):].split('-', 1)[0])
+                return 206, self.audio[offset:], result
+            return 200, self.audio, result
+        if path.startswith('/link/'):
+            return 200, self.audio, {}
+        return super().handle(method, path, headers, body, raw_path)
+
+class FakeDeepgram(FakeService):
+    """POST /v1/listen (file upload or URL) returning ``utterances`` diarized utterances of ``words`` words each"""
+
+    def __init__(self, config=None, utterances=200, words=12, speakers=3):
+        super().__init__(config)
+        self.utterances = utterances
+        self.words = words
+        self.speakers = speakers
+
+    def _response(self):
+        # Every transcript differs so downstream analysis caching doesn't hide the OpenAI stage
+        self.count('transcripts')
+        serial = self.requests['transcripts']
+        utterances = []
+        start = 0.0
+        for i in range(self.utterances):
+            end = start + self.words * 0.4
+            text = " ".join(f"word{(i * self.words + w) % 997}" for w in range(self.words))
+            if i == 0:
+                text = f"recording {serial}: {text}"
+            utterances.append({'start': start, 'end': end, 'confidence': 0.95, 'channel': 0, 'transcript': text,
+                               'words': [], 'speaker': i % self.speakers, 'id': f"u{i}"})
+            start = end + 0.3
+        return {
+            'metadata': {'request_id': 'fake', 'created': datetime.now(timezone.utc).isoformat(), 'duration': start,
+                         'channels': 1, 'models': ['fake'], 'transaction_key': 'deprecated', 'sha256': 'fake',
+                         'model_info': {'fake': {'name': 'nova-2-meeting', 'version': '1', 'arch': 'nova-2'}}},
+            'results': {'channels': [{'alternatives': [{'transcript': '', 'confidence': 0.95, 'words': []}]}],
+                        'utterances': utterances}
+        }
+
+    def handle(self, method, path, headers, body, raw_path):
+        if path == '/v1/listen':
+            return 200, self._response(), {}
+        return super().handle(method, path, headers, body, raw_path)
+
+class FakeOpenAI(FakeService):
+    """
+    POST /v1/chat/completions answering every offered tool (or the forced one) with synthetic arguments.
+    ``ms_per_output_token`` adds generation time proportional to the answer's length (~4 characters per token).
+    """
+
+    def __init__(self, config=None, summary_chars=1500, list_items=5, ms_per_output_token=0.0):
+        super().__init__(config)
+        self.summary_chars = summary_chars
+        self.list_items = list_items
+        self.ms_per_output_token = ms_per_output_token
+
+    def _arguments(self, parameters):
+        arguments = {}
+        for name, schema in parameters.get('properties', {}).items():
+            if schema.get('type') == 'array':
+                arguments[name] = [f"{name} {i}" for i in range(self.list_items)]
+            else:
+                arguments[name] = ("lorem ipsum " * (self.summary_chars // 12 + 1))[:self.summary_chars]
+        return arguments
+
+    def handle(self, method, path, headers, body, raw_path):
+        if path != '/v1/chat/completions':
+            return super().handle(method, path, headers, body, raw_path)
+        request = json.loads(body)
+        tools = [tool['function'] for tool in request.get('tools', [])]
+        choice = request.get('tool_choice')
+        if isinstance(choice, dict):
+            tools = [tool for tool in tools if tool['name'] == choice['function']['name']]
+        tool_calls = [{'id': f"call_{i}", 'type': 'function',
+                       'function': {'name': tool['name'], 'arguments': json.dumps(self._arguments(tool['parameters']))}}
+                      for i, tool in enumerate(tools)]
+        prompt_tokens = sum(len(message.get('content') or '') for message in request.get('messages', [])) // 4
+        self.count('prompt_tokens', prompt_tokens)
+        completion_tokens = sum(len(call['function']['arguments']) for call in tool_calls) // 4
+        if self.ms_per_output_token:
+            time.sleep(completion_tokens * self.ms_per_output_token / 1000)
+        return 200, {
+            'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()),
+            'model': request.get('model', 'gpt-4o'),
+            'choices': [{'index': 0, 'finish_reason': 'tool_calls' if tool_calls else 'stop',
+                         'message': {'role': 'assistant', 'content': None if tool_calls else '',
+                                     'tool_calls': tool_calls or None}}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens}
+        }, {}
+
+class FakeSlack(FakeService):
+    """
+    Incoming webhook (any POST under /webhook) and the chat.postMessage/chat.update Web API methods.
+    Every delivery is logged as (perf_counter time, message text) to measure time to first notification.
+    """
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self.deliveries = []
+        self._serial = 0
+
+    def reset(self):
+        self.deliveries = []
+
+    def handle(self, method, path, headers, body, raw_path):
+        if path.startswith('/webhook') or path in ('/api/chat.postMessage', '/api/chat.update'):
+            message = json.loads(body or b'{}')
+            with self._lock:
+                self.deliveries.append((time.perf_counter(), message.get('text', '')))
+                self._serial += 1
+                serial = self._serial
+        if path.startswith('/webhook'):
+            return 200, 'ok', {}
+        if path == '/api/chat.postMessage':
+            return 200, {'ok': True, 'channel': message.get('channel'), 'ts': f"{int(time.time())}.{serial:06d}"}, {}
+        if path == '/api/chat.update':
+            return 200, {'ok': True, 'channel': message.get('channel'), 'ts': message.get('ts')}, {}
+        return super().handle(method, path, headers, body, raw_path)
+
+_CONDITION_TOKEN = re.compile(r"\s*(\(|\)|AND\b|OR\b|NOT\b|(?:attribute_exists|attribute_not_exists)\([#\w]+\)"
+                              r"|[#\w]+\s*(?:<>|<=|>=|=|<|>)\s*:\w+)")
+_COMPARISONS = {
+    '=': lambda a, b: a == b, '<>': lambda a, b: a != b,
+    '<': lambda a, b: a < b, '<=': lambda a, b: a <= b, '>': lambda a, b: a > b, '>=': lambda a, b: a >= b,
+}
+
+def _conditional_check_failed():
+    from botocore.exceptions import ClientError
+    return ClientError({'Error': {'Code': 'ConditionalCheckFailedException', 'Message': 'The conditional request failed'}},
+                       'UpdateItem')
+
+class _Expression:
+    """Evaluates the subset of DynamoDB condition expressions this code base writes"""
+
+    def __init__(self, expression, names, values):
+        self.tokens = _CONDITION_TOKEN.findall(expression)
+        self.names = names or {}
+        self.values = values or {}
+
+    def name(self, token):
+        return self.names.get(token, token)
+
+    def evaluate(self, item):
+        self.position = 0
+        return self._or(item)
+
+    def _next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _or(self, item):
+        result = self._and(item)
+        while self._peek() == 'OR':
+            self._next()
+            result = self._and(item) or result
+        return result
+
+    def _and(self, item):
+        result = self._unary(item)
+        while self._peek() == 'AND':
+            self._next()
+            result = self._unary(item) and result
+        return result
+
+    def _unary(self, item):
+        token = self._next()
+        if token == 'NOT':
+            return not self._unary(item)
+        if token == '(':
+            result = self._or(item)
+            self._next()
+            return result
+        function, _, argument = token.partition('(')
+        if function in ('attribute_exists', 'attribute_not_exists'):
+            exists = self.name(argument.rstrip(')')) in item
+            return exists if function == 'attribute_exists' else not exists
+        name, operator, value = re.match(r"([#\w]+)\s*(<>|<=|>=|=|<|>)\s*(:\w+)", token).groups()
+        name = self.name(name)
+        if name not in item:
+            return operator == '<>'
+        return _COMPARISONS[operator](item[name], self.values[value])
+
+class FakeTable:
+    """In-memory Table supporting the calls this code base makes, including condition expressions"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _key(self, key):
+        self.key_names = tuple(sorted(key))
+        return tuple(sorted(key.items()))
+
+    def _key_of(self, item):
+        # Key attribute names are learnt from the first Key= argument seen; before that, the first attribute
+        names = getattr(self, 'key_names', None) or (next(iter(item)),)
+        return tuple(sorted((name, item[name]) for name in names))
+
+    @staticmethod
+    def _check(item, ConditionExpression=None, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+               **kwargs):
+        if ConditionExpression and not _Expression(ConditionExpression, ExpressionAttributeNames,
+                                                   ExpressionAttributeValues).evaluate(item or {}):
+            raise _conditional_check_failed()
+
+    def load(self):
+        return None
+
+    def wait_until_exists(self):
+        return None
+
+    def get_item(self, Key, **kwargs):
+        with self._lock:
+            item = self.items.get(self._key(Key))
+            return {'Item': dict(item)} if item is not None else {}
+
+    def put_item(self, Item, **kwargs):
+        with self._lock:
+            key = self._key_of(Item)
+            self._check(self.items.get(key), **kwargs)
+            self.items[key] = dict(Item)
+        return {}
+
+    def delete_item(self, Key, **kwargs):
+        with self._lock:
+            self._check(self.items.get(self._key(Key)), **kwargs)
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+                    ReturnValues=None, **kwargs):
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        with self._lock:
+            key = self._key(Key)
+            self._check(self.items.get(key), ExpressionAttributeNames=names, ExpressionAttributeValues=values,
+                        **kwargs)
+            item = self.items.setdefault(key, dict(Key))
+            for action, body in re.findall(r"(SET|REMOVE)\s+(.*?)(?=\s+(?:SET|REMOVE)\s|$)", UpdateExpression.strip()):
+                for part in re.split(r",\s*(?![^(]*\))", body):
+                    if action == 'REMOVE':
+                        item.pop(names.get(part.strip(), part.strip()), None)
+                        continue
+                    name, value = (piece.strip() for piece in part.split('=', 1))
+                    name = names.get(name, name)
+                    default = re.match(r"if_not_exists\(\s*([#\w]+)\s*,\s*(:\w+)\s*\)", value)
+                    if default:
+                        item[name] = item.get(names.get(default.group(1), default.group(1)), values[default.group(2)])
+                    else:
+                        item[name] = values[value] if value.startswith(':') else value
+            return {'Attributes': dict(item)}
+
+class FakeDynamoDB:
+    """Stand-in for boto3.resource('dynamodb')"""
+
+    def __init__(self):
+        self.tables = {}
+
+    def Table(self, name):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(name)
+        return self.tables[name]
+
+    def create_table(self, TableName, **kwargs):
+        return self.Table(TableName)
+
+    def reset(self):
+        for table in self.tables.values():
+            table.items.clear()
@@ -0,0 +1,412 @@
+"""
+Offline benchmark: drive lambda_handler against local fakes of Dropbox, Deepgram, OpenAI and Slack.
+
+    python benchmarks/run_benchmark.py --files 40 --batches 4 --mode both --output bench.json
+    python benchmarks/run_benchmark.py --files 40 --batches 4 --mode both --baseline bench.json
+
+Reports per-stage p50/p99 latency, end-to-end files per minute and peak RSS for each pipeline mode. With
+--baseline, every metric is compared against an earlier --output file and regressions beyond --tolerance are
+flagged (and make the exit status non-zero).
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import tempfile
+import threading
+import contextlib
+from fake_services import (ServiceConfig, FakeDropbox, FakeDeepgram, FakeOpenAI, FakeSlack, FakeDynamoDB)
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'automatedTranscriptor')
+SERVICES = ('dropbox', 'deepgram', 'openai', 'slack')
+
+# (module or class path, attribute, stage name); missing attributes are skipped
+STAGES = (
+    ('token_manager.DropboxTokenManager', '_refresh_access_token', 'token_refresh'),
+    ('dropbox_update.DropboxUpdateNotificationAPI', '_call_dropbox_api', 'list_folder'),
+    ('dropbox_update.DropboxUpdateNotificationAPI', '_call_dropbox_api_async', 'list_folder'),
+    ('dropbox_file_handler.DropboxFileHandler', 'get_file_metadata', 'metadata'),
+    ('dropbox_file_handler.DropboxFileHandler', 'get_file_metadata_async', 'metadata'),
+    ('dropbox_file_handler.DropboxFileHandler', 'get_temporary_link', 'temporary_link'),
+    ('dropbox_file_handler.DropboxFileHandler', 'get_temporary_link_async', 'temporary_link'),
+    ('dropbox_file_handler.DropboxFileHandler', 'download_file_to_tmp', 'download'),
+    ('dropbox_file_handler.DropboxFileHandler', 'download_file_to_tmp_async', 'download'),
+    ('pipeline', 'compact_audio', 'compact'),
+    ('async_pipeline', 'compact_audio', 'compact'),
+    ('pipeline', 'speech_to_text', 'transcribe'),
+    ('pipeline', 'speech_to_text_from_url', 'transcribe'),
+    ('async_pipeline', 'speech_to_text_async', 'transcribe'),
+    ('async_pipeline', 'speech_to_text_from_url_async', 'transcribe'),
+    ('pipeline', 'analyzer', 'analyze'),
+    ('async_pipeline', 'analyzer_async', 'analyze'),
+    ('pipeline', 'send_slack_notification', 'slack'),
+    ('async_pipeline', 'send_slack_notification_async', 'slack'),
+    ('slack_notifier.ProgressiveSlackMessage', 'publish', 'slack'),
+    ('slack_notifier.ProgressiveSlackMessage', 'publish_async', 'slack'),
+    ('slack_digest.SlackDigestQueue', '_send', 'slack'),
+)
+
+# Metrics where a higher value is better; every other metric regresses when it grows
+HIGHER_IS_BETTER = ('files_per_minute',)
+
+class StageTimer:
+    """Wraps pipeline entry points and records the wall time of every call, per stage"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def wrap(self, function, stage):
+        if inspect.iscoroutinefunction(function):
+            async def timed_async(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - started)
+            return timed_async
+
+        def timed_sync(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+        return timed_sync
+
+    def install(self):
+        import importlib
+        for target, attribute, stage in STAGES:
+            module_name, _, class_name = target.partition('.')
+            owner = importlib.import_module(module_name)
+            if class_name:
+                owner = getattr(owner, class_name)
+            function = getattr(owner, attribute, None)
+            if function is not None:
+                setattr(owner, attribute, self.wrap(function, stage))
+
+class RssSampler:
+    """Peak resident set size during a run, sampled from /proc (falls back to ru_maxrss elsewhere)"""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.current())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = self.current()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+class FakeContext:
+    """Minimal Lambda context object"""
+
+    def __init__(self, timeout_seconds):
+        self.aws_request_id = 'benchmark'
+        self.function_name = 'automatedTranscriptor-benchmark'
+        self._deadline = time.time() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.time()) * 1000))
+
+def percentile(values, fraction):
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def parse_per_service(text, cast=float):
+    """'300' applies to every service; 'deepgram=800,openai=1200' sets individual ones"""
+    values = {}
+    if not text:
+        return values
+    for part in text.split(','):
+        if '=' in part:
+            name, value = part.split('=', 1)
+            values[name.strip()] = cast(value)
+        else:
+            for name in SERVICES:
+                values[name] = cast(part)
+    return values
+
+def start_services(args):
+    latency = parse_per_service(args.latency)
+    jitter = parse_per_service(args.jitter)
+    error_rate = parse_per_service(args.error_rate)
+
+    def config(name):
+        return ServiceConfig(latency_ms=latency.get(name, 0.0), jitter_ms=jitter.get(name, 0.0),
+                             error_rate=error_rate.get(name, 0.0))
+
+    services = {
+        'dropbox': FakeDropbox(config('dropbox'), page_size=args.page_size, audio_bytes=args.audio_bytes,
+                               extension=args.audio_ext),
+        'deepgram': FakeDeepgram(config('deepgram'), utterances=args.utterances),
+        'openai': FakeOpenAI(config('openai'), summary_chars=args.summary_chars,
+                             ms_per_output_token=args.openai_ms_per_token),
+        'slack': FakeSlack(config('slack')),
+    }
+    for service in services.values():
+        service.start()
+    services['dropbox'].content_url = services['dropbox'].url
+    return services
+
+def configure_environment(services, args, workdir):
+    """Point the app at the fakes and keep all of its local state under ``workdir``; must run before import"""
+    os.environ.update({
+        'DROPBOX_API_URL': services['dropbox'].url,
+        'DROPBOX_CONTENT_URL': services['dropbox'].url,
+        'DROPBOX_APP_KEY': 'benchmark',
+        'DROPBOX_APP_SECRET': 'benchmark',
+        'DROPBOX_REFRESH_TOKEN': 'benchmark',
+        'DEEPGRAM_API_KEY': 'benchmark',
+        'DEEPGRAM_API_URL': services['deepgram'].url,
+        'OPENAI_API_KEY': 'benchmark',
+        'OPENAI_BASE_URL': f"{services['openai'].url}/v1",
+        'SLACK_WEBHOOK_URL': f"{services['slack'].url}/webhook",
+        'AWS_DEFAULT_REGION': os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'),
+        'SKIP_TABLE_CHECK': 'true',
+        'WORK_QUEUE_BACKEND': '',
+        'CONTENT_INDEX_BACKEND': 'local',
+        'CONTENT_INDEX_PATH': os.path.join(workdir, 'content_index.json'),
+        'JOB_STATE_BACKEND': 'local',
+        'JOB_STATE_PATH': os.path.join(workdir, 'job_state.json'),
+        'ARTIFACT_DIR': os.path.join(workdir, 'artifacts'),
+        'RESULT_CACHE_DIR': os.path.join(workdir, 'result_cache'),
+        'WORKSPACE_ROOT': os.path.join(workdir, 'workspaces'),
+        'WORKSPACE_CAPACITY_BYTES': str(args.workspace_bytes),
+        'TRANSFER_MODE': args.transfer_mode,
+        'MAX_CONCURRENT_FILES': str(args.concurrency),
+        'TRANSCRIPT_ENCODING': args.transcript_encoding,
+        'ANALYSIS_MODE': args.analysis_mode,
+        'SLACK_DELIVERY': args.slack_delivery,
+        'SLACK_DIGEST_WINDOW_SECONDS': str(args.digest_window),
+    })
+    if args.slack_web_api:
+        os.environ.update({'SLACK_BOT_TOKEN': 'benchmark', 'SLACK_CHANNEL': 'C0BENCHMARK',
+                           'SLACK_API_URL': f"{services['slack'].url}/api"})
+    sys.path.insert(0, os.path.abspath(APP_DIR))
+
+def reset_state(services, dynamodb, workdir):
+    """Start each run from an empty Dropbox folder, empty tables and no cached results"""
+    import lambda_function
+    import job_state
+    import content_index
+    services['dropbox'].reset()
+    services['slack'].reset()
+    dynamodb.reset()
+    for name in os.listdir(workdir):
+        path = os.path.join(workdir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+    lambda_function._dropbox_api = None
+    job_state._job_store = None
+    content_index._content_index = None
+    for service in services.values():
+        service.requests = {}
+
+def record_first_notifications(slack, timer, started):
+    """Time from the start of the invocation to the first Slack delivery for each file"""
+    first = {}
+    for delivered, text in slack.deliveries:
+        text = text.split(' (part ')[0]
+        if delivered >= started and text not in first:
+            first[text] = delivered
+    for delivered in first.values():
+        timer.record('first_slack', delivered - started)
+
+def run_mode(mode, services, dynamodb, timer, args, workdir):
+    import lambda_function
+    reset_state(services, dynamodb, workdir)
+    timer.reset()
+    lambda_function.PIPELINE_MODE = mode
+
+    event = {'body': json.dumps({'list_folder': {'accounts': ['dbid:benchmark']},
+                                 'delta': {'users': [1]}})}
+    files_per_batch = max(1, args.files // args.batches)
+    invocations = []
+    statuses = {}
+    log = open(os.devnull, 'w') if not args.verbose else None
+    with RssSampler() as rss:
+        for batch in range(args.batches):
+            services['dropbox'].add_files(files_per_batch, namespace=f"{mode}{batch}")
+            started = time.perf_counter()
+            with (contextlib.redirect_stdout(log) if log else contextlib.nullcontext()):
+                response = lambda_function.lambda_handler(event, FakeContext(args.lambda_timeout))
+            invocations.append(time.perf_counter() - started)
+            record_first_notifications(services['slack'], timer, started)
+            for result in json.loads(response.get('body', '{}')).get('results', []):
+                statuses[result['status']] = statuses.get(result['status'], 0) + 1
+    if log:
+        log.close()
+
+    total_seconds = sum(invocations)
+    processed = statuses.get('processed', 0)
+    stages = {stage: {'count': len(samples),
+                      'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+                      'p99_ms': round(percentile(samples, 0.99) * 1000, 2)}
+              for stage, samples in sorted(timer.samples.items())}
+    stages['invocation'] = {'count': len(invocations),
+                            'p50_ms': round(percentile(invocations, 0.50) * 1000, 2),
+                            'p99_ms': round(percentile(invocations, 0.99) * 1000, 2)}
+    return {
+        'mode': mode,
+        'files': files_per_batch * args.batches,
+        'statuses': statuses,
+        'total_seconds': round(total_seconds, 3),
+        'files_per_minute': round(processed / total_seconds * 60, 2) if total_seconds else 0.0,
+        'peak_rss_mb': round(rss.peak / (1024 * 1024), 1),
+        'openai_prompt_tokens': services['openai'].requests.get('prompt_tokens', 0),
+        'stages': stages,
+        'upstream_requests': {name: dict(service.requests) for name, service in services.items()},
+    }
+
+def flatten(report):
+    """{'sync.files_per_minute': ..., 'sync.transcribe.p99_ms': ...} for run-to-run comparison"""
+    metrics = {}
+    for mode, result in report['modes'].items():
+        metrics[f"{mode}.files_per_minute"] = result['files_per_minute']
+        metrics[f"{mode}.peak_rss_mb"] = result['peak_rss_mb']
+        metrics[f"{mode}.openai_prompt_tokens"] = result.get('openai_prompt_tokens', 0)
+        for stage, values in result['stages'].items():
+            metrics[f"{mode}.{stage}.p50_ms"] = values['p50_ms']
+            metrics[f"{mode}.{stage}.p99_ms"] = values['p99_ms']
+    return metrics
+
+def compare(report, baseline, tolerance):
+    """Print metric deltas against a baseline report; returns the list of regressed metric names"""
+    current, previous = flatten(report), flatten(baseline)
+    regressions = []
+    changed = sorted(key for key, value in report['settings'].items()
+                     if key in baseline.get('settings', {}) and baseline['settings'][key] != value)
+    if changed:
+        print(f"\nNote: baseline was run with different settings: {', '.join(changed)}")
+    print(f"\n{'metric':<36}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name in sorted(current):
+        if name not in previous or not previous[name]:
+            continue
+        change = (current[name] - previous[name]) / previous[name]
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = '  REGRESSION' if worse > tolerance else ''
+        if flag:
+            regressions.append(name)
+        print(f"{name:<36}{previous[name]:>12}{current[name]:>12}{change:>+10.1%}{flag}")
+    return regressions
+
+def print_report(report):
+    for mode, result in report['modes'].items():
+        print(f"\n== {mode} pipeline: {result['files']} files in {result['total_seconds']}s, "
+              f"{result['files_per_minute']} files/min, peak RSS {result['peak_rss_mb']} MB, "
+              f"{result['openai_prompt_tokens']} prompt tokens, {result['statuses']}")
+        print(f"{'stage':<16}{'count':>8}{'p50 ms':>12}{'p99 ms':>12}")
+        for stage, values in result['stages'].items():
+            print(f"{stage:<16}{values['count']:>8}{values['p50_ms']:>12}{values['p99_ms']:>12}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=20, help='audio files in total, spread over the batches')
+    parser.add_argument('--batches', type=int, default=2, help='webhook invocations (one batch of new files each)')
+    parser.add_argument('--mode', choices=('sync', 'async', 'both'), default='both')
+    parser.add_argument('--transfer-mode', choices=('url', 'buffer'), default='url')
+    parser.add_argument('--concurrency', type=int, default=4, help='MAX_CONCURRENT_FILES')
+    parser.add_argument('--workspace-bytes', type=int, default=0,
+                        help='WORKSPACE_CAPACITY_BYTES, disk the downloads may reserve (0 = free space)')
+    parser.add_argument('--page-size', type=int, default=100, help='list_folder entries per page')
+    parser.add_argument('--audio-bytes', type=int, default=1024 * 1024, help='size of each fake recording')
+    parser.add_argument('--audio-ext', default='.mp3', help='extension of the fake recordings (.wav for real WAV)')
+    parser.add_argument('--utterances', type=int, default=200, help='utterances per fake transcript')
+    parser.add_argument('--transcript-encoding', choices=('full', 'compact'), default='full',
+                        help='TRANSCRIPT_ENCODING for the analysis prompt')
+    parser.add_argument('--analysis-mode', choices=('combined', 'progressive'), default='combined',
+                        help='ANALYSIS_MODE: one request for all sections, or one per section with early Slack posts')
+    parser.add_argument('--slack-web-api', action='store_true',
+                        help='post through chat.postMessage/chat.update (editable) instead of the webhook')
+    parser.add_argument('--slack-delivery', choices=('direct', 'digest'), default='direct',
+                        help='SLACK_DELIVERY: one post per file, or digests from the background queue')
+    parser.add_argument('--digest-window', type=float, default=2.0, help='SLACK_DIGEST_WINDOW_SECONDS')
+    parser.add_argument('--openai-ms-per-token', type=float, default=0.0,
+                        help='fake generation time per output token, so long sections answer later')
+    parser.add_argument('--summary-chars', type=int, default=1500, help='length of the fake meeting summary')
+    parser.add_argument('--latency', default='dropbox=30,deepgram=400,openai=600,slack=50',
+                        help="added latency in ms: '300' or 'deepgram=800,openai=1200'")
+    parser.add_argument('--jitter', default='', help='random extra latency in ms, same syntax as --latency')
+    parser.add_argument('--error-rate', default='', help='share of requests failed with 503, e.g. openai=0.05')
+    parser.add_argument('--lambda-timeout', type=float, default=900, help='seconds reported by the fake context')
+    parser.add_argument('--output', help='write the report as JSON')
+    parser.add_argument('--baseline', help='compare against an earlier --output file')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='allowed relative regression (0.10 = 10%%)')
+    parser.add_argument('--verbose', action='store_true', help="keep the Lambda's own log output")
+    args = parser.parse_args(argv)
+
+    services = start_services(args)
+    workdir = tempfile.mkdtemp(prefix='transcriptor-bench-')
+    try:
+        configure_environment(services, args, workdir)
+        import dynamodb_tables
+        dynamodb = FakeDynamoDB()
+        dynamodb_tables._dynamodb = dynamodb
+        timer = StageTimer()
+        timer.install()
+
+        modes = ('sync', 'async') if args.mode == 'both' else (args.mode,)
+        report = {
+            'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+            'modes': {mode: run_mode(mode, services, dynamodb, timer, args, workdir) for mode in modes},
+        }
+        print_report(report)
+
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\nReport written to {args.output}")
+        if args.baseline:
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                regressions = compare(report, json.load(f), args.tolerance)
+            if regressions:
+                print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+                return 1
+        return 0
+    finally:
+        for service in services.values():
+            service.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    sys.exit(main())
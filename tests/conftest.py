@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The Lambda modules import each other as top-level modules, as they do in the deployment package
+sys.path.insert(0, os.path.join(ROOT, 'automatedTranscriptor'))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+# slack_notifier refuses to import without somewhere to post
+os.environ.setdefault('SLACK_WEBHOOK_URL', 'https://hooks.slack.test/hook')
+
+class _TokenManager:
+    def get_access_token(self):
+        return 'token'
+
+@pytest.fixture
+def dynamodb(monkeypatch):
+    """FakeDynamoDB behind dynamodb_tables, with drain leases on and no Dropbox credentials needed"""
+    import dynamodb_tables
+    import dropbox_update
+    from fake_services import FakeDynamoDB
+    dynamodb = FakeDynamoDB()
+    monkeypatch.setattr(dynamodb_tables, '_dynamodb', dynamodb)
+    monkeypatch.setattr(dynamodb_tables, '_tables', {})
+    monkeypatch.setattr(dropbox_update, 'DropboxTokenManager', _TokenManager)
+    monkeypatch.setattr(dropbox_update, 'CURSOR_LEASES', True)
+    return dynamodb
@@ -0,0 +1,93 @@
+import dropbox_update
+
+FOLDER = '/automated_transcriptor'
+
+def _item(dynamodb):
+    return dynamodb.Table('DropboxCursors').get_item(Key={'folder_path': FOLDER}).get('Item', {})
+
+def test_contended_folder_is_coalesced_into_the_holder(dynamodb):
+    holder = dropbox_update.DropboxUpdateNotificationAPI()
+    other = dropbox_update.DropboxUpdateNotificationAPI()
+
+    assert holder.acquire_leases('holder') == [FOLDER]
+    assert other.acquire_leases('other') == []
+    assert _item(dynamodb)['drain_pending'] is True
+
+    # The flagged folder stays leased for another pass, then is released
+    assert holder.release_leases() == [FOLDER]
+    assert _item(dynamodb)['drain_owner'] == 'holder'
+    assert holder.release_leases() == []
+    assert 'drain_owner' not in _item(dynamodb)
+
+    assert other.acquire_leases('other') == [FOLDER]
+
+def test_save_cursor_advances_the_version(dynamodb):
+    api = dropbox_update.DropboxUpdateNotificationAPI()
+    api.acquire_leases('owner')
+
+    api.save_cursor(FOLDER, 'cursor-1')
+    api.save_cursor(FOLDER, 'cursor-2')
+
+    assert _item(dynamodb)['cursor'] == 'cursor-2'
+    assert _item(dynamodb)['cursor_version'] == 2
+    assert api.drain_folders() == [FOLDER]
+
+def test_stale_cursor_is_rejected(dynamodb):
+    api = dropbox_update.DropboxUpdateNotificationAPI()
+    api.acquire_leases('owner')
+    api.save_cursor(FOLDER, 'cursor-1')
+    # Someone else advanced the cursor since this invocation read it
+    dynamodb.Table('DropboxCursors').update_item(
+        Key={'folder_path': FOLDER}, UpdateExpression='SET #cursor = :cursor, cursor_version = :version',
+        ExpressionAttributeNames={'#cursor': 'cursor'}, ExpressionAttributeValues={':cursor': 'newer', ':version': 5})
+
+    api.save_cursor(FOLDER, 'cursor-2')
+
+    assert _item(dynamodb)['cursor'] == 'newer'
+    assert api.drain_folders() == []
+    # Once lost, later saves are skipped without touching the table
+    api.save_cursor(FOLDER, 'cursor-3')
+    assert _item(dynamodb)['cursor'] == 'newer'
+
+def test_expired_lease_is_taken_over(dynamodb):
+    stalled = dropbox_update.DropboxUpdateNotificationAPI()
+    stalled.acquire_leases('stalled', seconds=-5)
+    other = dropbox_update.DropboxUpdateNotificationAPI()
+
+    assert other.acquire_leases('other') == [FOLDER]
+    stalled.save_cursor(FOLDER, 'stalled-cursor')
+    other.save_cursor(FOLDER, 'other-cursor')
+
+    assert _item(dynamodb)['cursor'] == 'other-cursor'
+    assert _item(dynamodb)['drain_owner'] == 'other'
+    assert stalled.release_leases() == []
+    assert _item(dynamodb)['drain_owner'] == 'other'
+
+def _lose_lease(dynamodb, api, folder=FOLDER):
+    dynamodb.Table('DropboxCursors').update_item(
+        Key={'folder_path': folder}, UpdateExpression='SET cursor_version = :version',
+        ExpressionAttributeValues={':version': 5})
+    api.save_cursor(folder, 'stale')
+
+def test_deferred_entries_of_a_lost_folder_are_dropped(dynamodb):
+    api = dropbox_update.DropboxUpdateNotificationAPI()
+    api.acquire_leases('owner')
+    _lose_lease(dynamodb, api)
+    entry = {'path_display': FOLDER + '/a.mp3'}
+
+    assert not api.drains(entry)
+    api.save_deferred([entry])
+
+    assert 'deferred' not in _item(dynamodb)
+
+def test_lost_folder_entries_stay_out_of_other_folders(dynamodb):
+    other_folder = '/other'
+    api = dropbox_update.DropboxUpdateNotificationAPI()
+    api.folders = [FOLDER, other_folder]
+    api.acquire_leases('owner')
+    _lose_lease(dynamodb, api, other_folder)
+    kept, lost = {'path_display': FOLDER + '/a.mp3'}, {'path_display': other_folder + '/b.mp3'}
+
+    api.save_deferred([kept, lost])
+
+    assert api.load_deferred() == [kept]
@@ -0,0 +1,83 @@
+import pytest
+import dropbox_update
+import pipeline
+from pipeline import AudioBatch, plan_batch, settle_batch
+
+FOLDER = '/automated_transcriptor'
+
+@pytest.fixture
+def pdb(dynamodb, monkeypatch):
+    monkeypatch.setattr(pipeline, 'MAX_FILE_ATTEMPTS', 3)
+    api = dropbox_update.DropboxUpdateNotificationAPI()
+    api.acquire_leases('owner')
+    return api
+
+def _entry(name, minutes=10, **fields):
+    return dict({'path_display': f"{FOLDER}/{name}", 'size': 16000 * 60 * minutes}, **fields)
+
+def _invocation(pdb, listed, failing=(), budget_seconds=None):
+    """One plan -> process -> settle round in which the files named in ``failing`` fail"""
+    admitted, deferred = plan_batch(pdb, AudioBatch(), listed, budget_seconds)
+    results = [{'file': entry['path_display'],
+                'status': 'failed' if entry['path_display'].rsplit('/', 1)[1] in failing else 'processed'}
+               for entry in admitted]
+    settle_batch(pdb, admitted, results, deferred)
+    return admitted, deferred
+
+def _carried(pdb):
+    return [(entry['path_display'].rsplit('/', 1)[1], entry.get('attempts', 0)) for entry in pdb.load_deferred()]
+
+def test_admitted_files_stay_carried_over_until_settled(pdb):
+    admitted, _ = plan_batch(pdb, AudioBatch(), [_entry('a.mp3'), _entry('notes.txt')])
+
+    assert [entry['attempts'] for entry in admitted] == [1]
+    # An invocation that dies here leaves the file for the next one
+    assert _carried(pdb) == [('a.mp3', 1)]
+
+def test_failed_files_are_carried_over_to_the_next_invocation(pdb):
+    _invocation(pdb, [_entry('a.mp3'), _entry('b.mp3')], failing={'b.mp3'})
+    assert _carried(pdb) == [('b.mp3', 1)]
+
+    admitted, _ = _invocation(pdb, [])
+    assert [(entry['path_display'], entry['attempts']) for entry in admitted] == [(f"{FOLDER}/b.mp3", 2)]
+    assert _carried(pdb) == []
+
+def test_a_file_is_given_up_after_max_attempts(pdb):
+    _invocation(pdb, [_entry('a.mp3')], failing={'a.mp3'})
+    _invocation(pdb, [], failing={'a.mp3'})
+    assert _carried(pdb) == [('a.mp3', 2)]
+
+    admitted, _ = _invocation(pdb, [], failing={'a.mp3'})
+
+    assert admitted[0]['attempts'] == 3
+    assert _carried(pdb) == []
+
+def test_new_listing_wins_over_the_carried_over_entry(pdb):
+    _invocation(pdb, [_entry('a.mp3', content_hash='old')], failing={'a.mp3'})
+    _invocation(pdb, [], failing={'a.mp3'})
+
+    # A new revision of the file starts again with a fresh attempt count
+    admitted, _ = _invocation(pdb, [_entry('a.mp3', content_hash='new')], failing={'a.mp3'})
+
+    assert [(entry['content_hash'], entry['attempts']) for entry in admitted] == [('new', 1)]
+    assert _carried(pdb) == [('a.mp3', 1)]
+
+def test_deferred_files_are_carried_over_without_using_an_attempt(pdb):
+    listed = [_entry('short.mp3', minutes=10), _entry('long.mp3', minutes=120)]
+
+    admitted, deferred = _invocation(pdb, listed, budget_seconds=60)
+
+    assert [entry['path_display'] for entry in admitted] == [f"{FOLDER}/short.mp3"]
+    assert _carried(pdb) == [('long.mp3', 0)]
+    admitted, _ = _invocation(pdb, [])
+    assert [(entry['path_display'], entry['attempts']) for entry in admitted] == [(f"{FOLDER}/long.mp3", 1)]
+
+def test_files_of_a_lost_folder_are_not_processed(pdb, dynamodb):
+    dynamodb.Table('DropboxCursors').update_item(
+        Key={'folder_path': FOLDER}, UpdateExpression='SET cursor_version = :version',
+        ExpressionAttributeValues={':version': 5})
+    pdb.save_cursor(FOLDER, 'stale')
+
+    admitted, deferred = _invocation(pdb, [_entry('a.mp3')])
+
+    assert admitted == [] and deferred == []
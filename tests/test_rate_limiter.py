@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import httpx
+import pytest
+import rate_limiter
+from rate_limiter import TokenBucket, AdaptiveConcurrency, UpstreamLimiter, classify_error, _retry_after
+
+class _Clock:
+    """Stands in for the time module: sleeping advances the clock instead of blocking"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter, 'time', clock)
+    monkeypatch.setattr(rate_limiter, 'RETRY_BASE_DELAY', 0)
+    return clock
+
+def _status_error(status, retry_after=None):
+    headers = {'Retry-After': retry_after} if retry_after is not None else {}
+    request = httpx.Request('POST', 'https://upstream.test/')
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError(f"HTTP {status}", request=request, response=response)
+
+def test_token_bucket_waits_for_the_refill(clock):
+    bucket = TokenBucket(60)
+
+    assert bucket.try_acquire(60) == 0
+    assert bucket.try_acquire() == pytest.approx(1.0)
+    clock.now += 0.5
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert clock.slept == [pytest.approx(0.5)]
+
+def test_token_bucket_caps_requests_at_its_capacity(clock):
+    bucket = TokenBucket(10)
+    clock.now += 3600
+
+    assert bucket.try_acquire(50) == 0
+    assert bucket.try_acquire() > 0
+
+def test_concurrency_halves_on_throttling_and_grows_back_additively():
+    concurrency = AdaptiveConcurrency(8)
+    for _ in range(8):
+        assert concurrency.try_acquire()
+    assert not concurrency.try_acquire()
+
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 4
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 2
+
+    # Each success adds 1/limit, so about one slot per window of ``limit`` successes
+    concurrency.release()
+    concurrency.release()
+    assert int(concurrency.limit) == 2
+    concurrency.release()
+    assert int(concurrency.limit) == 3
+    assert concurrency.in_flight == 3
+
+def test_concurrency_never_drops_below_one_slot():
+    concurrency = AdaptiveConcurrency(2)
+    for _ in range(2):
+        concurrency.try_acquire()
+        concurrency.release(throttled=True)
+
+    assert concurrency.limit == 1
+    assert concurrency.try_acquire()
+    assert not concurrency.try_acquire()
+
+def test_classify_error_by_status():
+    assert classify_error(_status_error(429, '7')) == (True, True, 7.0)
+    assert classify_error(_status_error(503)) == (True, True, None)
+    assert classify_error(_status_error(500)) == (True, False, None)
+    assert classify_error(_status_error(400)) == (False, False, None)
+
+def test_classify_error_by_exception_type():
+    assert classify_error(httpx.ConnectTimeout('timed out')) == (True, False, None)
+    assert classify_error(ValueError('bad input')) == (False, False, None)
+
+def test_retry_after_accepts_seconds_and_http_dates():
+    assert _retry_after(_status_error(429, '2.5')) == 2.5
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert _retry_after(_status_error(429, in_a_minute)) == pytest.approx(60, abs=2)
+    past = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=60), usegmt=True)
+    assert _retry_after(_status_error(429, past)) == 0
+    assert _retry_after(_status_error(429, 'soon')) is None
+    assert _retry_after(ValueError()) is None
+
+def _limiter(max_attempts=3):
+    return UpstreamLimiter('test', rpm=6000, concurrency=2, max_attempts=max_attempts)
+
+def test_call_retries_until_it_succeeds(clock):
+    limiter = _limiter()
+    outcomes = [_status_error(502), _status_error(429, '4'), 'ok']
+
+    def request():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert limiter.call(request) == 'ok'
+    assert limiter.counters['retries'] == 2
+    assert limiter.counters['throttled'] == 1
+    # The throttled attempt waits at least as long as Retry-After
+    assert clock.slept[-1] >= 4
+    assert limiter.concurrency.in_flight == 0
+
+def test_call_stops_at_max_attempts(clock):
+    limiter = _limiter(max_attempts=3)
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise _status_error(500)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        limiter.call(request)
+    assert len(calls) == 3
+    assert limiter.counters['failures'] == 1
+    assert limiter.concurrency.in_flight == 0
+
+def test_call_does_not_retry_client_errors(clock):
+    limiter = _limiter()
+    calls = []
+
+    def request():
+        calls.append(1)
+        raise _status_error(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        limiter.call(request)
+    assert len(calls) == 1
+    assert limiter.concurrency.in_flight == 0
+
+class _Stream:
+    def __init__(self, status):
+        self.status = status
+        self.closed = False
+
+    @contextmanager
+    def open(self):
+        try:
+            yield self
+        finally:
+            self.closed = True
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise _status_error(self.status)
+
+def test_stream_retries_and_holds_the_slot_until_the_body_is_read(clock):
+    limiter = _limiter()
+    streams = [_Stream(503), _Stream(200)]
+    opened = []
+
+    def open_stream():
+        opened.append(streams.pop(0))
+        return opened[-1].open()
+
+    with limiter.stream(open_stream) as response:
+        assert response is opened[-1]
+        assert limiter.concurrency.in_flight == 1
+    assert len(opened) == 2
+    assert all(stream.closed for stream in opened)
+    assert limiter.concurrency.in_flight == 0
+
+def test_stream_stops_at_max_attempts(clock):
+    limiter = _limiter(max_attempts=2)
+    opened = []
+
+    def open_stream():
+        opened.append(_Stream(500))
+        return opened[-1].open()
+
+    with pytest.raises(httpx.HTTPStatusError):
+        with limiter.stream(open_stream):
+            pass
+    assert len(opened) == 2
+    assert all(stream.closed for stream in opened)
+    assert limiter.concurrency.in_flight == 0
+
+def test_stream_releases_the_slot_when_the_body_fails(clock):
+    limiter = _limiter()
+    stream = _Stream(200)
+
+    with pytest.raises(RuntimeError):
+        with limiter.stream(stream.open):
+            raise RuntimeError('connection dropped mid-body')
+    assert stream.closed
+    assert limiter.concurrency.in_flight == 0
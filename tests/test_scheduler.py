@@ -0,0 +1,56 @@
+import pytest
+import scheduler
+from scheduler import schedule, estimate_cost
+
+def _entry(name, minutes):
+    return {'path_display': f"/automated_transcriptor/{name}.mp3",
+            'media_info': {'metadata': {'duration': minutes * 60 * 1000}}}
+
+def _names(entries):
+    return [entry['path_display'].rsplit('/', 1)[1] for entry in entries]
+
+@pytest.fixture
+def costs(monkeypatch):
+    # 20s per file plus 0.05s per second of audio: 10 minutes cost 50s, 30 minutes 110s, 60 minutes 200s
+    monkeypatch.setattr(scheduler, 'SCHEDULING', 'sjf')
+    monkeypatch.setattr(scheduler, 'JOB_OVERHEAD_SECONDS', 20)
+    monkeypatch.setattr(scheduler, 'PROCESSING_SECONDS_PER_AUDIO_SECOND', 0.05)
+    return [_entry('long', 60), _entry('short', 10), _entry('medium', 30)]
+
+def test_cost_is_estimated_from_the_duration_or_size(costs):
+    assert estimate_cost(costs[1]) == 50
+    # 16000 bytes per second of mp3, and an hour when nothing is known
+    assert estimate_cost({'path_display': '/a.mp3', 'size': 16000 * 600}) == 50
+    assert estimate_cost({'path_display': '/a.mp3'}) == 200
+
+def test_without_a_budget_everything_is_admitted_shortest_first(costs):
+    admitted, deferred = schedule(costs)
+
+    assert _names(admitted) == ['short.mp3', 'medium.mp3', 'long.mp3']
+    assert deferred == []
+
+def test_jobs_that_would_not_finish_in_time_are_deferred(costs):
+    admitted, deferred = schedule(costs, budget_seconds=170, slots=1)
+
+    assert _names(admitted) == ['short.mp3', 'medium.mp3']
+    assert _names(deferred) == ['long.mp3']
+
+def test_admission_simulates_concurrent_slots(costs):
+    # The short and medium files run side by side; the long one would start at 50s and end at 250s
+    admitted, deferred = schedule(costs, budget_seconds=120, slots=2)
+    assert _names(admitted) == ['short.mp3', 'medium.mp3']
+    assert _names(deferred) == ['long.mp3']
+
+    admitted, deferred = schedule(costs, budget_seconds=250, slots=2)
+    assert _names(admitted) == ['short.mp3', 'medium.mp3', 'long.mp3']
+
+def test_the_shortest_job_is_always_admitted(costs):
+    admitted, deferred = schedule(costs, budget_seconds=10, slots=4)
+
+    assert _names(admitted) == ['short.mp3']
+    assert _names(deferred) == ['medium.mp3', 'long.mp3']
+
+def test_fifo_scheduling_admits_everything_in_listing_order(costs, monkeypatch):
+    monkeypatch.setattr(scheduler, 'SCHEDULING', 'fifo')
+
+    assert schedule(costs, budget_seconds=10) == (costs, [])
@@ -0,0 +1,85 @@
+import json
+import pytest
+import slack_notifier
+from slack_notifier import SECTION_TITLES, summary_attachments
+from slack_digest import SlackDigestQueue
+
+class _Slack:
+    """Stands in for post_with_retry; the ``fail_at``-th post (1-based) raises"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.posted = []
+
+    def __call__(self, upstream, url, content=None, headers=None):
+        if len(self.posted) + 1 == self.fail_at:
+            self.fail_at = None
+            raise RuntimeError('Slack is down')
+        self.posted.append(json.loads(content))
+
+@pytest.fixture
+def slack(monkeypatch):
+    # Each summary below fills exactly one message
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_MESSAGE_CHARS', 400)
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_FIELD_CHARS', 3000)
+    fake = _Slack()
+    monkeypatch.setattr(slack_notifier, 'post_with_retry', fake)
+    return fake
+
+def _summary(name):
+    return {title: f"{name} " + "x" * 40 for title in SECTION_TITLES}
+
+class _Meeting:
+    def __init__(self, queue, name, sent_attachments=0):
+        self.name = name
+        self.outcome = None
+        queue.submit(_summary(name), name, on_sent=self.sent, on_failed=self.failed,
+                     sent_attachments=sent_attachments)
+
+    def sent(self):
+        self.outcome = 'sent'
+
+    def failed(self, sent_attachments):
+        self.outcome = ('failed', sent_attachments)
+
+def _titles(slack):
+    return [a["title"] for message in slack.posted for a in message["attachments"]]
+
+def test_failed_digest_reports_only_undelivered_meetings(slack):
+    assert len(summary_attachments(_summary('a.mp3'))) == 1
+    queue = SlackDigestQueue(window=60, max_meetings=10)
+    slack.fail_at = 2
+    meetings = [_Meeting(queue, name) for name in ('a.mp3', 'b.mp3', 'c.mp3')]
+
+    assert queue.flush(timeout=5)
+
+    assert _titles(slack) == ['a.mp3']
+    assert [m.outcome for m in meetings] == ['sent', ('failed', 0), ('failed', 0)]
+
+def test_retried_meetings_are_posted_once(slack):
+    queue = SlackDigestQueue(window=60, max_meetings=10)
+    slack.fail_at = 2
+    [_Meeting(queue, name) for name in ('a.mp3', 'b.mp3', 'c.mp3')]
+    queue.flush(timeout=5)
+
+    retried = [_Meeting(queue, name) for name in ('b.mp3', 'c.mp3')]
+    assert queue.flush(timeout=5)
+
+    assert _titles(slack) == ['a.mp3', 'b.mp3', 'c.mp3']
+    assert [m.outcome for m in retried] == ['sent', 'sent']
+
+def test_meeting_split_across_messages_resumes_after_its_delivered_part(slack, monkeypatch):
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_MESSAGE_CHARS', 150)
+    total = len(summary_attachments(_summary('a.mp3')))
+    assert total > 2
+    queue = SlackDigestQueue(window=60, max_meetings=10)
+    slack.fail_at = 2
+    meeting = _Meeting(queue, 'a.mp3')
+    queue.flush(timeout=5)
+    assert meeting.outcome == ('failed', 1)
+
+    retried = _Meeting(queue, 'a.mp3', sent_attachments=1)
+    queue.flush(timeout=5)
+
+    assert retried.outcome == 'sent'
+    assert sum(len(message["attachments"]) for message in slack.posted) == total
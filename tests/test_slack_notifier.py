@@ -0,0 +1,79 @@
+import json
+import pytest
+import slack_notifier
+from slack_notifier import split_text, pack_messages, SECTION_TITLES
+
+class _Slack:
+    """Stands in for post_with_retry; the ``fail_at``-th post (1-based) raises"""
+
+    def __init__(self, fail_at=None):
+        self.fail_at = fail_at
+        self.posted = []
+
+    def __call__(self, upstream, url, content=None, headers=None):
+        if len(self.posted) + 1 == self.fail_at:
+            self.fail_at = None
+            raise RuntimeError('Slack is down')
+        self.posted.append(json.loads(content))
+
+@pytest.fixture
+def slack(monkeypatch):
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_MESSAGE_CHARS', 100)
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_FIELD_CHARS', 60)
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_ATTACHMENTS', 20)
+    fake = _Slack()
+    monkeypatch.setattr(slack_notifier, 'post_with_retry', fake)
+    return fake
+
+def _long_summary():
+    return {title: f"{title}: " + "word " * 20 for title in SECTION_TITLES}
+
+def test_split_text_prefers_line_then_word_boundaries():
+    assert split_text("one two\nthree four", 12) == ["one two", "three four"]
+    assert split_text("one two three four", 9) == ["one two", "three", "four"]
+    assert split_text("abcdefghij", 4) == ["abcd", "efgh", "ij"]
+
+def test_split_text_keeps_short_and_empty_values_whole():
+    assert split_text("short", 10) == ["short"]
+    assert split_text("", 10) == [""]
+
+def _attachment(size):
+    return {"fields": [{"title": "", "value": "x" * size}]}
+
+def test_pack_messages_fits_a_single_message():
+    attachments = [_attachment(10), _attachment(10)]
+
+    assert pack_messages("Summary", attachments) == [{"text": "Summary", "attachments": attachments}]
+
+def test_pack_messages_splits_on_size_and_numbers_the_parts(slack):
+    attachments = [_attachment(60), _attachment(60), _attachment(30)]
+
+    messages = pack_messages("Summary", attachments)
+
+    assert [m["text"] for m in messages] == ["Summary (part 1 of 2)", "Summary (part 2 of 2)"]
+    assert [m["attachments"] for m in messages] == [attachments[:1], attachments[1:]]
+
+def test_pack_messages_respects_the_attachment_limit(monkeypatch):
+    monkeypatch.setattr(slack_notifier, 'SLACK_MAX_ATTACHMENTS', 2)
+
+    messages = pack_messages("Summary", [_attachment(1)] * 5)
+
+    assert [len(m["attachments"]) for m in messages] == [2, 2, 1]
+
+def test_failed_part_is_resumed_without_reposting_earlier_parts(slack):
+    summary = _long_summary()
+    total = len(slack_notifier.summary_attachments(summary))
+    assert len(slack_notifier.build_slack_messages(summary, 'a.mp3')) > 2
+    progress = []
+    slack.fail_at = 3
+
+    assert not slack_notifier.send_slack_notification(summary, 'a.mp3', on_progress=progress.append)
+    assert len(slack.posted) == 2
+    sent = progress[-1]
+    assert sent == sum(len(m["attachments"]) for m in slack.posted)
+
+    assert slack_notifier.send_slack_notification(summary, 'a.mp3', sent, on_progress=progress.append)
+    retried = slack.posted[2:]
+    assert "(continued)" in retried[0]["text"]
+    assert sum(len(m["attachments"]) for m in slack.posted) == total
+    assert progress[-1] == total
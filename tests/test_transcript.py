@@ -0,0 +1,41 @@
+from transcript import Transcript, _match_speakers, stitch_segments
+
+def _transcript(*utterances):
+    transcript = Transcript()
+    for start, end, speaker, text in utterances:
+        transcript.append(start, end, speaker, text)
+    return transcript
+
+def _rows(transcript):
+    return [(u.start, u.end, u.speaker, u.text) for u in transcript]
+
+def test_swapped_speaker_labels_are_carried_across_segments():
+    first = _transcript((0, 20, 0, "a"), (20, 52, 1, "b"), (53, 59, 0, "c"))
+    # Deepgram numbered the speakers the other way round in the second segment
+    second = _transcript((0, 2, 0, "b"), (3, 9, 1, "c"), (12, 30, 0, "d"), (30, 50, 1, "e"))
+
+    stitched = stitch_segments([(0, 60, first), (50, 110, second)])
+
+    assert _rows(stitched) == [(0, 20, 0, "a"), (20, 52, 1, "b"), (53, 59, 0, "c"), (62, 80, 1, "d"),
+                               (80, 100, 0, "e")]
+
+def test_match_speakers_maps_swapped_labels():
+    previous = [(20, 52, 1, "b"), (53, 59, 0, "c")]
+    current = [(50, 52, 0, "b"), (53, 59, 1, "c"), (62, 80, 0, "d")]
+
+    assert _match_speakers(previous, current, 50, 60) == {0: 1, 1: 0}
+
+def test_zero_overlap_keeps_every_utterance():
+    first = _transcript((0, 10, 0, "a"), (10, 30, 1, "b"))
+    second = _transcript((0, 15, 0, "c"), (15, 30, 1, "d"))
+
+    stitched = stitch_segments([(0, 30, first), (30, 60, second)])
+
+    # Nobody is heard in an empty overlap, so the second segment's speakers get new labels
+    assert _rows(stitched) == [(0, 10, 0, "a"), (10, 30, 1, "b"), (30, 45, 2, "c"), (45, 60, 3, "d")]
+
+def test_match_speakers_with_empty_window():
+    previous = [(0, 10, 0, "a"), (10, 30, 1, "b")]
+    current = [(30, 45, 0, "c"), (45, 60, 1, "d")]
+
+    assert _match_speakers(previous, current, 30, 30) == {}